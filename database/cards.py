@@ -0,0 +1,74 @@
+"""Изменение карточек ТО без блокировок: сравнение версии и запись одним UPDATE.
+
+Здесь же закрепление карточек очереди согласования за администраторами
+(режим "следующая карточка").
+"""
+from datetime import datetime
+from sqlalchemy import text, update
+from database.models import TOCard, CardStatus
+
+def update_card_if_unchanged(db, card_id: int, expected_version: int = None,
+                             statuses=(CardStatus.PENDING,), **values) -> bool:
+    """Изменение карточки, только если ее никто не изменил с момента показа пользователю.
+
+    expected_version - версия, которую видел пользователь (None для старых кнопок
+    без версии: тогда проверяется только статус). statuses - допустимые текущие
+    статусы. Возвращает False при конфликте; коммит делает вызывающий код.
+    """
+    conditions = [TOCard.id == card_id]
+    if expected_version is not None:
+        conditions.append(TOCard.version == expected_version)
+    if statuses:
+        conditions.append(TOCard.status.in_(statuses))
+
+    result = db.execute(
+        update(TOCard)
+        .where(*conditions)
+        .values(version=TOCard.version + 1, updated_at=datetime.utcnow(), **values)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+# Освобождение карточки, которую администратор закрепил за собой и не рассмотрел
+RELEASE_CLAIM = text("""
+    UPDATE to_cards SET claimed_by = NULL, claimed_until = NULL
+    WHERE id = :card_id AND claimed_by = :admin_id
+""")
+
+# Самая старая карточка очереди, не закрепленная за другим администратором
+# (или с истекшим закреплением). Текущее время (:now) передается из приложения:
+# по тем же часам список согласования показывает, до какого времени действует
+# закрепление. Подзапрос идет по ix_to_cards_pending_created; SKIP LOCKED
+# пропускает карточку, которую в эту же секунду закрепляет другой администратор,
+# поэтому одновременные запросы получают разные карточки без ожидания.
+# Закрепление не меняет версию: текст карточки и кнопки списка остаются актуальными.
+CLAIM_NEXT_CARD = text("""
+    UPDATE to_cards SET claimed_by = :admin_id,
+        claimed_until = :now + make_interval(mins => :minutes)
+    WHERE id = (
+        SELECT id FROM to_cards
+        WHERE status = 'pending'
+          AND (claimed_until IS NULL OR claimed_until < :now OR claimed_by = :admin_id)
+          AND id <> :skip_id
+        ORDER BY created_at
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id
+""")
+
+def claim_next_card(db, admin_id: int, minutes: int, held_card_id: int = None, skip: bool = False, now: datetime = None):
+    """Закрепление следующей карточки очереди за администратором.
+
+    held_card_id - карточка, закрепленная за ним ранее: она освобождается и, если
+    ее не пропускают (skip=False) и она еще ждет решения, выдается снова.
+    now - текущее время по часам бота (по умолчанию datetime.now()).
+    Возвращает id карточки или None, если очередь пуста; коммит делает вызывающий код.
+    """
+    if held_card_id is not None:
+        db.execute(RELEASE_CLAIM, {"card_id": held_card_id, "admin_id": admin_id})
+    skip_id = held_card_id if skip and held_card_id is not None else 0
+    return db.execute(
+        CLAIM_NEXT_CARD,
+        {"admin_id": admin_id, "minutes": minutes, "skip_id": skip_id, "now": now or datetime.now()}
+    ).scalar()
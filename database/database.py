@@ -1,12 +1,39 @@
+import time
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.sql.dml import UpdateBase
 from config import settings
 from utils.logger import logger
 
-DATABASE_URL = f"postgresql://{settings.DB_USER}:{settings.DB_PASSWORD}@{settings.DB_HOST}:{settings.DB_PORT}/{settings.DB_NAME}?client_encoding=utf8"
+def database_url(db_name: str = None):
+    """URL подключения к базе на основном сервере (по умолчанию - к базе бота)"""
+    return f"postgresql://{settings.DB_USER}:{settings.DB_PASSWORD}@{settings.DB_HOST}:{settings.DB_PORT}/{db_name or settings.DB_NAME}?client_encoding=utf8"
+
+DATABASE_URL = database_url()
 
 engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Реплика для экранов только на чтение (если не задана - всё идет в основную БД)
+replica_engine = create_engine(settings.DB_REPLICA_URL) if settings.DB_REPLICA_URL else None
+
+# Пользователи, чьи чтения временно закреплены за основной БД после записи
+_primary_pinned_until = {}
+
+class RoutingSession(Session):
+    """Сессия, отправляющая чтение на реплику, а запись - в основную БД"""
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if (
+            replica_engine is None
+            or not self.info.get("read_only")
+            or self._flushing
+            or isinstance(clause, UpdateBase)
+        ):
+            return engine
+        return replica_engine
+
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False)
+ReadSessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False, info={"read_only": True})
 
 def get_db():
     db = SessionLocal()
@@ -16,4 +43,32 @@ def get_db():
         logger.error(f"Database error: {e}")
         raise
     finally:
-        db.close() 
\ No newline at end of file
+        db.close()
+
+def pin_to_primary(user_id: int):
+    """Закрепление чтений пользователя за основной БД после записи (read-after-write)"""
+    if replica_engine is None:
+        return
+    now = time.monotonic()
+    _primary_pinned_until[user_id] = now + settings.DB_REPLICA_STICKY_SECONDS
+
+    # Периодически очищаем истекшие записи
+    if len(_primary_pinned_until) > 1000:
+        for key in [k for k, until in _primary_pinned_until.items() if until <= now]:
+            del _primary_pinned_until[key]
+
+def get_read_db(user_id: int = None):
+    """Сессия для экранов только на чтение: реплика, если пользователь недавно ничего не записывал"""
+    pinned_until = _primary_pinned_until.get(user_id) if user_id is not None else None
+    if replica_engine is None or (pinned_until and pinned_until > time.monotonic()):
+        yield from get_db()
+        return
+
+    db = ReadSessionLocal()
+    try:
+        yield db
+    except Exception as e:
+        logger.error(f"Database error (replica): {e}")
+        raise
+    finally:
+        db.close()
@@ -0,0 +1,52 @@
+import time
+from sqlalchemy import bindparam, text
+from config import settings
+from database.database import engine
+from database.models import TOCard, CLOSED_CARD_STATUSES
+from utils.logger import logger
+
+def _card_columns():
+    """Колонки карточки ТО, общие для оперативной и архивной таблиц"""
+    return ", ".join(column.name for column in TOCard.__table__.columns)
+
+def archive_closed_cards(months: int = None, batch_size: int = None):
+    """Перенос закрытых карточек ТО старше months месяцев в to_cards_archive.
+
+    Каждая пачка переносится одним оператором (DELETE ... RETURNING + INSERT)
+    в отдельной транзакции, поэтому блокировки держатся недолго, а прерванный
+    перенос можно просто запустить заново.
+    """
+    months = settings.ARCHIVE_AFTER_MONTHS if months is None else months
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    columns = _card_columns()
+
+    statement = text(f"""
+        WITH moved AS (
+            DELETE FROM to_cards
+            WHERE id IN (
+                SELECT id FROM to_cards
+                WHERE status IN :statuses
+                  AND appointment_time < localtimestamp - make_interval(months => :months)
+                ORDER BY id
+                LIMIT :batch_size
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING {columns}
+        )
+        INSERT INTO to_cards_archive ({columns}, archived_at)
+        SELECT {columns}, localtimestamp FROM moved
+    """).bindparams(bindparam("statuses", [status.value for status in CLOSED_CARD_STATUSES], expanding=True))
+
+    total = 0
+    started = time.monotonic()
+    while True:
+        with engine.begin() as connection:
+            moved = connection.execute(
+                statement, {"months": months, "batch_size": batch_size}
+            ).rowcount
+        total += moved
+        if moved < batch_size:
+            break
+
+    logger.info(f"Archived {total} closed TO cards older than {months} months in {time.monotonic() - started:.2f} s")
+    return total
@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Enum, Text, Boolean
-from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy import BigInteger, Column, Integer, String, Float, DateTime, ForeignKey, Enum, Text, Boolean, Index, LargeBinary, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.declarative import declarative_base, declared_attr
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
@@ -26,14 +27,64 @@ class Agent(Base):
     to_cards = relationship("TOCard", back_populates="agent")
     payments = relationship("Payment", back_populates="agent")
 
-class TOCard(Base):
-    __tablename__ = "to_cards"
+class Station(Base):
+    """Станция СТО (справочник, в памяти - database/stations.py)"""
+    __tablename__ = "stations"
     
     id = Column(Integer, primary_key=True)
+    code = Column(String, unique=True, nullable=False)  # код в callback_data, например station1
+    name = Column(String, nullable=False)
+    address = Column(String, nullable=False)
+    categories = Column(JSONB, nullable=False)  # ["B", "C", "E"]
+    prices = Column(JSONB, nullable=False)  # {"B": 2000}
+    working_hours = Column(JSONB, nullable=False)  # {"start": "09:00", "end": "17:00"}
+    time_slot = Column(Integer, nullable=False)  # в минутах
+    defect_prices = Column(JSONB, nullable=False)  # {"minor": 1000, "major": 2000}
+    capacity = Column(JSONB, nullable=False, default=dict)  # {"B": 3} - линий на слот, по умолчанию 1
+    active = Column(Boolean, nullable=False, default=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class CardStatus(str, enum.Enum):
+    """Статус карточки ТО (в БД - нативный enum card_status)"""
+    PENDING = "pending"
+    APPROVED = "approved"
+    REJECTED = "rejected"
+    CANCELLED = "cancelled"
+    EXPIRED = "expired"  # время записи прошло без решения администратора
+
+    @property
+    def icon(self):
+        return _CARD_STATUS_ICONS[self]
+
+    @property
+    def label(self):
+        """Читаемый текст статуса для сообщений"""
+        return f"{self.icon} {_CARD_STATUS_TITLES[self]}"
+
+_CARD_STATUS_ICONS = {
+    CardStatus.PENDING: "🕒",
+    CardStatus.APPROVED: "✅",
+    CardStatus.REJECTED: "❌",
+    CardStatus.CANCELLED: "🚫",
+    CardStatus.EXPIRED: "⌛",
+}
+
+_CARD_STATUS_TITLES = {
+    CardStatus.PENDING: "Ожидает согласования",
+    CardStatus.APPROVED: "Согласовано",
+    CardStatus.REJECTED: "Отклонено",
+    CardStatus.CANCELLED: "Отменено",
+    CardStatus.EXPIRED: "Просрочено",
+}
+
+# Статусы, после которых карточка ТО больше не меняется
+CLOSED_CARD_STATUSES = (CardStatus.APPROVED, CardStatus.REJECTED, CardStatus.CANCELLED, CardStatus.EXPIRED)
+
+class TOCardColumns:
+    """Общие колонки оперативной и архивной таблиц карточек ТО"""
     card_number = Column(String, unique=True)
-    agent_id = Column(Integer, ForeignKey("agents.id"))
     category = Column(String)  # B, C, E
-    sto_name = Column(String)
+    sto_name = Column(String)  # название станции на момент записи (для отображения)
     has_defects = Column(Boolean, default=False)
     defect_type = Column(String, nullable=True)  # minor, major
     defect_description = Column(Text, nullable=True)
@@ -43,12 +94,65 @@ class TOCard(Base):
     vin_number = Column(String)
     client_phone = Column(String)
     total_price = Column(Float)
-    status = Column(String, default="pending")  # pending, approved, rejected, cancelled
+    status = Column(
+        Enum(CardStatus, name="card_status", values_callable=lambda statuses: [s.value for s in statuses]),
+        nullable=False,
+        default=CardStatus.PENDING
+    )
     admin_comment = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    reminder_sent_at = Column(DateTime, nullable=True)  # когда агенту отправлено напоминание о записи
+    # Версия карточки: каждое изменение увеличивает ее на 1 (database/cards.py)
+    version = Column(Integer, nullable=False, default=1, server_default=text("1"))
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Режим "следующая карточка": кто из администраторов рассматривает карточку и до какого времени
+    claimed_by = Column(BigInteger, nullable=True)  # telegram_id администратора
+    claimed_until = Column(DateTime, nullable=True)
+
+    @declared_attr
+    def agent_id(cls):
+        return Column(Integer, ForeignKey("agents.id"))
+
+    @declared_attr
+    def station_id(cls):
+        return Column(Integer, ForeignKey("stations.id"), nullable=True)
+
+class TOCard(TOCardColumns, Base):
+    __tablename__ = "to_cards"
+    __table_args__ = (
+        # Очередь согласования и активные записи агента
+        Index("ix_to_cards_pending_created", "created_at", postgresql_where=text("status = 'pending'")),
+        Index("ix_to_cards_agent_pending", "agent_id", "appointment_time", postgresql_where=text("status = 'pending'")),
+        # Ожидающие карточки с прошедшим временем записи (задача просрочки)
+        Index("ix_to_cards_pending_appointment", "appointment_time", postgresql_where=text("status = 'pending'")),
+        # Предстоящие записи без напоминания
+        Index(
+            "ix_to_cards_reminder_due", "appointment_time",
+            postgresql_where=text("status IN ('pending', 'approved') AND reminder_sent_at IS NULL")
+        ),
+        # Занятость станции по времени
+        Index("ix_to_cards_station_appointment", "station_id", "appointment_time"),
+        # Кандидаты на перенос в архив
+        Index(
+            "ix_to_cards_closed_appointment", "appointment_time",
+            postgresql_where=text("status IN ('approved', 'rejected', 'cancelled', 'expired')")
+        ),
+    )
+    
+    id = Column(Integer, primary_key=True)
     
     agent = relationship("Agent", back_populates="to_cards")
 
+class TOCardArchive(TOCardColumns, Base):
+    """Закрытые карточки ТО старше ARCHIVE_AFTER_MONTHS (переносятся из to_cards с тем же id)"""
+    __tablename__ = "to_cards_archive"
+    __table_args__ = (
+        Index("ix_to_cards_archive_agent_appointment", "agent_id", "appointment_time"),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
 class Payment(Base):
     __tablename__ = "payments"
     
@@ -58,4 +162,29 @@ class Payment(Base):
     comment = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
     
-    agent = relationship("Agent", back_populates="payments") 
\ No newline at end of file
+    agent = relationship("Agent", back_populates="payments")
+
+class PaymentImport(Base):
+    """Импортированный CSV-файл с платежами: защита от повторной загрузки того же файла"""
+    __tablename__ = "payment_imports"
+    __table_args__ = (
+        # Повторный импорт разрешен только явно (forced) и в уникальности не участвует
+        Index("ux_payment_imports_hash", "content_hash", unique=True, postgresql_where=text("NOT forced")),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    content_hash = Column(String(64), nullable=False)  # SHA-256 содержимого файла
+    admin_id = Column(BigInteger, nullable=False)  # telegram_id администратора
+    payments_count = Column(Integer, nullable=False)
+    total = Column(Float, nullable=False)
+    forced = Column(Boolean, nullable=False, default=False, server_default=text("false"))
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class BotState(Base):
+    """Состояние бота, общее для всех воркеров: разговоры и user_data (pickle)"""
+    __tablename__ = "bot_state"
+    
+    kind = Column(String, primary_key=True)  # user_data, conversation:<имя обработчика>
+    key = Column(String, primary_key=True)
+    data = Column(LargeBinary, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
\ No newline at end of file
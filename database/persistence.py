@@ -0,0 +1,119 @@
+import json
+import pickle
+from datetime import datetime
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.postgresql import insert
+from telegram.ext import BasePersistence, PersistenceInput
+from config import settings
+from database.database import SessionLocal
+from database.models import BotState
+from utils.executors import run_io
+from utils.logger import logger
+
+USER_DATA = "user_data"
+
+def _conversation_kind(name: str):
+    return f"conversation:{name}"
+
+class PostgresPersistence(BasePersistence):
+    """Состояние разговоров и user_data в таблице bot_state.
+
+    Обновления одного пользователя всегда попадают в один воркер, поэтому воркер
+    читает состояние из БД только при запуске, а дальше лишь записывает изменения.
+    Так разговор переживает перезапуск воркера или изменение их количества.
+    bot_data, chat_data и callback_data бот не использует и не сохраняет.
+    """
+
+    def __init__(self, update_interval: float = None):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval or settings.PERSISTENCE_UPDATE_INTERVAL
+        )
+
+    def _load(self, kind: str):
+        db = SessionLocal()
+        try:
+            return db.execute(select(BotState.key, BotState.data).where(BotState.kind == kind)).all()
+        finally:
+            db.close()
+
+    def _save(self, kind: str, key: str, value):
+        statement = insert(BotState).values(
+            kind=kind, key=key, data=pickle.dumps(value), updated_at=datetime.utcnow()
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=[BotState.kind, BotState.key],
+            set_={"data": statement.excluded.data, "updated_at": statement.excluded.updated_at}
+        )
+        self._execute(statement)
+
+    def _delete(self, kind: str, key: str):
+        self._execute(delete(BotState).where(BotState.kind == kind, BotState.key == key))
+
+    def _execute(self, statement):
+        db = SessionLocal()
+        try:
+            db.execute(statement)
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error saving bot state: {e}")
+            raise
+        finally:
+            db.close()
+
+    async def get_user_data(self):
+        rows = await run_io(self._load, USER_DATA)
+        return {int(key): pickle.loads(data) for key, data in rows}
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name: str):
+        rows = await run_io(self._load, _conversation_kind(name))
+        return {tuple(json.loads(key)): pickle.loads(data) for key, data in rows}
+
+    async def update_conversation(self, name: str, key, new_state):
+        kind = _conversation_kind(name)
+        key = json.dumps(list(key))
+        if new_state is None:
+            await run_io(self._delete, kind, key)
+        else:
+            await run_io(self._save, kind, key, new_state)
+
+    async def update_user_data(self, user_id: int, data):
+        await run_io(self._save, USER_DATA, str(user_id), data)
+
+    async def update_chat_data(self, chat_id: int, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def drop_user_data(self, user_id: int):
+        await run_io(self._delete, USER_DATA, str(user_id))
+
+    async def drop_chat_data(self, chat_id: int):
+        pass
+
+    async def refresh_user_data(self, user_id: int, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        # Все изменения уже записаны в update_persistence при остановке приложения
+        pass
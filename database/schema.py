@@ -0,0 +1,37 @@
+from pathlib import Path
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from database.database import engine
+from utils.logger import logger
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+def get_alembic_config():
+    """Конфигурация Alembic с абсолютным путем к миграциям"""
+    config = Config(str(PROJECT_ROOT / "alembic.ini"))
+    config.set_main_option("script_location", str(PROJECT_ROOT / "migrations"))
+    return config
+
+def get_head_revision():
+    """Последняя ревизия среди файлов миграций"""
+    return ScriptDirectory.from_config(get_alembic_config()).get_current_head()
+
+def get_current_revision():
+    """Ревизия, примененная к базе данных (таблица alembic_version)"""
+    with engine.connect() as connection:
+        return MigrationContext.configure(connection).get_current_revision()
+
+def verify_schema():
+    """Проверка, что схема БД соответствует последней миграции (без DDL и рефлексии)"""
+    head = get_head_revision()
+    current = get_current_revision()
+
+    if current != head:
+        logger.error(f"Database schema revision {current} does not match migrations head {head}")
+        raise RuntimeError(
+            f"Схема базы данных устарела (ревизия {current}, требуется {head}). "
+            "Выполните: alembic upgrade head"
+        )
+
+    logger.debug(f"Database schema is up to date (revision {current})")
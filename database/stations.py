@@ -0,0 +1,101 @@
+"""Справочник станций СТО: таблица stations и ее копия в памяти процесса"""
+import threading
+from config import STOSettings
+from database.database import SessionLocal
+from database.models import Station
+from utils.logger import logger
+from utils.notify import notify, subscribe
+
+# Канал уведомлений об изменении справочника станций
+STATIONS_CHANNEL = "stations_changed"
+
+class StationInfo(STOSettings):
+    """Станция из справочника"""
+    id: int
+    code: str
+    active: bool = True
+
+    @classmethod
+    def from_model(cls, station: Station):
+        return cls(
+            id=station.id,
+            code=station.code,
+            name=station.name,
+            address=station.address,
+            categories=station.categories,
+            prices=station.prices,
+            working_hours=station.working_hours,
+            time_slot=station.time_slot,
+            defect_prices=station.defect_prices,
+            capacity=station.capacity or {},
+            active=station.active
+        )
+
+class StationCatalog:
+    """Станции в памяти: экраны бронирования читают их без запросов к БД.
+
+    Справочник перечитывается целиком по уведомлению stations_changed
+    (отправляется при каждом изменении через scripts/stations.py).
+    """
+
+    def __init__(self):
+        self._by_code = None
+        self._by_id = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        db = SessionLocal()
+        try:
+            stations = [StationInfo.from_model(station) for station in db.query(Station).order_by(Station.id)]
+        finally:
+            db.close()
+
+        # Подменяем словари целиком, чтобы читатели видели либо старый, либо новый справочник
+        with self._lock:
+            self._by_id = {station.id: station for station in stations}
+            self._by_code = {station.code: station for station in stations}
+        logger.info(f"Station catalog loaded: {len(stations)} stations")
+
+    def _stations(self):
+        if self._by_code is None:
+            self.load()
+        return self._by_code
+
+    def get(self, code: str):
+        """Станция по коду (отключенные тоже: по ним дозавершаются начатые бронирования)"""
+        return self._stations().get(code)
+
+    def by_id(self, station_id: int):
+        self._stations()
+        return self._by_id.get(station_id)
+
+    def available(self, category: str = None):
+        """Активные станции, работающие с категорией"""
+        return [
+            station for station in self._stations().values()
+            if station.active and (category is None or category in station.categories)
+        ]
+
+    def all(self):
+        return list(self._stations().values())
+
+station_catalog = StationCatalog()
+
+def _on_stations_changed(payload):
+    station_catalog.load()
+
+subscribe(STATIONS_CHANNEL, _on_stations_changed)
+
+def save_station(db, code: str, **fields):
+    """Создание или изменение станции с уведомлением всех процессов бота"""
+    station = db.query(Station).filter(Station.code == code).first()
+    if station is None:
+        station = Station(code=code)
+        db.add(station)
+    for name, value in fields.items():
+        setattr(station, name, value)
+    db.flush()
+    # Уведомление доставляется только после коммита транзакции
+    notify(STATIONS_CHANNEL, code, connection=db.connection())
+    db.commit()
+    return station
@@ -2,23 +2,20 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler, CommandHandler, MessageHandler, filters
 from utils.logger import logger
 from utils.roles import admin_required
-from database.database import get_db
-from database.models import Agent, TOCard, Payment
-from handlers.user_handler import get_all_agents, update_agent_commission
+from utils.query_budget import query_budget
+from database.database import get_db, get_read_db, pin_to_primary
+from database.models import Agent, TOCard, Payment, CardStatus
+from handlers.user_handler import (
+    get_all_agents, update_agent_commission, agent_cards, get_agent_card_stats, get_agent_balance
+)
+from handlers.admin_routes import (
+    ADMIN_ACTION, SELECT_AGENT, AGENT_INFO, AGENT_ARCHIVE, AGENT_ACTION,
+    PAYMENT_AMOUNT, PAYMENT_COMMENT, EDIT_CARD, EDIT_CARD_SELECT_FIELD, CHANGE_COMMISSION
+)
+from handlers.card_view import (
+    card_columns, card_row, parse_card_callback, render_card, render_card_summary, render_conflict
+)
 from sqlalchemy import func
-from datetime import datetime
-
-# Состояния для ConversationHandler
-(
-    ADMIN_ACTION, 
-    SELECT_AGENT, 
-    AGENT_INFO, 
-    AGENT_ARCHIVE, 
-    AGENT_ACTION,
-    PAYMENT_AMOUNT, PAYMENT_COMMENT,
-    EDIT_CARD, EDIT_CARD_SELECT_FIELD,
-    CHANGE_COMMISSION
-) = range(10)
 
 @admin_required
 async def admin_agents_list(update: Update, context: ContextTypes.DEFAULT_TYPE, page: int = 0):
@@ -125,6 +122,7 @@ async def agent_details(update: Update, context: ContextTypes.DEFAULT_TYPE):
     finally:
         db.close()
 
+@query_budget(6)
 @admin_required
 async def agent_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показать информацию об агенте"""
@@ -134,7 +132,7 @@ async def agent_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Получаем ID агента из данных callback
     agent_id = int(query.data.split("_")[2])
     
-    db = next(get_db())
+    db = next(get_read_db(update.effective_user.id))
     try:
         agent = db.query(Agent).filter(Agent.id == agent_id).first()
         if not agent:
@@ -146,30 +144,16 @@ async def agent_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return SELECT_AGENT
         
-        # Получаем статистику по ТО
-        approved_to = db.query(func.count(TOCard.id)).filter(
-            TOCard.agent_id == agent_id,
-            TOCard.status == "approved"
-        ).scalar()
-        
-        rejected_to = db.query(func.count(TOCard.id)).filter(
-            TOCard.agent_id == agent_id,
-            TOCard.status == "rejected"
-        ).scalar()
-        
-        # Получаем сумму всех одобренных ТО
-        approved_sum = db.query(func.sum(TOCard.total_price)).filter(
-            TOCard.agent_id == agent_id,
-            TOCard.status == "approved"
-        ).scalar() or 0
-        
-        # Рассчитываем комиссионные
-        commission = approved_sum * (agent.commission_rate / 100)
+        # Получаем статистику по ТО (одним запросом, с учетом архива)
+        stats = get_agent_card_stats(db, agent_id)
+        approved_to = stats.get(CardStatus.APPROVED, (0, 0))[0]
+        rejected_to = stats.get(CardStatus.REJECTED, (0, 0))[0]
+        expired_to = stats.get(CardStatus.EXPIRED, (0, 0))[0]
         
-        # Получаем сумму всех платежей
-        payments_sum = db.query(func.sum(Payment.amount)).filter(
-            Payment.agent_id == agent_id
-        ).scalar() or 0
+        # Сумма одобренных ТО, комиссионные и сумма всех платежей
+        approved_sum, commission, payments_sum, balance = get_agent_balance(
+            db, agent_id, agent.commission_rate, stats
+        )
         
         # Формируем текст с информацией
         info_text = (
@@ -180,9 +164,10 @@ async def agent_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"🔗 Мессенджер: {agent.messenger_link or 'Не указан'}\n\n"
             f"📊 Статистика ТО:\n"
             f"✅ Согласованных: {approved_to}\n"
-            f"❌ Отклоненных: {rejected_to}\n\n"
+            f"❌ Отклоненных: {rejected_to}\n"
+            f"⌛ Просроченных: {expired_to}\n\n"
             f"💰 Финансы:\n"
-            f"💲 Баланс: {approved_sum - commission - payments_sum:.2f} руб.\n"
+            f"💲 Баланс: {balance:.2f} руб.\n"
             f"🧮 Комиссия: {agent.commission_rate}%\n"
             f"💵 Сумма комиссии: {commission:.2f} руб.\n"
             f"💸 Сумма выплат: {payments_sum:.2f} руб.\n"
@@ -203,6 +188,7 @@ async def agent_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
     finally:
         db.close()
 
+@query_budget(5)
 @admin_required
 async def agent_archive(update: Update, context: ContextTypes.DEFAULT_TYPE, page: int = 0):
     """Показать архив агента - все карточки ТО и карточки расчетов"""
@@ -217,7 +203,7 @@ async def agent_archive(update: Update, context: ContextTypes.DEFAULT_TYPE, page
     if len(parts) > 3 and parts[3] == "page":
         page = int(parts[4])
     
-    db = next(get_db())
+    db = next(get_read_db(update.effective_user.id))
     try:
         agent = db.query(Agent).filter(Agent.id == agent_id).first()
         if not agent:
@@ -229,15 +215,14 @@ async def agent_archive(update: Update, context: ContextTypes.DEFAULT_TYPE, page
             )
             return SELECT_AGENT
         
-        # Получаем все карточки ТО для этого агента с пагинацией
-        to_cards = db.query(TOCard).filter(
-            TOCard.agent_id == agent_id
-        ).order_by(TOCard.created_at.desc()).limit(5).offset(page * 5).all()
+        # Получаем все карточки ТО для этого агента с пагинацией (оперативные и архивные)
+        cards = agent_cards(agent_id)
+        to_cards = db.query(*card_columns(cards.c)).order_by(
+            cards.c.created_at.desc()
+        ).limit(5).offset(page * 5).all()
         
         # Получаем общее количество карточек ТО
-        total_cards = db.query(func.count(TOCard.id)).filter(
-            TOCard.agent_id == agent_id
-        ).scalar()
+        total_cards = db.query(func.count()).select_from(cards).scalar()
         
         # Получаем платежи для этого агента
         payments = db.query(Payment).filter(
@@ -250,32 +235,8 @@ async def agent_archive(update: Update, context: ContextTypes.DEFAULT_TYPE, page
         if to_cards:
             message_text += f"🚗 Карточки ТО (страница {page + 1}/{(total_cards - 1) // 5 + 1}):\n\n"
             
-            for card in to_cards:
-                appointment_time = card.appointment_time.strftime("%d.%m.%Y %H:%M")
-                created_at = card.created_at.strftime("%d.%m.%Y %H:%M")
-                
-                status_text = {
-                    "pending": "🕒 Ожидает согласования",
-                    "approved": "✅ Согласовано",
-                    "rejected": "❌ Отклонено",
-                    "cancelled": "🚫 Отменено"
-                }.get(card.status, card.status)
-                
-                message_text += (
-                    f"Карточка ТО №{card.card_number}\n"
-                    f"Создана: {created_at}\n"
-                    f"Категория: {card.category}\n"
-                    f"СТО: {card.sto_name}\n"
-                    f"Запись на: {appointment_time}\n"
-                    f"Клиент: {card.client_name}\n"
-                    f"Номер авто: {card.car_number}\n"
-                    f"Стоимость: {card.total_price:.2f} руб.\n"
-                    f"Статус: {status_text}\n"
-                )
-                
-                if card.status == "rejected" and card.admin_comment:
-                    message_text += f"Причина отклонения: {card.admin_comment}\n"
-                
+            for card in map(card_row, to_cards):
+                message_text += render_card_summary(card, show_client=True)
                 message_text += "\n---\n\n"
         else:
             message_text += "У агента нет карточек ТО.\n\n"
@@ -456,22 +417,14 @@ async def process_payment_comment(update: Update, context: ContextTypes.DEFAULT_
         
         db.add(payment)
         db.commit()
+        pin_to_primary(update.effective_user.id)
         
         logger.info(f"Admin {update.effective_user.id} added payment of {amount} to agent {agent_id} with comment: {comment}")
         
         # Получаем актуальную информацию о балансе
-        approved_sum = db.query(func.sum(TOCard.total_price)).filter(
-            TOCard.agent_id == agent_id,
-            TOCard.status == "approved"
-        ).scalar() or 0
-        
-        commission = approved_sum * (agent.commission_rate / 100)
-        
-        payments_sum = db.query(func.sum(Payment.amount)).filter(
-            Payment.agent_id == agent_id
-        ).scalar() or 0
-        
-        balance = approved_sum - commission - payments_sum
+        approved_sum, commission, payments_sum, balance = get_agent_balance(
+            db, agent_id, agent.commission_rate
+        )
         
         # Формируем сообщение об успешном добавлении платежа
         sign = "+" if amount >= 0 else ""
@@ -577,22 +530,14 @@ async def process_change_commission(update: Update, context: ContextTypes.DEFAUL
             
             # Обновляем комиссию
             update_agent_commission(db, agent_id, new_commission)
+            pin_to_primary(update.effective_user.id)
             
             logger.info(f"Admin {update.effective_user.id} changed commission for agent {agent_id} from {old_commission}% to {new_commission}%")
             
             # Получаем актуальную информацию о балансе
-            approved_sum = db.query(func.sum(TOCard.total_price)).filter(
-                TOCard.agent_id == agent_id,
-                TOCard.status == "approved"
-            ).scalar() or 0
-            
-            commission = approved_sum * (new_commission / 100)
-            
-            payments_sum = db.query(func.sum(Payment.amount)).filter(
-                Payment.agent_id == agent_id
-            ).scalar() or 0
-            
-            balance = approved_sum - commission - payments_sum
+            approved_sum, commission, payments_sum, balance = get_agent_balance(
+                db, agent_id, new_commission
+            )
             
             # Формируем сообщение об успешном изменении комиссии
             keyboard = [[
@@ -673,14 +618,10 @@ async def start_edit_to_card(update: Update, context: ContextTypes.DEFAULT_TYPE)
         keyboard = []
         for card in to_cards:
             appointment_time = card.appointment_time.strftime("%d.%m.%Y %H:%M")
-            status_text = {
-                "pending": "🕒", "approved": "✅", "rejected": "❌", "cancelled": "🚫"
-            }.get(card.status, "")
-            
             keyboard.append([
                 InlineKeyboardButton(
-                    f"{status_text} Карточка №{card.card_number} ({appointment_time})", 
-                    callback_data=f"edit_card_{card.id}"
+                    f"{card.status.icon} Карточка №{card.card_number} ({appointment_time})", 
+                    callback_data=f"edit_card_{card.id}_{card.version}"
                 )
             ])
         
@@ -705,13 +646,16 @@ async def select_to_card_for_edit(update: Update, context: ContextTypes.DEFAULT_
     query = update.callback_query
     await query.answer()
     
-    card_id = int(query.data.split("_")[2])
+    card_id, version = parse_card_callback(query.data)
     context.user_data["edit_card_id"] = card_id
     
     db = next(get_db())
     try:
-        card = db.query(TOCard).filter(TOCard.id == card_id).first()
-        if not card:
+        # Карточка и имя агента одним запросом
+        row = db.query(*card_columns(TOCard), Agent.full_name).outerjoin(
+            Agent, Agent.id == TOCard.agent_id
+        ).filter(TOCard.id == card_id).first()
+        if not row:
             await query.edit_message_text(
                 "Ошибка: карточка ТО не найдена.",
                 reply_markup=InlineKeyboardMarkup([[
@@ -720,36 +664,21 @@ async def select_to_card_for_edit(update: Update, context: ContextTypes.DEFAULT_
             )
             return ConversationHandler.END
         
-        agent = db.query(Agent).filter(Agent.id == card.agent_id).first()
-        agent_name = agent.full_name if agent else "Неизвестный агент"
-        
-        # Форматируем дату и время
-        appointment_time = card.appointment_time.strftime("%d.%m.%Y %H:%M")
-        
-        # Формируем сообщение с информацией о карточке
-        message_text = (
-            f"📋 Карточка ТО №{card.card_number}\n\n"
-            f"👤 Агент: {agent_name}\n"
-            f"📅 Дата и время: {appointment_time}\n"
-            f"🚗 Категория: {card.category}\n"
-            f"🏢 СТО: {card.sto_name}\n"
-            f"💰 Стоимость: {card.total_price:.2f} руб.\n\n"
-            f"👤 Клиент: {card.client_name}\n"
-            f"🚘 Номер авто: {card.car_number}\n"
-            f"🔢 VIN: {card.vin_number}\n"
-            f"📱 Телефон: {card.client_phone}\n\n"
-        )
+        card = card_row(row)
         
-        if card.has_defects:
-            message_text += f"🔧 Дефекты: {card.defect_type}\n"
-            message_text += f"📝 Описание: {card.defect_description}\n\n"
-        else:
-            message_text += "✅ Дефекты отсутствуют\n\n"
-        
-        message_text += f"🔄 Статус: {get_status_text(card.status)}\n"
+        # Карточку изменили после того, как администратор открыл список
+        if version is not None and card.version != version:
+            await query.edit_message_text(
+                render_conflict(card),
+                reply_markup=InlineKeyboardMarkup([[
+                    InlineKeyboardButton("Назад", callback_data=f"agent_action_{context.user_data.get('edit_agent_id')}")
+                ]])
+            )
+            return ConversationHandler.END
         
-        if card.admin_comment:
-            message_text += f"💬 Комментарий администратора: {card.admin_comment}\n"
+        # Изменения полей сохраняются через update_card_if_unchanged с этой версией
+        context.user_data["edit_card_version"] = card.version
+        message_text = render_card(card, row.full_name or "Неизвестный агент", admin=True)
         
         # Создаем клавиатуру с полями для редактирования
         keyboard = [
@@ -764,7 +693,7 @@ async def select_to_card_for_edit(update: Update, context: ContextTypes.DEFAULT_
         ]
         
         # Добавляем возможность изменить статус, если карточка не отменена
-        if card.status != "cancelled":
+        if card.status != CardStatus.CANCELLED:
             keyboard.append([InlineKeyboardButton("🔄 Изменить статус", callback_data="edit_field_status")])
         
         # Добавляем возможность изменить информацию о дефектах
@@ -788,14 +717,4 @@ async def select_to_card_for_edit(update: Update, context: ContextTypes.DEFAULT_
         
         return EDIT_CARD_SELECT_FIELD
     finally:
-        db.close()
-
-def get_status_text(status):
-    """Преобразование статуса в читаемый текст"""
-    status_texts = {
-        "pending": "🕒 Ожидает согласования",
-        "approved": "✅ Согласовано",
-        "rejected": "❌ Отклонено",
-        "cancelled": "🚫 Отменено"
-    }
-    return status_texts.get(status, status) 
\ No newline at end of file
+        db.close()
\ No newline at end of file
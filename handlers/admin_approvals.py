@@ -1,90 +1,72 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import (
-    ContextTypes, 
-    ConversationHandler, 
-    CallbackQueryHandler,
-    MessageHandler,
-    filters
-)
+from telegram.ext import ContextTypes, ConversationHandler
 from utils.logger import logger
 from utils.roles import admin_required
-from database.database import get_db
-from database.models import Agent, TOCard
+from utils.query_budget import query_budget
+from utils.replies import answer_while, show_screen
+from database.database import get_db, get_read_db, pin_to_primary
+from database.models import Agent, TOCard, CardStatus
+from handlers.admin_routes import REJECT_REASON
+from database.cards import claim_next_card, update_card_if_unchanged
+from handlers.card_view import (
+    card_columns, card_row, card_row_from_model, parse_card_callback, render_card, render_card_summary, render_conflict
+)
+from config import settings
 from datetime import datetime
 
-# Состояния для ConversationHandler
-APPROVE_REJECT, REJECT_REASON = range(2)
+# Кнопка перехода к следующей карточке очереди (режим для нескольких администраторов)
+NEXT_CARD_BUTTON = InlineKeyboardButton("▶️ Следующая карточка", callback_data="review_next")
 
-@admin_required
-async def show_pending_approvals(update: Update, context: ContextTypes.DEFAULT_TYPE, page: int = 0):
-    """Показать список ожидающих согласования записей на ТО"""
-    user_id = update.effective_user.id
-    logger.info(f"Admin {user_id} requested pending approvals")
-    
-    # Определяем, вызвана функция из колбэка или напрямую
-    query = update.callback_query
-    if query:
-        await query.answer()
-    
-    db = next(get_db())
+# Закрепление снимается вместе с решением по карточке
+RELEASE_CLAIM = {"claimed_by": None, "claimed_until": None}
+
+def render_pending_approvals(user_id: int, page: int):
+    """Текст и клавиатура страницы очереди согласования (синхронно, выполняется в потоке)"""
+    db = next(get_read_db(user_id))
     try:
-        # Получаем все записи со статусом pending
-        pending_cards = db.query(TOCard).filter(
-            TOCard.status == "pending"
+        # Получаем записи со статусом pending вместе с именем агента одним запросом
+        pending_cards = db.query(
+            *card_columns(TOCard), Agent.full_name, TOCard.claimed_by, TOCard.claimed_until
+        ).outerjoin(
+            Agent, Agent.id == TOCard.agent_id
+        ).filter(
+            TOCard.status == CardStatus.PENDING
         ).order_by(TOCard.created_at).limit(5).offset(page * 5).all()
         
         # Получаем общее количество записей, ожидающих согласования
         total_pending = db.query(TOCard).filter(
-            TOCard.status == "pending"
+            TOCard.status == CardStatus.PENDING
         ).count()
         
         # Формируем сообщение
+        card_buttons = []
         if not pending_cards:
             message_text = "Нет карточек ТО, ожидающих согласования."
         else:
             message_text = f"📋 Карточки ТО, ожидающие согласования ({page + 1}/{(total_pending - 1) // 5 + 1}):\n\n"
             
-            for i, card in enumerate(pending_cards, 1):
-                # Получаем информацию об агенте
-                agent = db.query(Agent).filter(Agent.id == card.agent_id).first()
-                agent_name = agent.full_name if agent else "Неизвестный агент"
-                
-                # Форматируем дату и время
-                created_at = card.created_at.strftime("%d.%m.%Y %H:%M")
-                appointment_time = card.appointment_time.strftime("%d.%m.%Y %H:%M")
-                
-                message_text += (
-                    f"{i}. Карточка ТО №{card.card_number}\n"
-                    f"   📅 Создана: {created_at}\n"
-                    f"   👤 Агент: {agent_name}\n"
-                    f"   🚗 Категория: {card.category}\n"
-                    f"   🏢 СТО: {card.sto_name}\n"
-                    f"   ⏰ Время записи: {appointment_time}\n"
-                    f"   👤 Клиент: {card.client_name}\n"
-                    f"   🚘 Номер авто: {card.car_number}\n"
-                    f"   📱 Телефон: {card.client_phone}\n"
-                    f"   💰 Стоимость: {card.total_price} руб.\n"
-                )
+            now = datetime.now()
+            for i, row in enumerate(pending_cards, 1):
+                card = card_row(row)
+                agent_name = row.full_name or "Неизвестный агент"
                 
-                if card.has_defects:
-                    message_text += f"   🔧 Дефекты: {card.defect_type}\n"
-                    message_text += f"   📝 Описание: {card.defect_description}\n"
-                else:
-                    message_text += "   ✅ Дефекты отсутствуют\n"
+                message_text += render_card_summary(card, i, show_status=False, show_client=True)
+                message_text += f"   👤 Агент: {agent_name}\n"
+                # Карточку сейчас рассматривает другой администратор в режиме "следующая карточка"
+                if row.claimed_by and row.claimed_by != user_id and row.claimed_until and row.claimed_until > now:
+                    message_text += f"   🔒 На рассмотрении у другого администратора до {row.claimed_until:%H:%M}\n"
                 
-                # Добавляем кнопки для согласования или отклонения
-                keyboard = [
-                    [
-                        InlineKeyboardButton("✅ Согласовать", callback_data=f"approve_card_{card.id}"),
-                        InlineKeyboardButton("❌ Отклонить", callback_data=f"reject_card_{card.id}")
-                    ]
-                ]
+                # Кнопки согласования и отклонения несут версию карточки, которую видит администратор
+                card_buttons.append([
+                    InlineKeyboardButton(f"✅ Согласовать {i}", callback_data=f"approve_card_{card.id}_{card.version}"),
+                    InlineKeyboardButton(f"❌ Отклонить {i}", callback_data=f"reject_card_{card.id}_{card.version}")
+                ])
                 
                 # Добавляем разделитель между карточками
                 message_text += "\n" + "-" * 30 + "\n\n"
         
-        # Создаем клавиатуру для навигации и возврата в панель администратора
-        keyboard = []
+        # Создаем клавиатуру для карточек, навигации и возврата в панель администратора
+        keyboard = card_buttons
         
         # Кнопки пагинации
         pagination = []
@@ -97,26 +79,91 @@ async def show_pending_approvals(update: Update, context: ContextTypes.DEFAULT_T
         if pagination:
             keyboard.append(pagination)
         
+        if pending_cards:
+            keyboard.append([NEXT_CARD_BUTTON])
         keyboard.append([InlineKeyboardButton("Вернуться в админ-панель", callback_data="admin_panel")])
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        # Отвечаем в зависимости от способа вызова
-        if query:
-            await query.edit_message_text(message_text, reply_markup=reply_markup)
-        else:
-            await update.message.reply_text(message_text, reply_markup=reply_markup)
+        return message_text, InlineKeyboardMarkup(keyboard)
             
     finally:
         db.close()
 
+def render_next_card(user_id: int, held_card_id: int = None, skip: bool = False):
+    """Закрепление следующей карточки очереди за администратором (синхронно, выполняется в потоке).
+
+    Возвращает id закрепленной карточки (None, если очередь пуста), текст и клавиатуру.
+    """
+    db = next(get_db())
+    try:
+        card_id = claim_next_card(db, user_id, settings.REVIEW_CLAIM_MINUTES, held_card_id, skip)
+        db.commit()
+        
+        if card_id is None:
+            return None, "Нет карточек ТО, ожидающих согласования, которые не рассматривают другие администраторы.", \
+                InlineKeyboardMarkup([
+                    [InlineKeyboardButton("🔄 Проверить снова", callback_data="review_next")],
+                    [InlineKeyboardButton("Вернуться в админ-панель", callback_data="admin_panel")]
+                ])
+        
+        row = db.query(*card_columns(TOCard), Agent.full_name, TOCard.claimed_until).outerjoin(
+            Agent, Agent.id == TOCard.agent_id
+        ).filter(TOCard.id == card_id).one()
+        card = card_row(row)
+        
+        message_text = render_card(card, row.full_name or "Неизвестный агент", admin=True)
+        message_text += f"\n🔒 Карточка закреплена за вами до {row.claimed_until:%H:%M}"
+        
+        keyboard = [
+            [
+                InlineKeyboardButton("✅ Согласовать", callback_data=f"approve_card_{card.id}_{card.version}"),
+                InlineKeyboardButton("❌ Отклонить", callback_data=f"reject_card_{card.id}_{card.version}")
+            ],
+            [InlineKeyboardButton("⏭ Пропустить", callback_data="review_skip")],
+            [InlineKeyboardButton("Вернуться в админ-панель", callback_data="admin_panel")]
+        ]
+        return card_id, message_text, InlineKeyboardMarkup(keyboard)
+    
+    except Exception:
+        db.rollback()
+        raise
+    
+    finally:
+        db.close()
+
+@query_budget(4)
+@admin_required
+async def show_next_card(update: Update, context: ContextTypes.DEFAULT_TYPE, skip: bool = False):
+    """Следующая карточка для рассмотрения: каждый администратор получает свою"""
+    user_id = update.effective_user.id
+    held_card_id = context.user_data.get("review_card_id")
+    logger.info(f"Admin {user_id} requested next card for review (skip={skip})")
+    
+    card_id, message_text, reply_markup = await answer_while(
+        update.callback_query, render_next_card, user_id, held_card_id, skip
+    )
+    context.user_data["review_card_id"] = card_id
+    pin_to_primary(user_id)
+    await show_screen(update, message_text, reply_markup)
+
+@query_budget(3)
+@admin_required
+async def show_pending_approvals(update: Update, context: ContextTypes.DEFAULT_TYPE, page: int = 0):
+    """Показать список ожидающих согласования записей на ТО"""
+    user_id = update.effective_user.id
+    logger.info(f"Admin {user_id} requested pending approvals")
+    
+    # Ответ на нажатие кнопки идет параллельно с запросами к БД
+    message_text, reply_markup = await answer_while(update.callback_query, render_pending_approvals, user_id, page)
+    await show_screen(update, message_text, reply_markup)
+
+@query_budget(5)
 @admin_required
 async def handle_approve_card(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка согласования карточки ТО"""
     query = update.callback_query
     await query.answer()
     
-    # Получаем ID карточки из данных callback
-    card_id = int(query.data.split("_")[2])
+    # Получаем ID карточки и версию, которую видел администратор
+    card_id, version = parse_card_callback(query.data)
     
     db = next(get_db())
     try:
@@ -131,9 +178,16 @@ async def handle_approve_card(update: Update, context: ContextTypes.DEFAULT_TYPE
             )
             return
         
-        # Обновляем статус карточки
-        card.status = "approved"
+        # Согласуем, только если карточку не изменили с момента показа (иначе - конфликт)
+        if not update_card_if_unchanged(db, card_id, version, status=CardStatus.APPROVED, **RELEASE_CLAIM):
+            db.rollback()
+            logger.info(f"Admin {update.effective_user.id} approval of TO card {card_id} conflicted")
+            await query.edit_message_text(render_conflict(card), reply_markup=InlineKeyboardMarkup([[
+                InlineKeyboardButton("Вернуться к согласованиям", callback_data="admin_approve")
+            ]]))
+            return
         db.commit()
+        pin_to_primary(update.effective_user.id)
         
         logger.info(f"Admin {update.effective_user.id} approved TO card {card.card_number}")
         
@@ -144,17 +198,14 @@ async def handle_approve_card(update: Update, context: ContextTypes.DEFAULT_TYPE
         # Здесь можно было бы добавить логику для отправки уведомления агенту
         
         await query.edit_message_text(
-            f"✅ Карточка ТО №{card.card_number} успешно согласована!\n\n"
-            f"Информация о карточке:\n"
-            f"📅 Дата и время: {card.appointment_time.strftime('%d.%m.%Y %H:%M')}\n"
+            f"✅ Карточка ТО успешно согласована!\n\n"
             f"👤 Агент: {agent.full_name if agent else 'Неизвестный агент'}\n"
-            f"🚗 Категория: {card.category}\n"
-            f"🏢 СТО: {card.sto_name}\n"
-            f"💰 Стоимость: {card.total_price} руб.\n\n"
+            f"{render_card_summary(card_row_from_model(card), show_status=False)}\n"
             f"Агент будет уведомлен о согласовании.",
-            reply_markup=InlineKeyboardMarkup([[
-                InlineKeyboardButton("Вернуться к согласованиям", callback_data="admin_approve")
-            ]])
+            reply_markup=InlineKeyboardMarkup([
+                [NEXT_CARD_BUTTON],
+                [InlineKeyboardButton("Вернуться к согласованиям", callback_data="admin_approve")]
+            ])
         )
         
     except Exception as e:
@@ -177,8 +228,8 @@ async def start_reject_card(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
     
-    # Получаем ID карточки из данных callback
-    card_id = int(query.data.split("_")[2])
+    # Получаем ID карточки и версию, которую видел администратор
+    card_id, version = parse_card_callback(query.data)
     context.user_data["reject_card_id"] = card_id
     
     db = next(get_db())
@@ -194,6 +245,16 @@ async def start_reject_card(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return ConversationHandler.END
         
+        # Карточку уже изменили - не просим вводить причину зря
+        if card.status != CardStatus.PENDING or (version is not None and card.version != version):
+            await query.edit_message_text(render_conflict(card), reply_markup=InlineKeyboardMarkup([[
+                    InlineKeyboardButton("Вернуться к согласованиям", callback_data="admin_approve")
+                ]]))
+            return ConversationHandler.END
+        
+        # Версия проверяется еще раз при сохранении причины
+        context.user_data["reject_card_version"] = card.version
+        
         await query.edit_message_text(
             f"Вы собираетесь отклонить карточку ТО №{card.card_number}.\n\n"
             "Пожалуйста, введите причину отклонения:"
@@ -241,10 +302,19 @@ async def process_reject_reason(update: Update, context: ContextTypes.DEFAULT_TY
             )
             return ConversationHandler.END
         
-        # Обновляем статус карточки и добавляем комментарий
-        card.status = "rejected"
-        card.admin_comment = reject_reason
+        # Отклоняем, только если карточку не изменили, пока администратор вводил причину
+        if not update_card_if_unchanged(
+            db, card_id, context.user_data.get("reject_card_version"),
+            status=CardStatus.REJECTED, admin_comment=reject_reason, **RELEASE_CLAIM
+        ):
+            db.rollback()
+            logger.info(f"Admin {update.effective_user.id} rejection of TO card {card_id} conflicted")
+            await update.message.reply_text(render_conflict(card), reply_markup=InlineKeyboardMarkup([[
+                    InlineKeyboardButton("Вернуться к согласованиям", callback_data="admin_approve")
+                ]]))
+            return ConversationHandler.END
         db.commit()
+        pin_to_primary(update.effective_user.id)
         
         logger.info(f"Admin {update.effective_user.id} rejected TO card {card.card_number}: {reject_reason}")
         
@@ -255,18 +325,15 @@ async def process_reject_reason(update: Update, context: ContextTypes.DEFAULT_TY
         # Здесь можно было бы добавить логику для отправки уведомления агенту
         
         await update.message.reply_text(
-            f"❌ Карточка ТО №{card.card_number} отклонена!\n\n"
-            f"Информация о карточке:\n"
-            f"📅 Дата и время: {card.appointment_time.strftime('%d.%m.%Y %H:%M')}\n"
+            f"❌ Карточка ТО отклонена!\n\n"
             f"👤 Агент: {agent.full_name if agent else 'Неизвестный агент'}\n"
-            f"🚗 Категория: {card.category}\n"
-            f"🏢 СТО: {card.sto_name}\n"
-            f"💰 Стоимость: {card.total_price} руб.\n\n"
+            f"{render_card_summary(card_row_from_model(card), show_status=False)}\n"
             f"📝 Причина отклонения: {reject_reason}\n\n"
             f"Агент будет уведомлен об отклонении.",
-            reply_markup=InlineKeyboardMarkup([[
-                InlineKeyboardButton("Вернуться к согласованиям", callback_data="admin_approve")
-            ]])
+            reply_markup=InlineKeyboardMarkup([
+                [NEXT_CARD_BUTTON],
+                [InlineKeyboardButton("Вернуться к согласованиям", callback_data="admin_approve")]
+            ])
         )
         
         return ConversationHandler.END
@@ -286,18 +353,3 @@ async def process_reject_reason(update: Update, context: ContextTypes.DEFAULT_TY
     
     finally:
         db.close()
-
-def get_approval_handler():
-    """Создание обработчика разговора для согласования/отклонения карточек ТО"""
-    return ConversationHandler(
-        entry_points=[
-            CallbackQueryHandler(start_reject_card, pattern=r'^reject_card_\d+$')
-        ],
-        states={
-            REJECT_REASON: [
-                MessageHandler(filters.TEXT & ~filters.COMMAND, process_reject_reason)
-            ]
-        },
-        fallbacks=[],
-        name="admin_approval_handler"
-    ) 
\ No newline at end of file
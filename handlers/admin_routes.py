@@ -0,0 +1,70 @@
+from telegram.ext import ConversationHandler, CallbackQueryHandler, CommandHandler, MessageHandler, filters
+from config import settings
+from handlers.menu import handle_menu_callback
+from utils.lazy import lazy_callback
+
+# Модули админ-функций нужны редко, поэтому импортируются при первом обращении,
+# а здесь хранятся только состояния диалогов и их регистрация.
+
+# Состояния для ConversationHandler админ-функций (handlers/admin.py)
+(
+    ADMIN_ACTION, 
+    SELECT_AGENT, 
+    AGENT_INFO, 
+    AGENT_ARCHIVE, 
+    AGENT_ACTION,
+    PAYMENT_AMOUNT, PAYMENT_COMMENT,
+    EDIT_CARD, EDIT_CARD_SELECT_FIELD,
+    CHANGE_COMMISSION
+) = range(10)
+
+# Состояния для ConversationHandler согласований (handlers/admin_approvals.py)
+APPROVE_REJECT, REJECT_REASON = range(2)
+
+def get_admin_handler():
+    """Создание обработчика разговора для админ-функций"""
+    return ConversationHandler(
+        entry_points=[
+            CallbackQueryHandler(lazy_callback("handlers.admin.start_add_payment"), pattern=r'^add_payment_\d+$'),
+            CallbackQueryHandler(lazy_callback("handlers.admin.start_change_commission"), pattern=r'^change_commission_\d+$')
+        ],
+        states={
+            PAYMENT_AMOUNT: [MessageHandler(filters.TEXT & ~filters.COMMAND, lazy_callback("handlers.admin.process_payment_amount"))],
+            PAYMENT_COMMENT: [MessageHandler(filters.TEXT & ~filters.COMMAND, lazy_callback("handlers.admin.process_payment_comment"))],
+            CHANGE_COMMISSION: [MessageHandler(filters.TEXT & ~filters.COMMAND, lazy_callback("handlers.admin.process_change_commission"))],
+            AGENT_ACTION: [CallbackQueryHandler(handle_menu_callback)]
+        },
+        fallbacks=[],
+        map_to_parent={
+            # Если диалог завершится, возвращаемся к обработчику меню
+            ConversationHandler.END: CallbackQueryHandler(handle_menu_callback)
+        },
+        name="admin_functions",
+        persistent=settings.BOT_WORKERS > 1
+    )
+
+def get_approval_handler():
+    """Создание обработчика разговора для согласования/отклонения карточек ТО"""
+    return ConversationHandler(
+        entry_points=[
+            CallbackQueryHandler(lazy_callback("handlers.admin_approvals.start_reject_card"), pattern=r'^reject_card_\d+(_\d+)?$')
+        ],
+        states={
+            REJECT_REASON: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, lazy_callback("handlers.admin_approvals.process_reject_reason"))
+            ]
+        },
+        fallbacks=[],
+        name="admin_approval_handler",
+        persistent=settings.BOT_WORKERS > 1
+    )
+
+def get_payments_import_handlers():
+    """Обработчики массового импорта карточек расчета из CSV (/import_payments)"""
+    return [
+        MessageHandler(
+            filters.Document.ALL & filters.CaptionRegex(r"^/import_payments"),
+            lazy_callback("handlers.payments_import.import_payments")
+        ),
+        CommandHandler("import_payments", lazy_callback("handlers.payments_import.import_payments_help"))
+    ]
\ No newline at end of file
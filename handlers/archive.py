@@ -2,44 +2,32 @@ from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 from utils.logger import logger
 from utils.roles import registered_required
-from database.database import get_db
-from database.models import Agent, TOCard, Payment
-from sqlalchemy import func, or_
-from datetime import datetime
+from utils.query_budget import query_budget
+from utils.replies import answer_while, show_screen
+from database.database import get_read_db
+from database.models import Agent, Payment, CardStatus
+from handlers.user_handler import agent_cards
+from handlers.card_view import card_columns, card_row, render_card_summary
+from sqlalchemy import func
 
-@registered_required
-async def show_archive(update: Update, context: ContextTypes.DEFAULT_TYPE, page: int = 0):
-    """Показать архив записей пользователя"""
-    user_id = update.effective_user.id
-    logger.info(f"User {user_id} requested archive (page {page})")
-    
-    # Определяем, вызвана функция из колбэка или напрямую
-    query = update.callback_query
-    if query:
-        await query.answer()
-    
-    db = next(get_db())
+def render_archive(user_id: int, page: int):
+    """Текст и клавиатура страницы архива (синхронно, выполняется в потоке)"""
+    db = next(get_read_db(user_id))
     try:
         # Получаем информацию об агенте
         agent = db.query(Agent).filter(Agent.telegram_id == user_id).first()
         if not agent:
-            message_text = "Ошибка: не удалось найти информацию о вашем профиле. Пожалуйста, перерегистрируйтесь."
-            if query:
-                await query.edit_message_text(message_text)
-            else:
-                await update.message.reply_text(message_text)
-            return
+            return "Ошибка: не удалось найти информацию о вашем профиле. Пожалуйста, перерегистрируйтесь.", None
         
-        # Получаем завершенные записи агента (одобренные или отклоненные)
-        archive_bookings = db.query(TOCard).filter(
-            TOCard.agent_id == agent.id,
-            or_(TOCard.status == "approved", TOCard.status == "rejected")
-        ).order_by(TOCard.appointment_time.desc()).limit(5).offset(page * 5).all()
+        # Получаем завершенные записи агента (одобренные, отклоненные или просроченные) из оперативной и архивной таблиц
+        cards = agent_cards(agent.id)
+        archive_bookings = db.query(*card_columns(cards.c)).filter(
+            cards.c.status.in_((CardStatus.APPROVED, CardStatus.REJECTED, CardStatus.EXPIRED))
+        ).order_by(cards.c.appointment_time.desc()).limit(5).offset(page * 5).all()
         
         # Получаем общее количество записей в архиве
-        total_archive_bookings = db.query(func.count(TOCard.id)).filter(
-            TOCard.agent_id == agent.id,
-            or_(TOCard.status == "approved", TOCard.status == "rejected")
+        total_archive_bookings = db.query(func.count()).select_from(cards).filter(
+            cards.c.status.in_((CardStatus.APPROVED, CardStatus.REJECTED, CardStatus.EXPIRED))
         ).scalar()
         
         # Получаем историю платежей
@@ -56,24 +44,8 @@ async def show_archive(update: Update, context: ContextTypes.DEFAULT_TYPE, page:
         else:
             message_text += "📋 Завершенные записи на ТО:\n\n"
             
-            for i, booking in enumerate(archive_bookings, 1):
-                # Форматируем дату и время
-                appointment_time = booking.appointment_time.strftime("%d.%m.%Y %H:%M")
-                status = get_status_text(booking.status)
-                
-                message_text += (
-                    f"{i}. Карточка ТО №{booking.card_number}\n"
-                    f"   📅 Дата: {appointment_time}\n"
-                    f"   🚗 Категория: {booking.category}\n"
-                    f"   🏢 СТО: {booking.sto_name}\n"
-                    f"   💰 Стоимость: {booking.total_price} руб.\n"
-                    f"   🔄 Статус: {status}\n"
-                )
-                
-                if booking.admin_comment:
-                    message_text += f"   💬 Комментарий: {booking.admin_comment}\n"
-                
-                message_text += "\n"
+            for i, booking in enumerate(map(card_row, archive_bookings), 1):
+                message_text += render_card_summary(booking, i) + "\n"
         
         # Выводим платежи
         if payments:
@@ -105,22 +77,18 @@ async def show_archive(update: Update, context: ContextTypes.DEFAULT_TYPE, page:
             keyboard.append(pagination)
         
         keyboard.append([InlineKeyboardButton("Вернуться в главное меню", callback_data="back_to_main")])
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        # Отвечаем в зависимости от способа вызова
-        if query:
-            await query.edit_message_text(message_text, reply_markup=reply_markup)
-        else:
-            await update.message.reply_text(message_text, reply_markup=reply_markup)
+        return message_text, InlineKeyboardMarkup(keyboard)
             
     finally:
         db.close()
 
-def get_status_text(status):
-    """Преобразование статуса в читаемый текст"""
-    status_texts = {
-        "pending": "🕒 Ожидает согласования",
-        "approved": "✅ Согласовано",
-        "rejected": "❌ Отклонено"
-    }
-    return status_texts.get(status, status) 
\ No newline at end of file
+@query_budget(5)
+@registered_required
+async def show_archive(update: Update, context: ContextTypes.DEFAULT_TYPE, page: int = 0):
+    """Показать архив записей пользователя"""
+    user_id = update.effective_user.id
+    logger.info(f"User {user_id} requested archive (page {page})")
+    
+    # Ответ на нажатие кнопки идет параллельно с запросами к БД
+    message_text, reply_markup = await answer_while(update.callback_query, render_archive, user_id, page)
+    await show_screen(update, message_text, reply_markup)
\ No newline at end of file
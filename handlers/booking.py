@@ -1,13 +1,20 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardRemove
 from telegram.ext import ContextTypes, ConversationHandler, CommandHandler, CallbackQueryHandler, MessageHandler, filters
-from utils.logger import logger
+from utils.logger import logger, DEBUG_ENABLED, sampled
 from utils.roles import registered_required
-from database.database import get_db
-from database.models import TOCard, Agent
+from utils.query_budget import query_budget
+from database.database import get_db, pin_to_primary
+from database.models import TOCard, Agent, CardStatus
+from database.stations import station_catalog
+from handlers.card_view import CardRow, render_card
 from config import settings
+from sqlalchemy import func, text
 from datetime import datetime, timedelta
 import json
 
+# Сколько дней вперед (включая сегодня) доступно для записи
+BOOKING_WINDOW_DAYS = 8
+
 # Состояния для ConversationHandler
 (
     SELECT_STO, 
@@ -45,19 +52,19 @@ async def start_booking(update: Update, context: ContextTypes.DEFAULT_TYPE, cate
     
     # Сохраняем категорию в данных пользователя
     context.user_data["booking_category"] = category
+    # Новое бронирование: данные клиента вводятся заново
+    context.user_data.pop("booking_reselect_time", None)
     
-    # Получаем список станций, которые работают с этой категорией
-    sto_stations = settings.STO_STATIONS
+    # Получаем список станций, которые работают с этой категорией (из справочника в памяти)
     available_stations = []
     
-    for station_id, station in sto_stations.items():
-        if category in station.categories:
-            available_stations.append({
-                "id": station_id,
-                "name": station.name,
-                "address": station.address,
-                "price": station.prices.get(category, 0)
-            })
+    for station in station_catalog.available(category):
+        available_stations.append({
+            "id": station.code,
+            "name": station.name,
+            "address": station.address,
+            "price": station.prices.get(category, 0)
+        })
     
     if not available_stations:
         if update.callback_query:
@@ -109,11 +116,11 @@ async def select_sto(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return ConversationHandler.END
     
     # Получаем ID станции из данных callback
-    station_id = query.data.split("_")[1]
+    station_id = query.data.split("_", 1)[1]
     category = context.user_data["booking_category"]
     
     # Получаем информацию о станции
-    station = settings.STO_STATIONS.get(station_id)
+    station = station_catalog.get(station_id)
     if not station:
         await query.edit_message_text("Станция не найдена. Пожалуйста, начните бронирование заново.")
         return ConversationHandler.END
@@ -186,7 +193,7 @@ async def check_defects(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     defect_type = query.data.split("_")[1]
     station_id = context.user_data["station_id"]
-    station = settings.STO_STATIONS.get(station_id)
+    station = station_catalog.get(station_id)
     base_price = context.user_data["base_price"]
     
     if defect_type == "none":
@@ -220,37 +227,110 @@ async def specify_defects(update: Update, context: ContextTypes.DEFAULT_TYPE):
     defect_description = update.message.text
     context.user_data["defect_description"] = defect_description
     
-    logger.debug(f"User {update.effective_user.id} specified defects: {defect_description}")
+    if DEBUG_ENABLED and sampled():
+        logger.debug("User {} specified defects: {}", update.effective_user.id, defect_description)
     
     # Переходим к выбору времени
     return await select_time_slot(update, context)
 
-async def select_time_slot(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Выбор времени для записи на ТО"""
-    # Получаем информацию о станции
-    station_id = context.user_data["station_id"]
-    station = settings.STO_STATIONS.get(station_id)
-    
-    # Разбираем рабочие часы
+def station_time_slots(station, date):
+    """Слоты станции на дату по рабочим часам (на сегодня - только еще не наступившие)"""
     start_time = datetime.strptime(station.working_hours["start"], "%H:%M").time()
     end_time = datetime.strptime(station.working_hours["end"], "%H:%M").time()
-    time_slot_minutes = station.time_slot
     
-    # Создаем список доступных временных слотов на сегодня
-    current_datetime = datetime.now()
-    current_date = current_datetime.date()
+    now = datetime.now()
+    slots = []
+    current_time = datetime.combine(date, start_time)
+    end_datetime = datetime.combine(date, end_time)
+    while current_time < end_datetime:
+        if current_time > now:
+            slots.append(current_time)
+        current_time += timedelta(minutes=station.time_slot)
+    return slots
+
+def get_free_slots(db, station, category, dates):
+    """Свободные слоты станции по датам {date: [datetime, ...]} одним сгруппированным запросом"""
+    window_start = datetime.combine(min(dates), datetime.min.time())
+    window_end = datetime.combine(max(dates), datetime.max.time())
+    
+    # Считаем действующие записи этой категории по слотам (отмененные слот не занимают)
+    booked = dict(db.query(TOCard.appointment_time, func.count()).filter(
+        TOCard.station_id == station.id,
+        TOCard.category == category,
+        TOCard.status != CardStatus.CANCELLED,
+        TOCard.appointment_time >= window_start,
+        TOCard.appointment_time <= window_end
+    ).group_by(TOCard.appointment_time).all())
+    
+    # Слот занят, когда записей в нем столько же, сколько линий у станции
+    capacity = station.capacity_for(category)
+    return {
+        date: [slot for slot in station_time_slots(station, date) if booked.get(slot, 0) < capacity]
+        for date in dates
+    }
+
+def slot_has_capacity(db, station, category, appointment_time):
+    """Проверка свободной линии в слоте перед созданием карточки (в транзакции создания).
+
+    Транзакционная advisory-блокировка на станцию и слот выстраивает одновременные
+    подтверждения в очередь: второе видит карточку первого и не превышает число линий.
+    Блокировка снимается при коммите или откате.
+    """
+    slot_key = int(appointment_time.timestamp() // 60)  # минуты от эпохи помещаются в int4
+    db.execute(text("SELECT pg_advisory_xact_lock(:station_id, :slot_key)"), {
+        "station_id": station.id, "slot_key": slot_key
+    })
+    booked = db.query(func.count(TOCard.id)).filter(
+        TOCard.station_id == station.id,
+        TOCard.category == category,
+        TOCard.status != CardStatus.CANCELLED,
+        TOCard.appointment_time == appointment_time
+    ).scalar()
+    return booked < station.capacity_for(category)
+
+@query_budget(1)
+async def select_time_slot(update: Update, context: ContextTypes.DEFAULT_TYPE, notice: str = None):
+    """Выбор даты для записи на ТО: только даты со свободными слотами.
+
+    notice - пояснение над списком дат (например, что выбранное время успели занять).
+    """
+    # Получаем информацию о станции
+    station_id = context.user_data["station_id"]
+    station = station_catalog.get(station_id)
+    category = context.user_data["booking_category"]
     
-    # Формируем список доступных дат (сегодня и следующие 7 дней)
-    available_dates = [current_date + timedelta(days=i) for i in range(8)]
+    # Формируем список дат (сегодня и следующие 7 дней) и считаем свободные слоты на каждую
+    current_date = datetime.now().date()
+    dates = [current_date + timedelta(days=i) for i in range(BOOKING_WINDOW_DAYS)]
     
-    # Создаем клавиатуру с датами
+    db = next(get_db())
+    try:
+        free_slots = get_free_slots(db, station, category, dates)
+    finally:
+        db.close()
+    
+    # Создаем клавиатуру с датами, на которые еще можно записаться
     keyboard = []
-    for date in available_dates:
+    for date in dates:
+        free_count = len(free_slots[date])
+        if not free_count:
+            continue
         formatted_date = date.strftime("%d.%m.%Y")
         keyboard.append([
-            InlineKeyboardButton(formatted_date, callback_data=f"date_{formatted_date}")
+            InlineKeyboardButton(f"{formatted_date} (свободно: {free_count})", callback_data=f"date_{formatted_date}")
         ])
     
+    if keyboard:
+        message_text = "Выберите дату для записи на ТО:"
+    else:
+        message_text = (
+            f"На ближайшие {BOOKING_WINDOW_DAYS} дней на станции {station.name} нет свободного времени. "
+            "Пожалуйста, выберите другую станцию."
+        )
+    
+    if notice:
+        message_text = f"{notice}\n\n{message_text}"
+    
     # Добавляем кнопку отмены
     keyboard.append([InlineKeyboardButton("Отмена", callback_data="cancel_booking")])
     
@@ -258,18 +338,13 @@ async def select_time_slot(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Отвечаем в зависимости от типа обновления
     if update.callback_query:
-        await update.callback_query.edit_message_text(
-            "Выберите дату для записи на ТО:",
-            reply_markup=reply_markup
-        )
+        await update.callback_query.edit_message_text(message_text, reply_markup=reply_markup)
     else:
-        await update.message.reply_text(
-            "Выберите дату для записи на ТО:",
-            reply_markup=reply_markup
-        )
+        await update.message.reply_text(message_text, reply_markup=reply_markup)
     
     return SELECT_TIME
 
+@query_budget(2)
 async def select_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка выбора даты"""
     query = update.callback_query
@@ -288,52 +363,16 @@ async def select_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Получаем информацию о станции
     station_id = context.user_data["station_id"]
-    station = settings.STO_STATIONS.get(station_id)
-    
-    # Разбираем рабочие часы
-    start_time = datetime.strptime(station.working_hours["start"], "%H:%M").time()
-    end_time = datetime.strptime(station.working_hours["end"], "%H:%M").time()
-    time_slot_minutes = station.time_slot
-    
-    # Создаем список доступных временных слотов
-    time_slots = []
-    current_time = datetime.combine(selected_date, start_time)
-    end_datetime = datetime.combine(selected_date, end_time)
-    
-    while current_time < end_datetime:
-        time_slots.append(current_time.strftime("%H:%M"))
-        current_time += timedelta(minutes=time_slot_minutes)
+    station = station_catalog.get(station_id)
     
-    # Получаем занятые слоты из базы данных
+    # Получаем свободные слоты из базы данных
     db = next(get_db())
     try:
-        # Находим занятые слоты на выбранную дату и станцию
-        selected_date_start = datetime.combine(selected_date, datetime.min.time())
-        selected_date_end = datetime.combine(selected_date, datetime.max.time())
-        
-        booked_slots = db.query(TOCard.appointment_time).filter(
-            TOCard.sto_name == station.name,
-            TOCard.appointment_time >= selected_date_start,
-            TOCard.appointment_time <= selected_date_end
-        ).all()
-        
-        # Преобразуем в список строк с временем
-        booked_times = [slot[0].strftime("%H:%M") for slot in booked_slots]
-        
-        # Удаляем занятые слоты из списка доступных
-        available_slots = [slot for slot in time_slots if slot not in booked_times]
+        free_slots = get_free_slots(db, station, context.user_data["booking_category"], [selected_date])
+        available_slots = [slot.strftime("%H:%M") for slot in free_slots[selected_date]]
         
-        # Если текущий день, удаляем прошедшие слоты
-        if selected_date == datetime.now().date():
-            current_hour_minute = datetime.now().strftime("%H:%M")
-            available_slots = [slot for slot in available_slots if slot > current_hour_minute]
-        
-        # Если нет доступных слотов
+        # Дата успела заполниться после показа списка - заново показываем даты со свободным временем
         if not available_slots:
-            await query.edit_message_text(
-                f"На выбранную дату ({selected_date_str}) нет доступных временных слотов. "
-                "Пожалуйста, выберите другую дату."
-            )
             return await select_time_slot(update, context)
         
         # Создаем клавиатуру с доступными временными слотами
@@ -383,6 +422,12 @@ async def select_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
     appointment_datetime = datetime.strptime(f"{selected_date} {selected_time}", "%d.%m.%Y %H:%M")
     context.user_data["appointment_time"] = appointment_datetime
     
+    # Время выбирается заново после того, как прежний слот заняли: данные клиента уже введены
+    if context.user_data.pop("booking_reselect_time", False):
+        confirmation_text, reply_markup = booking_confirmation(context)
+        await query.edit_message_text(confirmation_text, reply_markup=reply_markup)
+        return CONFIRM_BOOKING
+    
     await query.edit_message_text(
         f"Вы выбрали дату и время: {selected_date} {selected_time}\n\n"
         "Теперь введите имя клиента:"
@@ -395,7 +440,8 @@ async def client_name_handler(update: Update, context: ContextTypes.DEFAULT_TYPE
     client_name = update.message.text
     context.user_data["client_name"] = client_name
     
-    logger.debug(f"User {update.effective_user.id} entered client name: {client_name}")
+    if DEBUG_ENABLED and sampled():
+        logger.debug("User {} entered client name: {}", update.effective_user.id, client_name)
     
     await update.message.reply_text("Введите номер автомобиля:")
     
@@ -406,7 +452,8 @@ async def car_number_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
     car_number = update.message.text
     context.user_data["car_number"] = car_number
     
-    logger.debug(f"User {update.effective_user.id} entered car number: {car_number}")
+    if DEBUG_ENABLED and sampled():
+        logger.debug("User {} entered car number: {}", update.effective_user.id, car_number)
     
     await update.message.reply_text("Введите VIN номер автомобиля:")
     
@@ -417,7 +464,8 @@ async def vin_number_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
     vin_number = update.message.text
     context.user_data["vin_number"] = vin_number
     
-    logger.debug(f"User {update.effective_user.id} entered VIN number: {vin_number}")
+    if DEBUG_ENABLED and sampled():
+        logger.debug("User {} entered VIN number: {}", update.effective_user.id, vin_number)
     
     await update.message.reply_text(
         "Введите номер телефона клиента (на этот номер будет отправлена диагностическая карта):"
@@ -425,13 +473,8 @@ async def vin_number_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
     
     return CLIENT_PHONE
 
-async def client_phone_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обработка ввода номера телефона клиента и формирование карточки ТО"""
-    client_phone = update.message.text
-    context.user_data["client_phone"] = client_phone
-    
-    logger.debug(f"User {update.effective_user.id} entered client phone: {client_phone}")
-    
+def booking_confirmation(context: ContextTypes.DEFAULT_TYPE):
+    """Текст и клавиатура подтверждения бронирования из введенных данных"""
     # Формируем итоговую информацию о бронировании
     category = context.user_data["booking_category"]
     station_name = context.user_data["station_name"]
@@ -442,24 +485,20 @@ async def client_phone_handler(update: Update, context: ContextTypes.DEFAULT_TYP
     defect_type = context.user_data["defect_type"]
     defect_description = context.user_data["defect_description"]
     
-    # Формируем текст подтверждения
-    confirmation_text = (
-        "🔍 Информация о бронировании:\n\n"
-        f"🚗 Категория ТС: {category}\n"
-        f"🏢 СТО: {station_name} ({station_address})\n"
-        f"📅 Дата и время: {appointment_time.strftime('%d.%m.%Y %H:%M')}\n"
-        f"💰 Стоимость: {total_price} руб.\n\n"
-        f"👤 Имя клиента: {context.user_data['client_name']}\n"
-        f"🚘 Номер автомобиля: {context.user_data['car_number']}\n"
-        f"🔢 VIN номер: {context.user_data['vin_number']}\n"
-        f"📱 Телефон клиента: {client_phone}\n"
-    )
-    
-    if has_defects:
-        confirmation_text += f"\n🔧 Дефекты: {defect_type}\n"
-        confirmation_text += f"📝 Описание: {defect_description}\n"
-    else:
-        confirmation_text += "\n✅ Дефекты отсутствуют\n"
+    # Формируем текст подтверждения (черновик карточки без номера и статуса)
+    confirmation_text = render_card(CardRow(
+        appointment_time=appointment_time,
+        category=category,
+        sto_name=f"{station_name} ({station_address})",
+        total_price=total_price,
+        client_name=context.user_data["client_name"],
+        car_number=context.user_data["car_number"],
+        vin_number=context.user_data["vin_number"],
+        client_phone=context.user_data["client_phone"],
+        has_defects=has_defects,
+        defect_type=defect_type,
+        defect_description=defect_description
+    ))
     
     # Создаем клавиатуру для подтверждения бронирования
     keyboard = [
@@ -469,8 +508,17 @@ async def client_phone_handler(update: Update, context: ContextTypes.DEFAULT_TYP
         ]
     ]
     
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    return confirmation_text, InlineKeyboardMarkup(keyboard)
+
+async def client_phone_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обработка ввода номера телефона клиента и формирование карточки ТО"""
+    client_phone = update.message.text
+    context.user_data["client_phone"] = client_phone
     
+    if DEBUG_ENABLED and sampled():
+        logger.debug("User {} entered client phone: {}", update.effective_user.id, client_phone)
+    
+    confirmation_text, reply_markup = booking_confirmation(context)
     await update.message.reply_text(
         confirmation_text,
         reply_markup=reply_markup
@@ -478,6 +526,7 @@ async def client_phone_handler(update: Update, context: ContextTypes.DEFAULT_TYP
     
     return CONFIRM_BOOKING
 
+@query_budget(5)
 async def confirm_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Подтверждение бронирования и создание карточки ТО"""
     query = update.callback_query
@@ -500,6 +549,19 @@ async def confirm_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await query.edit_message_text("Ошибка: Агент не найден. Пожалуйста, пройдите регистрацию заново.")
             return ConversationHandler.END
         
+        # Последнюю линию слота мог занять другой агент, пока этот вводил данные клиента
+        station = station_catalog.get(context.user_data["station_id"])
+        category = context.user_data["booking_category"]
+        appointment_time = context.user_data["appointment_time"]
+        if not slot_has_capacity(db, station, category, appointment_time):
+            db.rollback()
+            logger.info(f"User {user_id} lost slot {appointment_time} at {station.code} ({category})")
+            context.user_data["booking_reselect_time"] = True
+            return await select_time_slot(
+                update, context,
+                notice=f"⚠️ Время {appointment_time.strftime('%d.%m.%Y %H:%M')} уже занято. Выберите другое время."
+            )
+        
         # Получаем количество записей этого агента за сегодня
         today_start = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
         today_bookings_count = db.query(TOCard).filter(
@@ -514,22 +576,24 @@ async def confirm_booking(update: Update, context: ContextTypes.DEFAULT_TYPE):
         to_card = TOCard(
             card_number=booking_number,
             agent_id=agent.id,
-            category=context.user_data["booking_category"],
+            category=category,
+            station_id=station.id,
             sto_name=context.user_data["station_name"],
             has_defects=context.user_data["has_defects"],
             defect_type=context.user_data["defect_type"],
             defect_description=context.user_data["defect_description"],
-            appointment_time=context.user_data["appointment_time"],
+            appointment_time=appointment_time,
             client_name=context.user_data["client_name"],
             car_number=context.user_data["car_number"],
             vin_number=context.user_data["vin_number"],
             client_phone=context.user_data["client_phone"],
             total_price=context.user_data["total_price"],
-            status="pending"
+            status=CardStatus.PENDING
         )
         
         db.add(to_card)
         db.commit()
+        pin_to_primary(user_id)
         
         logger.info(f"User {user_id} created TO card: {booking_number}")
         
@@ -636,5 +700,6 @@ def get_booking_handler():
             CommandHandler("cancel", cancel),
             CallbackQueryHandler(cancel, pattern=r'^cancel_booking$')
         ],
-        name="booking"
+        name="booking",
+        persistent=settings.BOT_WORKERS > 1
     ) 
\ No newline at end of file
@@ -0,0 +1,149 @@
+"""Текст карточки ТО для всех экранов бота.
+
+Экраны выбирают из БД только нужные колонки (card_columns) и получают
+CardRow вместо ORM-объекта. Готовый текст кэшируется по id и версии карточки,
+поэтому повторный просмотр неизменной карточки не форматирует ее заново.
+"""
+import threading
+from collections import OrderedDict, namedtuple
+from database.models import CardStatus
+
+CARD_VIEW_FIELDS = (
+    "id", "card_number", "created_at", "appointment_time", "category", "sto_name", "total_price",
+    "client_name", "car_number", "vin_number", "client_phone",
+    "has_defects", "defect_type", "defect_description", "status", "admin_comment", "version",
+)
+
+# Сколько отформатированных карточек держать в памяти процесса
+CARD_CACHE_SIZE = 4096
+
+CardRow = namedtuple("CardRow", CARD_VIEW_FIELDS, defaults=(None,) * len(CARD_VIEW_FIELDS))
+
+def card_columns(source):
+    """Колонки для CardRow из модели (TOCard) или подзапроса (agent_cards(...).c)"""
+    return [getattr(source, field) for field in CARD_VIEW_FIELDS]
+
+def card_row(row) -> CardRow:
+    """CardRow из строки запроса по card_columns (лишние колонки в конце отбрасываются)"""
+    return CardRow._make(tuple(row)[:len(CARD_VIEW_FIELDS)])
+
+def card_row_from_model(card) -> CardRow:
+    """CardRow из ORM-объекта (для экранов, которые только что изменили карточку)"""
+    return CardRow._make(getattr(card, field) for field in CARD_VIEW_FIELDS)
+
+# Кэш текстов: (id, версия, вид) -> текст. Экраны рендерятся в пуле потоков
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+def _cached(card: CardRow, key, build):
+    """Текст из кэша по id и версии карточки; черновики (без id) не кэшируются"""
+    if card.id is None or card.version is None:
+        return build()
+
+    key = (card.id, card.version) + key
+    with _cache_lock:
+        text = _cache.get(key)
+        if text is not None:
+            _cache.move_to_end(key)
+            return text
+
+    text = build()
+    with _cache_lock:
+        _cache[key] = text
+        if len(_cache) > CARD_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return text
+
+def parse_card_callback(data: str):
+    """approve_card_12_3 -> (12, 3); кнопки без версии (approve_card_12) -> (12, None)"""
+    parts = data.split("_")
+    card_id = int(parts[2])
+    version = int(parts[3]) if len(parts) > 3 else None
+    return card_id, version
+
+def _datetime(value):
+    return value.strftime("%d.%m.%Y %H:%M")
+
+def _defects(card: CardRow, indent: str = ""):
+    if not card.has_defects:
+        return f"{indent}✅ Дефекты отсутствуют\n"
+    text = f"{indent}🔧 Дефекты: {card.defect_type}\n"
+    if card.defect_description:
+        text += f"{indent}📝 Описание дефектов: {card.defect_description}\n"
+    return text
+
+def _status(card: CardRow, indent: str = "", admin: bool = False):
+    text = f"{indent}🔄 Статус: {CardStatus(card.status).label}\n"
+    # Агенту комментарий администратора показываем только как причину отклонения
+    if card.admin_comment and (admin or card.status == CardStatus.REJECTED):
+        title = "Комментарий администратора" if admin else "Причина отклонения"
+        text += f"{indent}💬 {title}: {card.admin_comment}\n"
+    return text
+
+def _render_card(card: CardRow, agent_name, admin: bool):
+    if card.card_number:
+        text = f"📋 Карточка ТО №{card.card_number}\n\n"
+    else:
+        text = "🔍 Информация о бронировании:\n\n"
+
+    if agent_name is not None:
+        text += f"👤 Агент: {agent_name}\n"
+    text += f"📅 Дата и время записи: {_datetime(card.appointment_time)}\n"
+    if card.created_at:
+        text += f"📆 Создана: {_datetime(card.created_at)}\n"
+    text += (
+        f"🚗 Категория: {card.category}\n"
+        f"🏢 СТО: {card.sto_name}\n"
+        f"💰 Стоимость: {card.total_price:.2f} руб.\n\n"
+        f"👤 Клиент: {card.client_name}\n"
+        f"🚘 Номер авто: {card.car_number}\n"
+        f"🔢 VIN: {card.vin_number}\n"
+        f"📱 Телефон: {card.client_phone}\n\n"
+    )
+    text += _defects(card) + "\n"
+    if card.status:
+        text += _status(card, admin=admin)
+    return text
+
+def render_card(card: CardRow, agent_name: str = None, admin: bool = False):
+    """Полная карточка: просмотр агентом, редактирование администратором, подтверждение записи"""
+    return _cached(card, ("full", agent_name, admin), lambda: _render_card(card, agent_name, admin))
+
+def _render_card_summary(card: CardRow, show_status: bool, show_client: bool):
+    text = (
+        f"Карточка ТО №{card.card_number}\n"
+        f"   📅 Дата и время: {_datetime(card.appointment_time)}\n"
+    )
+    if show_client:
+        text += f"   📆 Создана: {_datetime(card.created_at)}\n"
+    text += (
+        f"   🚗 Категория: {card.category}\n"
+        f"   🏢 СТО: {card.sto_name}\n"
+        f"   💰 Стоимость: {card.total_price:.2f} руб.\n"
+    )
+    if show_client:
+        text += (
+            f"   👤 Клиент: {card.client_name}\n"
+            f"   🚘 Номер авто: {card.car_number}\n"
+            f"   📱 Телефон: {card.client_phone}\n"
+        )
+        text += _defects(card, "   ")
+    if show_status:
+        text += _status(card, "   ")
+    return text
+
+def render_card_summary(card: CardRow, index: int = None, show_status: bool = True, show_client: bool = False):
+    """Краткая карточка для списков (активные записи, архив, очередь согласования)"""
+    text = _cached(
+        card, ("summary", show_status, show_client),
+        lambda: _render_card_summary(card, show_status, show_client)
+    )
+    return f"{index}. {text}" if index is not None else text
+
+def render_conflict(card):
+    """Сообщение о том, что карточку успели изменить, пока пользователь на нее смотрел"""
+    return (
+        f"⚠️ Карточку ТО №{card.card_number} уже изменил другой пользователь.\n"
+        f"Текущий статус: {CardStatus(card.status).label}\n\n"
+        "Действие не выполнено. Откройте карточку заново и повторите действие, если оно еще нужно."
+    )
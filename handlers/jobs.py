@@ -0,0 +1,179 @@
+"""Периодические задачи бота (JobQueue): выполняются только в воркере 0"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import bindparam, text
+from telegram.error import TelegramError
+from telegram.ext import Application, ContextTypes
+from config import settings
+from database.database import engine
+from database.models import CardStatus
+from utils.cluster import is_primary_worker
+from utils.logger import logger
+
+# Статусы карточек, о записях по которым напоминаем
+REMINDER_STATUSES = (CardStatus.PENDING, CardStatus.APPROVED)
+
+# Карточки в окне напоминаний помечаются и возвращаются одним оператором.
+# Время записи хранится по часам бота (datetime.now() при бронировании), поэтому
+# текущий момент передается из приложения (:now), а не берется из часов БД.
+# Подзапрос идет по частичному индексу ix_to_cards_reminder_due, поэтому
+# стоимость пропорциональна числу записей в окне, а не размеру таблицы;
+# SKIP LOCKED не дает задаче ждать карточки, которые сейчас меняет администратор.
+CLAIM_REMINDERS = text("""
+    WITH due AS (
+        UPDATE to_cards SET reminder_sent_at = :now
+        WHERE id IN (
+            SELECT id FROM to_cards
+            WHERE status IN :statuses
+              AND reminder_sent_at IS NULL
+              AND appointment_time > :now
+              AND appointment_time <= :now + make_interval(hours => :hours)
+            ORDER BY appointment_time
+            LIMIT :batch_size
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING agent_id, card_number, appointment_time, sto_name, car_number, client_name, status
+    )
+    SELECT agents.telegram_id, due.card_number, due.appointment_time, due.sto_name,
+           due.car_number, due.client_name, due.status
+    FROM due JOIN agents ON agents.id = due.agent_id
+    ORDER BY agents.telegram_id, due.appointment_time
+""").bindparams(bindparam("statuses", [status.value for status in REMINDER_STATUSES], expanding=True))
+
+# Несогласованные карточки с прошедшим временем записи переводятся в expired
+# пачками: подзапрос идет по частичному индексу ix_to_cards_pending_appointment,
+# каждая пачка - отдельная короткая транзакция. Граница (:cutoff) и время
+# изменения считаются в приложении, как и время записи.
+EXPIRE_PENDING = text("""
+    WITH expired AS (
+        UPDATE to_cards SET status = 'expired', version = version + 1, updated_at = :updated_at
+        WHERE id IN (
+            SELECT id FROM to_cards
+            WHERE status = 'pending'
+              AND appointment_time < :cutoff
+            ORDER BY appointment_time
+            LIMIT :batch_size
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING agent_id, card_number, appointment_time, sto_name, car_number, client_name
+    )
+    SELECT agents.telegram_id, expired.card_number, expired.appointment_time, expired.sto_name,
+           expired.car_number, expired.client_name
+    FROM expired JOIN agents ON agents.id = expired.agent_id
+""")
+
+def _by_agent(rows, grouped=None):
+    """Группировка строк карточек по telegram_id агента"""
+    grouped = defaultdict(list) if grouped is None else grouped
+    for row in rows:
+        grouped[row.telegram_id].append(row)
+    return grouped
+
+def claim_reminders(hours: int, batch_size: int):
+    """Отметка карточек, о которых пора напомнить: {telegram_id агента: [карточки]}.
+
+    Отметка делается до отправки: при сбое отправки напоминание теряется,
+    но никогда не приходит дважды.
+    """
+    with engine.begin() as connection:
+        rows = connection.execute(
+            CLAIM_REMINDERS, {"now": datetime.now(), "hours": hours, "batch_size": batch_size}
+        ).all()
+    return _by_agent(rows)
+
+def expire_pending_cards(grace_hours: int, batch_size: int):
+    """Перевод просроченных карточек в expired: (число карточек, {telegram_id агента: [карточки]})"""
+    expired = defaultdict(list)
+    total = 0
+    cutoff = datetime.now() - timedelta(hours=grace_hours)
+    while True:
+        with engine.begin() as connection:
+            rows = connection.execute(EXPIRE_PENDING, {
+                "cutoff": cutoff, "updated_at": datetime.utcnow(), "batch_size": batch_size
+            }).all()
+        _by_agent(rows, expired)
+        total += len(rows)
+        if len(rows) < batch_size:
+            break
+    return total, expired
+
+def format_reminder(cards):
+    """Одно сообщение агенту обо всех его ближайших записях"""
+    lines = ["⏰ Напоминание о предстоящих записях на ТО:", ""]
+    for card in cards:
+        lines.append(
+            f"📋 №{card.card_number} - {card.appointment_time.strftime('%d.%m.%Y %H:%M')}\n"
+            f"🏢 СТО: {card.sto_name}\n"
+            f"🚗 {card.car_number}, {card.client_name}\n"
+            f"Статус: {CardStatus(card.status).label}\n"
+        )
+    lines.append("Пожалуйста, напомните клиенту о визите.")
+    return "\n".join(lines)
+
+async def send_reminders(context: ContextTypes.DEFAULT_TYPE):
+    """Задача JobQueue: напоминания агентам о записях в ближайшие REMINDER_HOURS_BEFORE часов"""
+    sent = 0
+    while True:
+        reminders = claim_reminders(settings.REMINDER_HOURS_BEFORE, settings.REMINDER_BATCH_SIZE)
+        sent += await send_messages(
+            context, {telegram_id: format_reminder(cards) for telegram_id, cards in reminders.items()}
+        )
+        if sum(len(cards) for cards in reminders.values()) < settings.REMINDER_BATCH_SIZE:
+            break
+
+    if sent:
+        logger.info(f"Sent appointment reminders to {sent} agents")
+
+def format_expired(cards):
+    """Одно сообщение агенту обо всех его просроченных карточках"""
+    lines = ["⌛ Время записи прошло, а карточки не были согласованы:", ""]
+    for card in cards:
+        lines.append(
+            f"📋 №{card.card_number} - {card.appointment_time.strftime('%d.%m.%Y %H:%M')}, "
+            f"{card.sto_name}, {card.car_number}"
+        )
+    lines += ["", "Карточки закрыты со статусом «Просрочено» и видны в архиве. При необходимости запишите клиента заново."]
+    return "\n".join(lines)
+
+async def send_messages(context: ContextTypes.DEFAULT_TYPE, messages):
+    """Отправка сообщений агентам {telegram_id: текст}: ошибка одному не мешает остальным"""
+    sent = 0
+    for telegram_id, message_text in messages.items():
+        try:
+            await context.bot.send_message(chat_id=telegram_id, text=message_text)
+            sent += 1
+        except TelegramError as e:
+            logger.warning(f"Failed to send message to {telegram_id}: {e}")
+    return sent
+
+async def expire_stale_cards(context: ContextTypes.DEFAULT_TYPE):
+    """Задача JobQueue: просрочка несогласованных карточек и одно уведомление каждому агенту"""
+    total, expired = expire_pending_cards(settings.EXPIRY_GRACE_HOURS, settings.EXPIRY_BATCH_SIZE)
+    if not total:
+        return
+
+    notified = await send_messages(
+        context, {telegram_id: format_expired(cards) for telegram_id, cards in expired.items()}
+    )
+    logger.info(f"Expired {total} pending TO cards, notified {notified} of {len(expired)} agents")
+
+def schedule_jobs(application: Application):
+    """Регистрация периодических задач (в режиме нескольких воркеров - только в воркере 0)"""
+    if not is_primary_worker():
+        return
+
+    if settings.REMINDERS_ENABLED:
+        application.job_queue.run_repeating(
+            send_reminders,
+            interval=timedelta(minutes=settings.REMINDER_INTERVAL_MINUTES),
+            first=timedelta(seconds=10),
+            name="appointment_reminders"
+        )
+
+    if settings.EXPIRY_ENABLED:
+        application.job_queue.run_repeating(
+            expire_stale_cards,
+            interval=timedelta(minutes=settings.EXPIRY_INTERVAL_MINUTES),
+            first=timedelta(seconds=30),
+            name="expire_pending_cards"
+        )
@@ -1,13 +1,23 @@
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from utils.logger import logger
+from utils.logger import logger, DEBUG_ENABLED, sampled
 from utils.roles import registered_required, admin_required, get_user_role
 from database.models import UserRole
 from database.database import get_db
-from handlers.admin import admin_agents_list, agent_details, agent_info, agent_action, agent_archive
 from handlers.my_bookings import show_my_bookings, view_card_details
 from handlers.archive import show_archive
-from handlers.admin_approvals import show_pending_approvals, handle_approve_card
+from utils.lazy import lazy_callback
+from utils.replies import edit_if_changed, show_screen
+
+# Админ-модули нужны редко и импортируются при первом обращении
+admin_agents_list = lazy_callback("handlers.admin.admin_agents_list")
+agent_details = lazy_callback("handlers.admin.agent_details")
+agent_info = lazy_callback("handlers.admin.agent_info")
+agent_action = lazy_callback("handlers.admin.agent_action")
+agent_archive = lazy_callback("handlers.admin.agent_archive")
+show_pending_approvals = lazy_callback("handlers.admin_approvals.show_pending_approvals")
+handle_approve_card = lazy_callback("handlers.admin_approvals.handle_approve_card")
+show_next_card = lazy_callback("handlers.admin_approvals.show_next_card")
 
 @registered_required
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -82,6 +92,9 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
             InlineKeyboardButton("Согласование", callback_data="admin_approve"),
             InlineKeyboardButton("Список агентов", callback_data="admin_agents_list")
         ],
+        [
+            InlineKeyboardButton("▶️ Следующая карточка", callback_data="review_next")
+        ],
         [
             InlineKeyboardButton("Вернуться в главное меню", callback_data="back_to_main")
         ]
@@ -89,35 +102,38 @@ async def admin_panel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    # Отвечаем в зависимости от типа обновления
-    if update.callback_query:
-        await update.callback_query.edit_message_text(
-            "Панель администратора - выберите действие:",
-            reply_markup=reply_markup
-        )
-    else:
-        await update.message.reply_text(
-            "Панель администратора - выберите действие:",
-            reply_markup=reply_markup
-        )
+    # Отвечаем в зависимости от типа обновления (без лишней правки, если панель уже показана)
+    await show_screen(update, "Панель администратора - выберите действие:", reply_markup)
 
 async def handle_menu_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик нажатий на кнопки меню"""
     query = update.callback_query
-    await query.answer()
-    
     user_id = update.effective_user.id
     callback_data = query.data
-    logger.debug(f"User {user_id} clicked {callback_data}")
+    if DEBUG_ENABLED and sampled():
+        logger.debug("User {} clicked {}", user_id, callback_data)
+    
+    # Экраны просмотра сами отвечают на нажатие параллельно с запросами к БД
+    if callback_data == "admin_approve":
+        return await show_pending_approvals(update, context)
+    if callback_data.startswith("approvals_page_"):
+        return await show_pending_approvals(update, context, int(callback_data.split("_")[2]))
+    if callback_data in ("review_next", "review_skip"):
+        return await show_next_card(update, context, skip=callback_data == "review_skip")
+    if callback_data == "my_bookings":
+        return await show_my_bookings(update, context)
+    if callback_data.startswith("view_card_"):
+        return await view_card_details(update, context)
+    if callback_data == "archive":
+        return await show_archive(update, context)
+    if callback_data.startswith("archive_page_"):
+        return await show_archive(update, context, int(callback_data.split("_")[2]))
+    
+    await query.answer()
     
     # Обработка кнопок меню
     if callback_data == "admin_panel":
         await admin_panel(update, context)
-    elif callback_data == "admin_approve":
-        await show_pending_approvals(update, context)
-    elif callback_data.startswith("approvals_page_"):
-        page = int(callback_data.split("_")[2])
-        await show_pending_approvals(update, context, page)
     elif callback_data.startswith("approve_card_"):
         await handle_approve_card(update, context)
     elif callback_data == "admin_agents_list":
@@ -139,15 +155,6 @@ async def handle_menu_callback(update: Update, context: ContextTypes.DEFAULT_TYP
             await agent_archive(update, context)
     elif callback_data.startswith("agent_action_"):
         await agent_action(update, context)
-    elif callback_data == "my_bookings":
-        await show_my_bookings(update, context)
-    elif callback_data.startswith("view_card_"):
-        await view_card_details(update, context)
-    elif callback_data == "archive":
-        await show_archive(update, context)
-    elif callback_data.startswith("archive_page_"):
-        page = int(callback_data.split("_")[2])
-        await show_archive(update, context, page)
     elif callback_data == "back_to_main":
         # Определяем роль пользователя
         db = next(get_db())
@@ -186,7 +193,8 @@ async def handle_menu_callback(update: Update, context: ContextTypes.DEFAULT_TYP
             
             reply_markup = InlineKeyboardMarkup(keyboard)
             
-            await query.edit_message_text(
+            await edit_if_changed(
+                query,
                 "Главное меню - выберите действие:",
                 reply_markup=reply_markup
             )
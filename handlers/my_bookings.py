@@ -6,71 +6,49 @@ from telegram.ext import (
     MessageHandler,
     filters
 )
+from config import settings
 from utils.logger import logger
 from utils.roles import registered_required
-from database.database import get_db
-from database.models import Agent, TOCard, Payment
-from sqlalchemy import func
-from datetime import datetime
+from utils.query_budget import query_budget
+from utils.replies import answer_while, edit_if_changed, show_screen
+from database.database import get_db, get_read_db, pin_to_primary
+from database.models import Agent, TOCard, CardStatus
+from handlers.user_handler import get_agent_card_stats, get_agent_balance
+from database.cards import update_card_if_unchanged
+from handlers.card_view import (
+    card_columns, card_row, parse_card_callback, render_card, render_card_summary, render_conflict
+)
 
 # Состояния для ConversationHandler
 CANCEL_CONFIRM = range(1)
 
-@registered_required
-async def show_my_bookings(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Показать активные записи пользователя"""
-    user_id = update.effective_user.id
-    logger.info(f"User {user_id} requested active bookings")
-    
-    # Определяем, вызвана функция из колбэка или напрямую
-    query = update.callback_query
-    if query:
-        await query.answer()
-    
-    db = next(get_db())
+def render_my_bookings(user_id: int):
+    """Текст и клавиатура экрана активных записей (синхронно, выполняется в потоке)"""
+    db = next(get_read_db(user_id))
     try:
         # Получаем информацию об агенте
         agent = db.query(Agent).filter(Agent.telegram_id == user_id).first()
         if not agent:
-            message_text = "Ошибка: не удалось найти информацию о вашем профиле. Пожалуйста, перерегистрируйтесь."
-            if query:
-                await query.edit_message_text(message_text)
-            else:
-                await update.message.reply_text(message_text)
-            return
+            return "Ошибка: не удалось найти информацию о вашем профиле. Пожалуйста, перерегистрируйтесь.", None
         
         # Получаем активные записи агента (со статусом pending)
-        active_bookings = db.query(TOCard).filter(
+        active_bookings = db.query(*card_columns(TOCard)).filter(
             TOCard.agent_id == agent.id,
-            TOCard.status == "pending"
+            TOCard.status == CardStatus.PENDING
         ).order_by(TOCard.appointment_time).all()
         
+        # Суммы по статусам одним запросом (одобренные карточки могут быть уже в архиве)
+        stats = get_agent_card_stats(db, agent.id)
+        
         # Получаем сумму всех активных записей
-        active_sum = db.query(func.sum(TOCard.total_price)).filter(
-            TOCard.agent_id == agent.id,
-            TOCard.status == "pending"
-        ).scalar() or 0
+        active_sum = stats.get(CardStatus.PENDING, (0, 0))[1]
         
         # Рассчитываем баланс согласно требованиям ТЗ:
         # (сумма всех карточек ТО, которые имеют согласование об успешности прохождения от администратора 
         # минус комиссия агента и минус сумма выплат)
-        
-        # Сумма всех одобренных ТО
-        approved_sum = db.query(func.sum(TOCard.total_price)).filter(
-            TOCard.agent_id == agent.id,
-            TOCard.status == "approved"
-        ).scalar() or 0
-        
-        # Рассчитываем комиссионные
-        commission = approved_sum * (agent.commission_rate / 100)
-        
-        # Получаем сумму всех платежей
-        payments_sum = db.query(func.sum(Payment.amount)).filter(
-            Payment.agent_id == agent.id
-        ).scalar() or 0
-        
-        # Рассчитываем баланс
-        balance = approved_sum - commission - payments_sum
+        approved_sum, commission, payments_sum, balance = get_agent_balance(
+            db, agent.id, agent.commission_rate, stats
+        )
         
         # Формируем сообщение - самой первой строкой отображаем баланс агента
         message_text = f"💰 Баланс: {balance:.2f} руб.\n"
@@ -89,17 +67,8 @@ async def show_my_bookings(update: Update, context: ContextTypes.DEFAULT_TYPE):
             # Создаем клавиатуру с кнопками для просмотра карточек и возврата в меню
             keyboard = []
             
-            for i, booking in enumerate(active_bookings, 1):
-                # Форматируем дату и время
-                appointment_time = booking.appointment_time.strftime("%d.%m.%Y %H:%M")
-                
-                message_text += (
-                    f"{i}. Карточка ТО №{booking.card_number}\n"
-                    f"   📅 Дата и время: {appointment_time}\n"
-                    f"   🚗 Категория: {booking.category}\n"
-                    f"   🏢 СТО: {booking.sto_name}\n"
-                    f"   💰 Стоимость: {booking.total_price:.2f} руб.\n"
-                )
+            for i, booking in enumerate(map(card_row, active_bookings), 1):
+                message_text += render_card_summary(booking, i, show_status=False)
                 
                 # Добавляем кнопку для просмотра подробной информации о карточке
                 keyboard.append([
@@ -109,96 +78,71 @@ async def show_my_bookings(update: Update, context: ContextTypes.DEFAULT_TYPE):
             keyboard.append([InlineKeyboardButton("Вернуться в главное меню", callback_data="back_to_main")])
             reply_markup = InlineKeyboardMarkup(keyboard)
         
-        # Отвечаем в зависимости от способа вызова
-        if query:
-            await query.edit_message_text(message_text, reply_markup=reply_markup)
-        else:
-            await update.message.reply_text(message_text, reply_markup=reply_markup)
+        return message_text, reply_markup
             
     finally:
         db.close()
 
+@query_budget(6)
 @registered_required
-async def view_card_details(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Отображение подробной информации о карточке ТО"""
-    query = update.callback_query
-    await query.answer()
-    
-    # Получаем ID карточки из данных callback
-    card_id = int(query.data.split("_")[2])
+async def show_my_bookings(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показать активные записи пользователя"""
+    user_id = update.effective_user.id
+    logger.info(f"User {user_id} requested active bookings")
     
+    # Ответ на нажатие кнопки идет параллельно с запросами к БД
+    message_text, reply_markup = await answer_while(update.callback_query, render_my_bookings, user_id)
+    await show_screen(update, message_text, reply_markup)
+
+def render_card_details(card_id: int):
+    """Текст и клавиатура подробной информации о карточке ТО (синхронно, выполняется в потоке)"""
     db = next(get_db())
     try:
         # Получаем карточку ТО
-        card = db.query(TOCard).filter(TOCard.id == card_id).first()
-        if not card:
-            await query.edit_message_text(
-                "Ошибка: карточка ТО не найдена.",
-                reply_markup=InlineKeyboardMarkup([[
-                    InlineKeyboardButton("Вернуться к моим записям", callback_data="my_bookings")
-                ]])
-            )
-            return
-        
-        # Форматируем дату и время
-        appointment_time = card.appointment_time.strftime("%d.%m.%Y %H:%M")
-        created_at = card.created_at.strftime("%d.%m.%Y %H:%M")
-        
-        # Формируем подробную информацию о карточке
-        message_text = (
-            f"📋 Карточка ТО №{card.card_number}\n\n"
-            f"📅 Дата и время записи: {appointment_time}\n"
-            f"📆 Создана: {created_at}\n"
-            f"🚗 Категория: {card.category}\n"
-            f"🏢 СТО: {card.sto_name}\n"
-            f"💰 Стоимость: {card.total_price:.2f} руб.\n\n"
-            f"👤 Клиент: {card.client_name}\n"
-            f"🚘 Номер авто: {card.car_number}\n"
-            f"🔢 VIN: {card.vin_number}\n"
-            f"📱 Телефон: {card.client_phone}\n\n"
-        )
-        
-        if card.has_defects:
-            message_text += f"🔧 Дефекты: {card.defect_type}\n"
-            if card.defect_description:
-                message_text += f"📝 Описание дефектов: {card.defect_description}\n\n"
-        else:
-            message_text += "✅ Дефекты отсутствуют\n\n"
-        
-        message_text += f"🔄 Статус: {get_status_text(card.status)}\n"
+        row = db.query(*card_columns(TOCard)).filter(TOCard.id == card_id).first()
+        if not row:
+            return "Ошибка: карточка ТО не найдена.", InlineKeyboardMarkup([[
+                InlineKeyboardButton("Вернуться к моим записям", callback_data="my_bookings")
+            ]])
+        card = card_row(row)
         
-        if card.status == "rejected" and card.admin_comment:
-            message_text += f"💬 Комментарий администратора: {card.admin_comment}\n"
+        message_text = render_card(card)
         
         # Создаем клавиатуру с кнопками для возврата и, если карточка в статусе pending, для отмены
         keyboard = []
         
-        if card.status == "pending":
+        if card.status == CardStatus.PENDING:
             keyboard.append([
-                InlineKeyboardButton("❌ Отменить запись", callback_data=f"cancel_card_{card.id}")
+                InlineKeyboardButton("❌ Отменить запись", callback_data=f"cancel_card_{card.id}_{card.version}")
             ])
         
         keyboard.append([InlineKeyboardButton("Назад к моим записям", callback_data="my_bookings")])
         keyboard.append([InlineKeyboardButton("Вернуться в главное меню", callback_data="back_to_main")])
         
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await query.edit_message_text(
-            message_text,
-            reply_markup=reply_markup
-        )
+        return message_text, InlineKeyboardMarkup(keyboard)
         
     finally:
         db.close()
 
+@registered_required
+async def view_card_details(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отображение подробной информации о карточке ТО"""
+    query = update.callback_query
+    
+    # Получаем ID карточки из данных callback
+    card_id = int(query.data.split("_")[2])
+    
+    message_text, reply_markup = await answer_while(query, render_card_details, card_id)
+    await edit_if_changed(query, message_text, reply_markup)
+
 @registered_required
 async def start_cancel_card(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Начало процесса отмены карточки ТО"""
     query = update.callback_query
     await query.answer()
     
-    # Получаем ID карточки из данных callback
-    card_id = int(query.data.split("_")[2])
+    # Получаем ID карточки и версию, которую видел агент
+    card_id, version = parse_card_callback(query.data)
     context.user_data["cancel_card_id"] = card_id
     
     db = next(get_db())
@@ -214,8 +158,18 @@ async def start_cancel_card(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return ConversationHandler.END
         
+        # Карточку уже изменил администратор, пока агент на нее смотрел
+        if version is not None and card.version != version:
+            await query.edit_message_text(
+                render_conflict(card),
+                reply_markup=InlineKeyboardMarkup([[
+                    InlineKeyboardButton("Открыть карточку", callback_data=f"view_card_{card_id}")
+                ]])
+            )
+            return ConversationHandler.END
+        
         # Проверяем статус карточки
-        if card.status != "pending":
+        if card.status != CardStatus.PENDING:
             await query.edit_message_text(
                 "Ошибка: отменить можно только карточки в статусе 'Ожидает согласования'.",
                 reply_markup=InlineKeyboardMarkup([[
@@ -224,6 +178,9 @@ async def start_cancel_card(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return ConversationHandler.END
         
+        # Версия проверяется еще раз при подтверждении отмены
+        context.user_data["cancel_card_version"] = card.version
+        
         # Создаем клавиатуру для подтверждения отмены
         keyboard = [
             [
@@ -298,10 +255,21 @@ async def confirm_cancel_card(update: Update, context: ContextTypes.DEFAULT_TYPE
             )
             return ConversationHandler.END
         
-        # Обновляем статус карточки на "отменено"
-        card.status = "cancelled"
-        card.admin_comment = "Отменено агентом"
+        # Отменяем, только если карточку не согласовали и не изменили с момента показа
+        if not update_card_if_unchanged(
+            db, card_id, context.user_data.get("cancel_card_version"),
+            status=CardStatus.CANCELLED, admin_comment="Отменено агентом"
+        ):
+            db.rollback()
+            await query.edit_message_text(
+                render_conflict(card),
+                reply_markup=InlineKeyboardMarkup([[
+                    InlineKeyboardButton("Открыть карточку", callback_data=f"view_card_{card_id}")
+                ]])
+            )
+            return ConversationHandler.END
         db.commit()
+        pin_to_primary(update.effective_user.id)
         
         logger.info(f"User {update.effective_user.id} cancelled TO card {card.card_number}")
         
@@ -332,21 +300,11 @@ async def confirm_cancel_card(update: Update, context: ContextTypes.DEFAULT_TYPE
     finally:
         db.close()
 
-def get_status_text(status):
-    """Преобразование статуса в читаемый текст"""
-    status_texts = {
-        "pending": "🕒 Ожидает согласования",
-        "approved": "✅ Согласовано",
-        "rejected": "❌ Отклонено",
-        "cancelled": "🚫 Отменено"
-    }
-    return status_texts.get(status, status)
-
 def get_booking_cancel_handler():
     """Создание обработчика разговора для отмены карточек ТО"""
     return ConversationHandler(
         entry_points=[
-            CallbackQueryHandler(start_cancel_card, pattern=r'^cancel_card_\d+$')
+            CallbackQueryHandler(start_cancel_card, pattern=r'^cancel_card_\d+(_\d+)?$')
         ],
         states={
             CANCEL_CONFIRM: [
@@ -354,5 +312,6 @@ def get_booking_cancel_handler():
             ]
         },
         fallbacks=[],
-        name="booking_cancel_handler"
-    ) 
\ No newline at end of file
+        name="booking_cancel_handler",
+        persistent=settings.BOT_WORKERS > 1
+    ) 
@@ -0,0 +1,229 @@
+import csv
+import hashlib
+import io
+from collections import defaultdict
+from telegram import Update
+from telegram.error import TelegramError
+from telegram.ext import ContextTypes
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from utils.logger import logger
+from utils.roles import admin_required
+from utils.query_budget import query_budget
+from utils.executors import run_cpu
+from database.database import get_db, pin_to_primary
+from database.models import Agent, Payment, PaymentImport
+from handlers.user_handler import get_agents_balances
+
+# Колонка с идентификатором агента определяет, по какому полю его искать
+AGENT_COLUMNS = {"agent_id": "id", "telegram_id": "telegram_id"}
+MAX_FILE_SIZE = 1024 * 1024
+# Сколько ошибок показывать администратору
+MAX_REPORTED_ERRORS = 20
+# Ограничение Telegram на длину сообщения с запасом
+MAX_MESSAGE_LENGTH = 4000
+DEFAULT_COMMENT = "Импорт из CSV"
+# Слово в подписи, разрешающее повторный импорт того же файла
+FORCE_FLAG = "force"
+
+USAGE_TEXT = (
+    "Массовое добавление карточек расчета.\n\n"
+    "Отправьте CSV-файл с подписью /import_payments. Первая строка - заголовок:\n"
+    "agent_id;amount;comment  (ID агента в боте)\n"
+    "или telegram_id;amount;comment  (Telegram ID агента)\n\n"
+    "Разделитель - точка с запятой или запятая, дробная часть суммы - через запятую или точку. "
+    "Файл проверяется целиком: если в какой-то строке ошибка, не добавляется ни один платеж. "
+    f"Повторно отправленный файл не импортируется, если в подписи нет слова {FORCE_FLAG}."
+)
+
+def decode_csv(content: bytes) -> str:
+    """Текст CSV: UTF-8 (в том числе с BOM) или Windows-1251 из Excel"""
+    try:
+        return content.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        return content.decode("cp1251")
+
+def parse_payments_csv(text: str):
+    """Разбор CSV с платежами: (колонка агента, строки, ошибки).
+
+    Строка - (номер строки в файле, идентификатор агента, сумма, комментарий).
+    """
+    try:
+        dialect = csv.Sniffer().sniff(text.splitlines()[0] if text else "", delimiters=";,")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(io.StringIO(text), dialect)
+
+    header = [column.strip().lower() for column in next(reader, [])]
+    if len(header) < 2 or header[0] not in AGENT_COLUMNS or header[1] != "amount":
+        return None, [], ["Первая строка должна быть заголовком: agent_id;amount;comment или telegram_id;amount;comment"]
+
+    rows, errors = [], []
+    for line_number, values in enumerate(reader, start=2):
+        if not any(value.strip() for value in values):
+            continue
+        if len(values) < 2:
+            errors.append(f"Строка {line_number}: нужны как минимум агент и сумма")
+            continue
+
+        try:
+            agent_key = int(values[0].strip())
+        except ValueError:
+            errors.append(f"Строка {line_number}: некорректный {header[0]} «{values[0]}»")
+            continue
+
+        try:
+            amount = float(values[1].strip().replace(" ", "").replace(",", "."))
+        except ValueError:
+            errors.append(f"Строка {line_number}: некорректная сумма «{values[1]}»")
+            continue
+        if amount == 0:
+            errors.append(f"Строка {line_number}: сумма не может быть нулевой")
+            continue
+
+        comment = values[2].strip() if len(values) > 2 and values[2].strip() else DEFAULT_COMMENT
+        rows.append((line_number, agent_key, amount, comment))
+
+    if not rows and not errors:
+        errors.append("В файле нет строк с платежами")
+    return header[0], rows, errors
+
+def split_message(lines):
+    """Разбиение длинного отчета на сообщения, помещающиеся в лимит Telegram"""
+    messages, current = [], ""
+    for line in lines:
+        if current and len(current) + len(line) + 1 > MAX_MESSAGE_LENGTH:
+            messages.append(current)
+            current = ""
+        current += line + "\n"
+    if current:
+        messages.append(current)
+    return messages
+
+@admin_required
+async def import_payments_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /import_payments без файла: формат CSV"""
+    await update.message.reply_text(USAGE_TEXT)
+
+def duplicate_text(previous):
+    """Сообщение о повторной отправке уже импортированного файла"""
+    return (
+        f"⚠️ Этот файл уже импортирован {previous.created_at:%d.%m.%Y %H:%M} UTC: "
+        f"{previous.payments_count} платежей на сумму {previous.total:.2f} руб. Платежи не добавлены.\n\n"
+        f"Если файл действительно нужно загрузить еще раз, отправьте его с подписью /import_payments {FORCE_FLAG}"
+    )
+
+@query_budget(5)  # роль, агенты, запись об импорте, платежи, балансы
+@admin_required
+async def import_payments(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Импорт карточек расчета из CSV-файла с подписью /import_payments"""
+    document = update.message.document
+    if document.file_size and document.file_size > MAX_FILE_SIZE:
+        await update.message.reply_text("Файл слишком большой (максимум 1 МБ).")
+        return
+
+    telegram_file = await document.get_file()
+    content = bytes(await telegram_file.download_as_bytearray())
+    content_hash = hashlib.sha256(content).hexdigest()
+    forced = FORCE_FLAG in (update.message.caption or "").split()[1:]
+
+    # Разбор файла до 1 МБ заметно нагружает процессор - выполняем его вне цикла событий
+    agent_column, rows, errors = await run_cpu(parse_payments_csv, decode_csv(content))
+    total = sum(amount for _, _, amount, _ in rows)
+
+    db = next(get_db())
+    try:
+        try:
+            # Проверяем всех агентов одним запросом
+            agents = {}
+            if rows:
+                field = AGENT_COLUMNS[agent_column]
+                keys = {agent_key for _, agent_key, _, _ in rows}
+                agents = {
+                    getattr(agent, field): agent
+                    for agent in db.query(Agent.id, Agent.telegram_id, Agent.full_name, Agent.commission_rate).filter(
+                        getattr(Agent, field).in_(keys)
+                    )
+                }
+                for line_number, agent_key, _, _ in rows:
+                    if agent_key not in agents:
+                        errors.append(f"Строка {line_number}: агент с {agent_column} {agent_key} не найден")
+
+            if errors:
+                report = ["❌ Платежи не добавлены, исправьте ошибки и отправьте файл снова:", ""]
+                report += errors[:MAX_REPORTED_ERRORS]
+                if len(errors) > MAX_REPORTED_ERRORS:
+                    report.append(f"... и еще {len(errors) - MAX_REPORTED_ERRORS}")
+                await update.message.reply_text("\n".join(report))
+                return
+
+            # Все строки корректны - добавляем платежи одним INSERT вместе с записью об импорте.
+            # Повторная отправка того же файла удвоила бы все платежи: ее отсекает
+            # уникальный индекс ux_payment_imports_hash при коммите (без отдельного запроса)
+            db.add(PaymentImport(
+                content_hash=content_hash, admin_id=update.effective_user.id,
+                payments_count=len(rows), total=total, forced=forced
+            ))
+            db.execute(insert(Payment), [
+                {"agent_id": agents[agent_key].id, "amount": amount, "comment": comment}
+                for _, agent_key, amount, comment in rows
+            ])
+            db.commit()
+
+        except IntegrityError:
+            # Этот файл уже импортирован (в том числе параллельным запросом)
+            db.rollback()
+            previous = db.query(PaymentImport).filter(
+                PaymentImport.content_hash == content_hash, PaymentImport.forced.is_(False)
+            ).first()
+            await update.message.reply_text(duplicate_text(previous) if previous else "⚠️ Этот файл уже импортирован.")
+            return
+
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error importing payments: {e}")
+            await update.message.reply_text(f"❌ Ошибка при импорте платежей, платежи не добавлены: {str(e)}")
+            return
+
+        pin_to_primary(update.effective_user.id)
+        logger.info(f"Admin {update.effective_user.id} imported {len(rows)} payments for {len(agents)} agents, total {total}")
+
+        # Платежи уже сохранены: ошибка отчета не должна выглядеть как неудачный импорт
+        try:
+            # Итоги по агентам и новые балансы одним сгруппированным запросом
+            imported = defaultdict(lambda: [0, 0.0])
+            for _, agent_key, amount, _ in rows:
+                imported[agents[agent_key].id][0] += 1
+                imported[agents[agent_key].id][1] += amount
+
+            imported_agents = [agent for agent in agents.values() if agent.id in imported]
+            balances = get_agents_balances(db, imported_agents)
+
+            report = [
+                f"✅ Добавлено карточек расчета: {len(rows)} на сумму {total:.2f} руб.",
+                f"Агентов: {len(imported)}",
+                ""
+            ]
+            for agent in sorted(imported_agents, key=lambda agent: agent.full_name or ""):
+                count, amount = imported[agent.id]
+                sign = "+" if amount >= 0 else ""
+                report.append(
+                    f"{agent.full_name} (ID {agent.id}): {sign}{amount:.2f} руб. ({count} шт.), "
+                    f"баланс: {balances[agent.id][3]:.2f} руб."
+                )
+
+            for message in split_message(report):
+                await update.message.reply_text(message)
+
+        except Exception as e:
+            logger.error(f"Payments imported, but the report failed: {e}")
+            try:
+                await update.message.reply_text(
+                    f"✅ Добавлено карточек расчета: {len(rows)} на сумму {total:.2f} руб.\n"
+                    "Не удалось сформировать отчет по балансам. Не отправляйте файл повторно."
+                )
+            except TelegramError:
+                pass
+
+    finally:
+        db.close()
@@ -1,7 +1,8 @@
 from telegram import Update, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
 from telegram.ext import ContextTypes, ConversationHandler, CommandHandler, MessageHandler, filters
-from utils.logger import logger
-from database.database import get_db
+from config import settings
+from utils.logger import logger, DEBUG_ENABLED
+from database.database import get_db, pin_to_primary
 from handlers.user_handler import create_agent, get_agent_by_telegram_id
 
 # Константы для состояний разговора
@@ -36,7 +37,8 @@ async def full_name_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик ввода ФИО"""
     full_name = update.message.text
     context.user_data["full_name"] = full_name
-    logger.debug(f"User {update.effective_user.id} entered full name: {full_name}")
+    if DEBUG_ENABLED:
+        logger.debug("User {} entered full name: {}", update.effective_user.id, full_name)
     
     # Запрашиваем номер телефона
     keyboard = [[KeyboardButton("Поделиться номером", request_contact=True)]]
@@ -59,7 +61,8 @@ async def phone_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         phone = update.message.text
     
     context.user_data["phone"] = phone
-    logger.debug(f"User {user_id} entered phone: {phone}")
+    if DEBUG_ENABLED:
+        logger.debug("User {} entered phone: {}", user_id, phone)
     
     # Запрашиваем компанию
     await update.message.reply_text(
@@ -73,7 +76,8 @@ async def company_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик ввода названия компании"""
     company = update.message.text
     context.user_data["company"] = company
-    logger.debug(f"User {update.effective_user.id} entered company: {company}")
+    if DEBUG_ENABLED:
+        logger.debug("User {} entered company: {}", update.effective_user.id, company)
     
     # Запрашиваем кодовое слово
     await update.message.reply_text(
@@ -86,7 +90,8 @@ async def code_word_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик ввода кодового слова и завершение регистрации"""
     user_id = update.effective_user.id
     code_word = update.message.text
-    logger.debug(f"User {user_id} entered code word")
+    if DEBUG_ENABLED:
+        logger.debug("User {} entered code word", user_id)
     
     # Создаем нового агента
     db = next(get_db())
@@ -101,6 +106,8 @@ async def code_word_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         
         if success:
+            # Следующие экраны читают профиль с основной БД, пока реплика не догонит запись
+            pin_to_primary(user_id)
             await update.message.reply_text(
                 f"{message}\n\nТеперь вы можете использовать /start для доступа к меню бота."
             )
@@ -140,5 +147,7 @@ def get_registration_handler():
             COMPANY: [MessageHandler(filters.TEXT & ~filters.COMMAND, company_handler)],
             CODE_WORD: [MessageHandler(filters.TEXT & ~filters.COMMAND, code_word_handler)]
         },
-        fallbacks=[CommandHandler("cancel", cancel)]
+        fallbacks=[CommandHandler("cancel", cancel)],
+        name="registration",
+        persistent=settings.BOT_WORKERS > 1
     ) 
\ No newline at end of file
@@ -1,5 +1,6 @@
+from sqlalchemy import func, literal, select, union_all
 from sqlalchemy.orm import Session
-from database.models import Agent, UserRole
+from database.models import Agent, UserRole, TOCard, TOCardArchive, Payment, CardStatus
 from config import settings
 from utils.logger import logger
 
@@ -71,4 +72,64 @@ def update_agent_commission(db: Session, agent_id: int, new_commission_rate: flo
     except Exception as e:
         db.rollback()
         logger.error(f"Error updating agent commission: {e}")
-        return False, "Ошибка при обновлении комиссии" 
\ No newline at end of file
+        return False, "Ошибка при обновлении комиссии" 
+
+def agent_cards(agent_id: int):
+    """Карточки ТО агента из оперативной и архивной таблиц (подзапрос UNION ALL)"""
+    names = [column.name for column in TOCard.__table__.columns]
+    hot = select(*[TOCard.__table__.c[name] for name in names]).where(TOCard.agent_id == agent_id)
+    cold = select(*[TOCardArchive.__table__.c[name] for name in names]).where(TOCardArchive.agent_id == agent_id)
+    return union_all(hot, cold).subquery("cards")
+
+def get_agent_card_stats(db: Session, agent_id: int):
+    """Количество и сумма карточек ТО агента по статусам с учетом архива: {status: (count, sum)}"""
+    cards = agent_cards(agent_id)
+    rows = db.query(
+        cards.c.status,
+        func.count(),
+        func.coalesce(func.sum(cards.c.total_price), 0)
+    ).group_by(cards.c.status).all()
+    return {status: (count, total) for status, count, total in rows}
+
+def get_agent_balance(db: Session, agent_id: int, commission_rate: float, stats: dict = None):
+    """Баланс агента: сумма одобренных ТО минус комиссия и выплаты.
+
+    Возвращает (approved_sum, commission, payments_sum, balance).
+    """
+    if stats is None:
+        stats = get_agent_card_stats(db, agent_id)
+    approved_sum = stats.get(CardStatus.APPROVED, (0, 0))[1]
+    commission = approved_sum * (commission_rate / 100)
+    payments_sum = db.query(func.sum(Payment.amount)).filter(
+        Payment.agent_id == agent_id
+    ).scalar() or 0
+    return approved_sum, commission, payments_sum, approved_sum - commission - payments_sum
+
+def get_agents_balances(db: Session, agents):
+    """Балансы нескольких агентов одним сгруппированным запросом (с учетом архива).
+
+    agents - объекты или строки с полями id и commission_rate.
+    Возвращает {agent_id: (approved_sum, commission, payments_sum, balance)}.
+    """
+    agent_ids = [agent.id for agent in agents]
+
+    def approved(model):
+        return select(
+            model.agent_id, model.total_price.label("approved"), literal(0.0).label("paid")
+        ).where(model.agent_id.in_(agent_ids), model.status == CardStatus.APPROVED)
+
+    paid = select(Payment.agent_id, literal(0.0), Payment.amount).where(Payment.agent_id.in_(agent_ids))
+    entries = union_all(approved(TOCard), approved(TOCardArchive), paid).subquery("entries")
+    totals = {
+        agent_id: (approved_sum or 0, payments_sum or 0)
+        for agent_id, approved_sum, payments_sum in db.query(
+            entries.c.agent_id, func.sum(entries.c.approved), func.sum(entries.c.paid)
+        ).group_by(entries.c.agent_id)
+    }
+
+    balances = {}
+    for agent in agents:
+        approved_sum, payments_sum = totals.get(agent.id, (0, 0))
+        commission = approved_sum * (agent.commission_rate / 100)
+        balances[agent.id] = (approved_sum, commission, payments_sum, approved_sum - commission - payments_sum)
+    return balances
@@ -1,21 +1,31 @@
-import asyncio
-from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ConversationHandler
+import time
+
+# Замеры времени запуска (до импорта остальных модулей)
+STARTUP_STARTED = time.perf_counter()
+
 from config import settings
-from utils.logger import logger
-from database.database import engine
-from database.models import Base
+
+CONFIG_LOADED = time.perf_counter()
+
+import asyncio
+from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters
+from utils.logger import logger, log_context
+from database.database import engine, replica_engine
+from database.schema import verify_schema
 from handlers.registration import get_registration_handler
 from handlers.booking import get_booking_handler
 from handlers.menu import start_command, handle_menu_callback
-from handlers.admin import (
-    process_payment_amount, process_payment_comment, process_change_commission,
-    start_add_payment, start_change_commission,
-    PAYMENT_AMOUNT, PAYMENT_COMMENT, CHANGE_COMMISSION, AGENT_ACTION
-)
-from handlers.admin_approvals import get_approval_handler
+from handlers.admin_routes import get_admin_handler, get_approval_handler, get_payments_import_handlers
 from handlers.my_bookings import get_booking_cancel_handler
+from handlers.jobs import schedule_jobs
 from utils.roles import get_user_role
 from database.database import get_db
+from utils.metrics import instrument_engine, instrument_callback, wrap_callbacks, start_metrics_server
+from utils import query_budget
+from utils.cluster import worker_index, run_cluster
+from utils.notify import start_listener
+from utils.callback_guard import dedup_callback
+from utils.executors import shutdown_executors
 
 async def start(update, context):
     """Обработчик команды /start"""
@@ -46,13 +56,12 @@ async def handle_message(update, context):
         "Извините, я не понимаю эту команду. Используйте /start для начала работы."
     )
 
-def main():
-    """Основная функция запуска бота"""
-    # Создаем таблицы в базе данных
-    Base.metadata.create_all(bind=engine)
+def build_application(builder=None):
+    """Создание приложения бота со всеми обработчиками"""
+    if builder is None:
+        builder = Application.builder().token(settings.BOT_TOKEN)
     
-    # Инициализируем бота
-    application = Application.builder().token(settings.BOT_TOKEN).build()
+    application = builder.build()
     
     # Добавляем обработчики команд
     application.add_handler(CommandHandler("start", start))
@@ -63,32 +72,15 @@ def main():
     # Добавляем обработчик для бронирования
     application.add_handler(get_booking_handler())
     
-    # Создаем ConversationHandler для админ-функций
-    admin_handler = ConversationHandler(
-        entry_points=[
-            CallbackQueryHandler(start_add_payment, pattern=r'^add_payment_\d+$'),
-            CallbackQueryHandler(start_change_commission, pattern=r'^change_commission_\d+$')
-        ],
-        states={
-            PAYMENT_AMOUNT: [MessageHandler(filters.TEXT & ~filters.COMMAND, process_payment_amount)],
-            PAYMENT_COMMENT: [MessageHandler(filters.TEXT & ~filters.COMMAND, process_payment_comment)],
-            CHANGE_COMMISSION: [MessageHandler(filters.TEXT & ~filters.COMMAND, process_change_commission)],
-            AGENT_ACTION: [CallbackQueryHandler(handle_menu_callback)]
-        },
-        fallbacks=[],
-        map_to_parent={
-            # Если диалог завершится, возвращаемся к обработчику меню
-            ConversationHandler.END: CallbackQueryHandler(handle_menu_callback)
-        },
-        name="admin_functions"
-    )
-    
-    # Добавляем обработчик для админ-функций
-    application.add_handler(admin_handler)
+    # Добавляем обработчик для админ-функций (модули админки загружаются при первом обращении)
+    application.add_handler(get_admin_handler())
     
     # Добавляем обработчик для согласований
     application.add_handler(get_approval_handler())
     
+    # Добавляем обработчики импорта платежей из CSV
+    application.add_handlers(get_payments_import_handlers())
+    
     # Добавляем обработчик для отмены карточек ТО
     application.add_handler(get_booking_cancel_handler())
     
@@ -98,9 +90,75 @@ def main():
     # Добавляем обработчик для неизвестных сообщений
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
     
+    return application
+
+def configure_application(application):
+    """Обертки обработчиков, метрики и фоновые службы процесса"""
+    # Повторные нажатия кнопок отбрасываются до вызова обработчика
+    wrap_callbacks(application, dedup_callback, CallbackQueryHandler)
+    
+    # Контекст обновления (update_id, user_id, handler) в записях лога
+    wrap_callbacks(application, log_context)
+    
+    # Включаем метрики обработчиков и запросов к БД (у каждого воркера свой порт)
+    if settings.METRICS_ENABLED:
+        instrument_engine(engine)
+        instrument_engine(replica_engine)
+        wrap_callbacks(application, instrument_callback)
+        start_metrics_server(settings.METRICS_HOST, settings.METRICS_PORT + worker_index())
+    
+    # Отладочный подсчет запросов на каждое обновление
+    if settings.QUERY_DEBUG:
+        query_budget.install(engine, replica_engine)
+        wrap_callbacks(application, query_budget.track_update)
+    
+    # Уведомления об изменениях от других процессов (сброс кэшей)
+    start_listener()
+    
+    # Периодические задачи: напоминания о записях
+    schedule_jobs(application)
+
+def main():
+    """Основная функция запуска бота"""
+    imports_done = time.perf_counter()
+    
+    # Проверяем ревизию схемы вместо создания таблиц (миграции: alembic upgrade head)
+    if settings.DB_SCHEMA_CHECK:
+        verify_schema()
+    schema_checked = time.perf_counter()
+    
+    async def log_startup_timings(application):
+        """Вывод времени запуска перед началом опроса Telegram"""
+        ready = time.perf_counter()
+        logger.info(
+            f"Startup timings: config={(CONFIG_LOADED - STARTUP_STARTED) * 1000:.0f}ms, "
+            f"imports={(imports_done - CONFIG_LOADED) * 1000:.0f}ms, "
+            f"schema_check={(schema_checked - imports_done) * 1000:.0f}ms, "
+            f"handlers={(handlers_ready - schema_checked) * 1000:.0f}ms, "
+            f"bot_init={(ready - handlers_ready) * 1000:.0f}ms, "
+            f"total={(ready - STARTUP_STARTED) * 1000:.0f}ms"
+        )
+    
+    # Несколько воркеров: этот процесс только получает обновления и раздает их
+    if settings.BOT_WORKERS > 1:
+        run_cluster(settings.BOT_WORKERS)
+        return
+    
+    # Инициализируем бота
+    application = build_application(
+        Application.builder().token(settings.BOT_TOKEN).post_init(log_startup_timings)
+    )
+    configure_application(application)
+    
+    handlers_ready = time.perf_counter()
+    
     # Запускаем бота
     logger.info("Starting bot...")
     application.run_polling()
+    shutdown_executors()
+    
+    # Дожидаемся записи логов из очереди фонового потока
+    logger.complete()
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,66 @@
+"""baseline: agents, to_cards, payments
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19 10:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "agents",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("telegram_id", sa.Integer(), unique=True),
+        sa.Column("full_name", sa.String()),
+        sa.Column("phone", sa.String()),
+        sa.Column("company", sa.String()),
+        sa.Column("role", sa.Enum("AGENT", "ADMIN", name="userrole")),
+        sa.Column("commission_rate", sa.Float()),
+        sa.Column("messenger_link", sa.String()),
+        sa.Column("created_at", sa.DateTime()),
+    )
+    op.create_table(
+        "to_cards",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("card_number", sa.String(), unique=True),
+        sa.Column("agent_id", sa.Integer(), sa.ForeignKey("agents.id")),
+        sa.Column("category", sa.String()),
+        sa.Column("sto_name", sa.String()),
+        sa.Column("has_defects", sa.Boolean()),
+        sa.Column("defect_type", sa.String(), nullable=True),
+        sa.Column("defect_description", sa.Text(), nullable=True),
+        sa.Column("appointment_time", sa.DateTime()),
+        sa.Column("client_name", sa.String()),
+        sa.Column("car_number", sa.String()),
+        sa.Column("vin_number", sa.String()),
+        sa.Column("client_phone", sa.String()),
+        sa.Column("total_price", sa.Float()),
+        sa.Column("status", sa.String()),
+        sa.Column("admin_comment", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime()),
+    )
+    op.create_table(
+        "payments",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("agent_id", sa.Integer(), sa.ForeignKey("agents.id")),
+        sa.Column("amount", sa.Float()),
+        sa.Column("comment", sa.Text()),
+        sa.Column("created_at", sa.DateTime()),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("payments")
+    op.drop_table("to_cards")
+    op.drop_table("agents")
+    sa.Enum(name="userrole").drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,73 @@
+"""to_cards_archive: cold storage for closed cards
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 12:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "to_cards_archive",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=False),
+        sa.Column("card_number", sa.String(), unique=True),
+        sa.Column("agent_id", sa.Integer(), sa.ForeignKey("agents.id")),
+        sa.Column("category", sa.String()),
+        sa.Column("sto_name", sa.String()),
+        sa.Column("has_defects", sa.Boolean()),
+        sa.Column("defect_type", sa.String(), nullable=True),
+        sa.Column("defect_description", sa.Text(), nullable=True),
+        sa.Column("appointment_time", sa.DateTime()),
+        sa.Column("client_name", sa.String()),
+        sa.Column("car_number", sa.String()),
+        sa.Column("vin_number", sa.String()),
+        sa.Column("client_phone", sa.String()),
+        sa.Column("total_price", sa.Float()),
+        sa.Column("status", sa.String()),
+        sa.Column("admin_comment", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime()),
+        sa.Column("archived_at", sa.DateTime()),
+    )
+    op.create_index(
+        "ix_to_cards_archive_agent_appointment",
+        "to_cards_archive",
+        ["agent_id", "appointment_time"],
+    )
+    # Отбор кандидатов на перенос: закрытые карточки по времени записи
+    op.create_index(
+        "ix_to_cards_closed_appointment",
+        "to_cards",
+        ["appointment_time"],
+        postgresql_where=sa.text("status IN ('approved', 'rejected', 'cancelled')"),
+    )
+
+
+def downgrade() -> None:
+    # Возвращаем архивные карточки в оперативную таблицу, чтобы не потерять данные
+    op.execute(
+        """
+        INSERT INTO to_cards (
+            id, card_number, agent_id, category, sto_name, has_defects, defect_type,
+            defect_description, appointment_time, client_name, car_number, vin_number,
+            client_phone, total_price, status, admin_comment, created_at
+        )
+        SELECT
+            id, card_number, agent_id, category, sto_name, has_defects, defect_type,
+            defect_description, appointment_time, client_name, car_number, vin_number,
+            client_phone, total_price, status, admin_comment, created_at
+        FROM to_cards_archive
+        """
+    )
+    op.drop_index("ix_to_cards_closed_appointment", table_name="to_cards")
+    op.drop_index("ix_to_cards_archive_agent_appointment", table_name="to_cards_archive")
+    op.drop_table("to_cards_archive")
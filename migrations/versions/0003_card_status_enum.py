@@ -0,0 +1,84 @@
+"""card_status enum and partial indexes on to_cards
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 14:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+CARD_STATUSES = ("pending", "approved", "rejected", "cancelled")
+CARD_TABLES = ("to_cards", "to_cards_archive")
+
+
+def upgrade() -> None:
+    card_status = sa.Enum(*CARD_STATUSES, name="card_status")
+    card_status.create(op.get_bind(), checkfirst=True)
+
+    # Индекс с условием по строковой колонке пересоздаем после смены типа
+    op.drop_index("ix_to_cards_closed_appointment", table_name="to_cards")
+
+    for table in CARD_TABLES:
+        op.execute(f"UPDATE {table} SET status = 'pending' WHERE status IS NULL")
+        op.alter_column(
+            table,
+            "status",
+            type_=card_status,
+            existing_type=sa.String(),
+            nullable=False,
+            postgresql_using="status::card_status",
+        )
+
+    op.create_index(
+        "ix_to_cards_closed_appointment",
+        "to_cards",
+        ["appointment_time"],
+        postgresql_where=sa.text("status IN ('approved', 'rejected', 'cancelled')"),
+    )
+    # Очередь согласования администратора (сортировка по времени создания)
+    op.create_index(
+        "ix_to_cards_pending_created",
+        "to_cards",
+        ["created_at"],
+        postgresql_where=sa.text("status = 'pending'"),
+    )
+    # Активные записи агента
+    op.create_index(
+        "ix_to_cards_agent_pending",
+        "to_cards",
+        ["agent_id", "appointment_time"],
+        postgresql_where=sa.text("status = 'pending'"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_to_cards_agent_pending", table_name="to_cards")
+    op.drop_index("ix_to_cards_pending_created", table_name="to_cards")
+    op.drop_index("ix_to_cards_closed_appointment", table_name="to_cards")
+
+    for table in CARD_TABLES:
+        op.alter_column(
+            table,
+            "status",
+            type_=sa.String(),
+            existing_type=sa.Enum(*CARD_STATUSES, name="card_status"),
+            nullable=True,
+            postgresql_using="status::text",
+        )
+
+    sa.Enum(name="card_status").drop(op.get_bind(), checkfirst=True)
+
+    op.create_index(
+        "ix_to_cards_closed_appointment",
+        "to_cards",
+        ["appointment_time"],
+        postgresql_where=sa.text("status IN ('approved', 'rejected', 'cancelled')"),
+    )
@@ -0,0 +1,51 @@
+"""stations: station catalog moved from STO_STATIONS into the database
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19 18:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import JSONB
+from config import settings
+
+
+# revision identifiers, used by Alembic.
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+STATION_FIELDS = {"name", "address", "categories", "prices", "working_hours", "time_slot", "defect_prices"}
+
+
+def upgrade() -> None:
+    stations = op.create_table(
+        "stations",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("code", sa.String(), nullable=False, unique=True),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("address", sa.String(), nullable=False),
+        sa.Column("categories", JSONB(), nullable=False),
+        sa.Column("prices", JSONB(), nullable=False),
+        sa.Column("working_hours", JSONB(), nullable=False),
+        sa.Column("time_slot", sa.Integer(), nullable=False),
+        sa.Column("defect_prices", JSONB(), nullable=False),
+        sa.Column("active", sa.Boolean(), nullable=False, server_default=sa.true()),
+        sa.Column("updated_at", sa.DateTime(), server_default=sa.func.now()),
+    )
+
+    # Переносим станции из переменной окружения STO_STATIONS
+    # (только поля этой ревизии: следующие миграции добавляют свои колонки сами)
+    op.bulk_insert(
+        stations,
+        [
+            {"code": code, **station.model_dump(include=STATION_FIELDS), "active": True}
+            for code, station in settings.STO_STATIONS.items()
+        ],
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("stations")
@@ -0,0 +1,62 @@
+"""to_cards.station_id: foreign key to stations instead of matching by name
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-19 20:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+CARD_TABLES = ("to_cards", "to_cards_archive")
+# Размер пачки при заполнении station_id (каждая пачка - отдельная транзакция)
+BACKFILL_BATCH_SIZE = 5000
+
+
+def upgrade() -> None:
+    for table in CARD_TABLES:
+        op.add_column(table, sa.Column("station_id", sa.Integer(), nullable=True))
+        op.create_foreign_key(f"fk_{table}_station_id", table, "stations", ["station_id"], ["id"])
+
+    # Заполняем station_id по названию станции пачками по диапазону id,
+    # чтобы не держать блокировку всей таблицы в одной длинной транзакции
+    with op.get_context().autocommit_block():
+        connection = op.get_bind()
+        for table in CARD_TABLES:
+            min_id, max_id = connection.execute(sa.text(f"SELECT min(id), max(id) FROM {table}")).one()
+            if min_id is None:
+                continue
+            for batch_start in range(min_id, max_id + 1, BACKFILL_BATCH_SIZE):
+                connection.execute(
+                    sa.text(
+                        f"""
+                        UPDATE {table} SET station_id = stations.id
+                        FROM stations
+                        WHERE {table}.id BETWEEN :batch_start AND :batch_end
+                          AND {table}.station_id IS NULL
+                          AND stations.name = {table}.sto_name
+                        """
+                    ),
+                    {"batch_start": batch_start, "batch_end": batch_start + BACKFILL_BATCH_SIZE - 1},
+                )
+
+        op.create_index(
+            "ix_to_cards_station_appointment",
+            "to_cards",
+            ["station_id", "appointment_time"],
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_to_cards_station_appointment", table_name="to_cards")
+    for table in CARD_TABLES:
+        op.drop_constraint(f"fk_{table}_station_id", table, type_="foreignkey")
+        op.drop_column(table, "station_id")
@@ -0,0 +1,38 @@
+"""stations.capacity: lanes per category in one time slot
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-19 21:00:00
+
+"""
+import json
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects.postgresql import JSONB
+from config import settings
+
+
+# revision identifiers, used by Alembic.
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        "stations",
+        sa.Column("capacity", JSONB(), nullable=False, server_default=sa.text("'{}'::jsonb")),
+    )
+
+    # Линии, заданные в STO_STATIONS, переносим в справочник
+    for code, station in settings.STO_STATIONS.items():
+        if station.capacity:
+            op.get_bind().execute(
+                sa.text("UPDATE stations SET capacity = CAST(:capacity AS jsonb) WHERE code = :code"),
+                {"capacity": json.dumps(station.capacity), "code": code},
+            )
+
+
+def downgrade() -> None:
+    op.drop_column("stations", "capacity")
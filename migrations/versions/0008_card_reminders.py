@@ -0,0 +1,44 @@
+"""to_cards.reminder_sent_at and partial index for upcoming appointment reminders
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-19 22:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+CARD_TABLES = ("to_cards", "to_cards_archive")
+
+
+def upgrade() -> None:
+    for table in CARD_TABLES:
+        op.add_column(table, sa.Column("reminder_sent_at", sa.DateTime(), nullable=True))
+
+    # Прошедшие записи не напоминаем: отмечаем их, чтобы они не попали в индекс
+    op.execute(
+        "UPDATE to_cards SET reminder_sent_at = localtimestamp "
+        "WHERE appointment_time <= localtimestamp AND status IN ('pending', 'approved')"
+    )
+
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_to_cards_reminder_due",
+            "to_cards",
+            ["appointment_time"],
+            postgresql_where=sa.text("status IN ('pending', 'approved') AND reminder_sent_at IS NULL"),
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_to_cards_reminder_due", table_name="to_cards")
+    for table in CARD_TABLES:
+        op.drop_column(table, "reminder_sent_at")
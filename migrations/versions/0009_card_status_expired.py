@@ -0,0 +1,77 @@
+"""card_status 'expired' for pending cards whose appointment time has passed
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-19 23:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0009"
+down_revision = "0008"
+branch_labels = None
+depends_on = None
+
+CARD_STATUSES = ("pending", "approved", "rejected", "cancelled")
+CARD_TABLES = ("to_cards", "to_cards_archive")
+
+# Частичные индексы to_cards с условием по статусу: (колонки, условие)
+STATUS_INDEXES = {
+    "ix_to_cards_pending_created": (["created_at"], "status = 'pending'"),
+    "ix_to_cards_agent_pending": (["agent_id", "appointment_time"], "status = 'pending'"),
+    "ix_to_cards_reminder_due": (["appointment_time"], "status IN ('pending', 'approved') AND reminder_sent_at IS NULL"),
+}
+
+
+def upgrade() -> None:
+    # Новое значение enum нельзя использовать в той же транзакции, где оно добавлено
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TYPE card_status ADD VALUE IF NOT EXISTS 'expired'")
+
+        # Просроченные карточки тоже переносятся в архив: индекс кандидатов расширяем
+        op.create_index(
+            "ix_to_cards_closed_appointment_new",
+            "to_cards",
+            ["appointment_time"],
+            postgresql_where=sa.text("status IN ('approved', 'rejected', 'cancelled', 'expired')"),
+            postgresql_concurrently=True,
+        )
+        op.drop_index("ix_to_cards_closed_appointment", table_name="to_cards", postgresql_concurrently=True)
+        op.execute("ALTER INDEX ix_to_cards_closed_appointment_new RENAME TO ix_to_cards_closed_appointment")
+
+
+def downgrade() -> None:
+    # Значение из enum в PostgreSQL не удаляется: пересоздаем тип без него,
+    # просроченные карточки возвращаем в ожидание
+    for table in CARD_TABLES:
+        op.execute(f"UPDATE {table} SET status = 'pending' WHERE status = 'expired'")
+
+    op.drop_index("ix_to_cards_closed_appointment", table_name="to_cards")
+    for name in STATUS_INDEXES:
+        op.drop_index(name, table_name="to_cards")
+
+    op.execute("ALTER TYPE card_status RENAME TO card_status_old")
+    card_status = sa.Enum(*CARD_STATUSES, name="card_status")
+    card_status.create(op.get_bind())
+    for table in CARD_TABLES:
+        op.alter_column(
+            table,
+            "status",
+            type_=card_status,
+            existing_type=sa.Enum(name="card_status_old"),
+            existing_nullable=False,
+            postgresql_using="status::text::card_status",
+        )
+    op.execute("DROP TYPE card_status_old")
+
+    op.create_index(
+        "ix_to_cards_closed_appointment",
+        "to_cards",
+        ["appointment_time"],
+        postgresql_where=sa.text("status IN ('approved', 'rejected', 'cancelled')"),
+    )
+    for name, (columns, where) in STATUS_INDEXES.items():
+        op.create_index(name, "to_cards", columns, postgresql_where=sa.text(where))
@@ -0,0 +1,31 @@
+"""to_cards.version and updated_at for optimistic concurrency
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-20 10:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0010"
+down_revision = "0009"
+branch_labels = None
+depends_on = None
+
+CARD_TABLES = ("to_cards", "to_cards_archive")
+
+
+def upgrade() -> None:
+    # Колонка с константным значением по умолчанию добавляется без перезаписи таблицы
+    for table in CARD_TABLES:
+        op.add_column(table, sa.Column("version", sa.Integer(), nullable=False, server_default=sa.text("1")))
+        op.add_column(table, sa.Column("updated_at", sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    for table in CARD_TABLES:
+        op.drop_column(table, "updated_at")
+        op.drop_column(table, "version")
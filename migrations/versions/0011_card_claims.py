@@ -0,0 +1,32 @@
+"""to_cards.claimed_by and claimed_until for the next-card review mode
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-21 10:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0011"
+down_revision = "0010"
+branch_labels = None
+depends_on = None
+
+CARD_TABLES = ("to_cards", "to_cards_archive")
+
+
+def upgrade() -> None:
+    # Колонки без значения по умолчанию добавляются без перезаписи таблицы.
+    # Отдельный индекс не нужен: очередь выбирается по ix_to_cards_pending_created
+    for table in CARD_TABLES:
+        op.add_column(table, sa.Column("claimed_by", sa.BigInteger(), nullable=True))
+        op.add_column(table, sa.Column("claimed_until", sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    for table in CARD_TABLES:
+        op.drop_column(table, "claimed_until")
+        op.drop_column(table, "claimed_by")
@@ -0,0 +1,33 @@
+"""partial index on to_cards.appointment_time for pending cards (expiry job)
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-22 10:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0012"
+down_revision = "0011"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Индекс строится без блокировки записи в таблицу
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_to_cards_pending_appointment",
+            "to_cards",
+            ["appointment_time"],
+            postgresql_where=sa.text("status = 'pending'"),
+            postgresql_concurrently=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index("ix_to_cards_pending_appointment", table_name="to_cards", postgresql_concurrently=True)
@@ -0,0 +1,41 @@
+"""payment_imports: content hashes of imported payment CSV files
+
+Revision ID: 0013
+Revises: 0012
+Create Date: 2026-10-22 12:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "0013"
+down_revision = "0012"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "payment_imports",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("content_hash", sa.String(64), nullable=False),
+        sa.Column("admin_id", sa.BigInteger(), nullable=False),
+        sa.Column("payments_count", sa.Integer(), nullable=False),
+        sa.Column("total", sa.Float(), nullable=False),
+        sa.Column("forced", sa.Boolean(), nullable=False, server_default=sa.text("false")),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+    )
+    op.create_index(
+        "ux_payment_imports_hash",
+        "payment_imports",
+        ["content_hash"],
+        unique=True,
+        postgresql_where=sa.text("NOT forced"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ux_payment_imports_hash", table_name="payment_imports")
+    op.drop_table("payment_imports")
@@ -0,0 +1,15 @@
+import argparse
+from config import settings
+from database.maintenance import archive_closed_cards
+
+def main():
+    parser = argparse.ArgumentParser(description="Перенос закрытых карточек ТО в архивную таблицу")
+    parser.add_argument("--months", type=int, default=settings.ARCHIVE_AFTER_MONTHS,
+                        help="переносить карточки с датой записи старше N месяцев")
+    parser.add_argument("--batch-size", type=int, default=settings.ARCHIVE_BATCH_SIZE,
+                        help="количество карточек в одной транзакции")
+    args = parser.parse_args()
+    archive_closed_cards(args.months, args.batch_size)
+
+if __name__ == "__main__":
+    main()
@@ -1,65 +1,195 @@
+import argparse
+import gzip
+import json
 import os
+import shutil
 import subprocess
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
 from pathlib import Path
+from sqlalchemy import text
 from config import settings
+from database.database import engine
 from utils.logger import logger
 
-def create_backup():
-    """Создание резервной копии базы данных"""
-    backup_dir = Path("backups")
-    backup_dir.mkdir(exist_ok=True)
-    
+# Размер блока при потоковом сжатии вывода pg_dump
+CHUNK_SIZE = 1024 * 1024
+
+BACKUP_FORMATS = ("directory", "custom")
+
+def pg_env():
+    """Переменные окружения для утилит PostgreSQL (пароль через PGPASSWORD)"""
+    env = os.environ.copy()
+    env["PGPASSWORD"] = settings.DB_PASSWORD
+    return env
+
+def pg_connection_args(db_name=None):
+    """Параметры подключения для pg_dump/pg_restore/psql"""
+    return [
+        "-h", settings.DB_HOST,
+        "-p", str(settings.DB_PORT),
+        "-U", settings.DB_USER,
+        "-d", db_name or settings.DB_NAME
+    ]
+
+def snapshot_args(snapshot: str = None):
+    """Дамп из экспортированного снимка, чтобы он совпадал с показателями в манифесте"""
+    return ["--snapshot", snapshot] if snapshot else []
+
+def path_size(path: Path):
+    """Размер файла или каталога с резервной копией в байтах"""
+    if path.is_dir():
+        return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+    return path.stat().st_size
+
+def collect_stats(connection):
+    """Контрольные показатели базы: количество строк и суммы для сверки после восстановления"""
+    stats = {}
+    for table in ("agents", "to_cards", "to_cards_archive", "payments"):
+        stats[f"{table}_rows"] = connection.execute(text(f"SELECT count(*) FROM {table}")).scalar()
+    stats["approved_total"] = round(float(connection.execute(text(
+        "SELECT coalesce(sum(total_price), 0) FROM ("
+        "SELECT total_price, status FROM to_cards UNION ALL SELECT total_price, status FROM to_cards_archive"
+        ") cards WHERE status = 'approved'"
+    )).scalar()), 2)
+    stats["payments_total"] = round(float(connection.execute(
+        text("SELECT coalesce(sum(amount), 0) FROM payments")
+    ).scalar()), 2)
+    return stats
+
+def dump_directory(target: Path, jobs: int, snapshot: str = None):
+    """Дамп в формате directory параллельными процессами pg_dump (сжатие внутри pg_dump)"""
+    cmd = [
+        "pg_dump",
+        *pg_connection_args(),
+        *snapshot_args(snapshot),
+        "-Fd",
+        "-j", str(jobs),
+        "-Z", str(settings.BACKUP_COMPRESSION_LEVEL),
+        "-f", str(target)
+    ]
+    subprocess.run(cmd, env=pg_env(), check=True)
+
+def dump_custom_stream(target: Path, snapshot: str = None):
+    """Дамп в формате custom, поток из pg_dump сжимается на лету без временного файла"""
+    cmd = ["pg_dump", *pg_connection_args(), *snapshot_args(snapshot), "-Fc", "-Z", "0"]
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, env=pg_env()) as process:
+        with gzip.open(target, "wb", compresslevel=settings.BACKUP_COMPRESSION_LEVEL) as output:
+            shutil.copyfileobj(process.stdout, output, CHUNK_SIZE)
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd)
+
+def create_backup(backup_format: str = None, jobs: int = None):
+    """Создание резервной копии базы данных и манифеста с длительностью и размером"""
+    backup_format = backup_format or settings.BACKUP_FORMAT
+    jobs = jobs or settings.BACKUP_JOBS
+    if backup_format not in BACKUP_FORMATS:
+        raise ValueError(f"Unknown backup format: {backup_format}")
+
+    backup_dir = Path(settings.BACKUP_DIR)
+    backup_dir.mkdir(parents=True, exist_ok=True)
+
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    backup_file = backup_dir / f"backup_{timestamp}.sql"
-    
+    suffix = ".dir" if backup_format == "directory" else ".dump.gz"
+    backup_path = backup_dir / f"backup_{timestamp}{suffix}"
+    # Пока дамп не завершен, он лежит под именем .partial и не попадает под ротацию
+    partial_path = backup_path.with_name(backup_path.name + ".partial")
+
+    started_at = datetime.now()
+    started = time.monotonic()
     try:
-        # Создаем дамп базы данных
-        cmd = [
-            "pg_dump",
-            "-h", settings.DB_HOST,
-            "-p", str(settings.DB_PORT),
-            "-U", settings.DB_USER,
-            "-d", settings.DB_NAME,
-            "-f", str(backup_file)
-        ]
-        
-        # Устанавливаем переменную окружения для пароля
-        env = os.environ.copy()
-        env["PGPASSWORD"] = settings.DB_PASSWORD
-        
-        subprocess.run(cmd, env=env, check=True)
-        logger.info(f"Backup created successfully: {backup_file}")
-        
-        # Сжимаем файл
-        compressed_file = backup_file.with_suffix(".sql.gz")
-        subprocess.run(["gzip", "-f", str(backup_file)], check=True)
-        logger.info(f"Backup compressed: {compressed_file}")
-        
-        # Удаляем старые бэкапы (оставляем последние 7 дней)
-        cleanup_old_backups(backup_dir)
-        
+        # Снимок экспортируется из открытой транзакции: показатели и дамп видят одни и те же данные
+        with engine.connect().execution_options(isolation_level="REPEATABLE READ") as connection:
+            with connection.begin():
+                snapshot = connection.execute(text("SELECT pg_export_snapshot()")).scalar()
+                stats = collect_stats(connection)
+                if backup_format == "directory":
+                    dump_directory(partial_path, jobs, snapshot)
+                else:
+                    dump_custom_stream(partial_path, snapshot)
+        partial_path.rename(backup_path)
     except subprocess.CalledProcessError as e:
         logger.error(f"Error creating backup: {e}")
+        remove_backup_path(partial_path)
         raise
     except Exception as e:
         logger.error(f"Unexpected error during backup: {e}")
+        remove_backup_path(partial_path)
         raise
 
+    manifest = {
+        "file": backup_path.name,
+        "format": backup_format,
+        "jobs": jobs if backup_format == "directory" else 1,
+        "database": settings.DB_NAME,
+        "started_at": started_at.isoformat(timespec="seconds"),
+        "duration_seconds": round(time.monotonic() - started, 3),
+        "bytes": path_size(backup_path),
+        "stats": stats
+    }
+    manifest_path = backup_dir / f"backup_{timestamp}.manifest.json"
+    manifest_path.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    logger.info(
+        f"Backup created successfully: {backup_path} "
+        f"({manifest['bytes']} bytes in {manifest['duration_seconds']} s)"
+    )
+
+    # Удаляем старые бэкапы по возрасту и суммарному размеру
+    cleanup_old_backups(backup_dir)
+
+    return manifest
+
+def remove_backup_path(path: Path):
+    """Удаление файла или каталога резервной копии"""
+    if path.is_dir():
+        shutil.rmtree(path, ignore_errors=True)
+    elif path.exists():
+        path.unlink()
+
+def list_backups(backup_dir: Path):
+    """Резервные копии (с манифестами, если есть) от новых к старым"""
+    backups = []
+    for path in backup_dir.glob("backup_*"):
+        if path.name.endswith((".manifest.json", ".partial")):
+            continue
+        timestamp = path.name[len("backup_"):len("backup_") + 15]
+        manifest = backup_dir / f"backup_{timestamp}.manifest.json"
+        backups.append((path.stat().st_mtime, path, manifest if manifest.exists() else None))
+    backups.sort(key=lambda item: item[0], reverse=True)
+    return backups
+
 def cleanup_old_backups(backup_dir):
-    """Удаление старых резервных копий"""
+    """Удаление резервных копий старше BACKUP_MAX_AGE_DAYS и сверх BACKUP_MAX_TOTAL_MB"""
     try:
-        # Получаем список файлов бэкапов
-        backup_files = list(backup_dir.glob("backup_*.sql.gz"))
-        backup_files.sort(reverse=True)
-        
-        # Оставляем только последние 7 дней
-        for old_file in backup_files[7:]:
-            old_file.unlink()
-            logger.info(f"Deleted old backup: {old_file}")
-            
+        backups = list_backups(Path(backup_dir))
+        max_age = timedelta(days=settings.BACKUP_MAX_AGE_DAYS).total_seconds()
+        max_total = settings.BACKUP_MAX_TOTAL_MB * 1024 * 1024
+        now = time.time()
+        total = 0
+
+        # Самую свежую копию оставляем всегда
+        for index, (mtime, path, manifest) in enumerate(backups):
+            size = path_size(path)
+            too_old = now - mtime > max_age
+            too_big = max_total and total + size > max_total
+            if index > 0 and (too_old or too_big):
+                remove_backup_path(path)
+                if manifest:
+                    manifest.unlink()
+                logger.info(f"Deleted old backup: {path}")
+                continue
+            total += size
+
     except Exception as e:
         logger.error(f"Error cleaning up old backups: {e}")
 
+def main():
+    parser = argparse.ArgumentParser(description="Резервное копирование базы данных")
+    parser.add_argument("--format", choices=BACKUP_FORMATS, help="формат дампа (по умолчанию BACKUP_FORMAT)")
+    parser.add_argument("--jobs", type=int, help="число параллельных процессов pg_dump (формат directory)")
+    args = parser.parse_args()
+    create_backup(args.format, args.jobs)
+
 if __name__ == "__main__":
-    create_backup() 
\ No newline at end of file
+    main()
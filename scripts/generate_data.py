@@ -0,0 +1,334 @@
+"""Генерация синтетических данных production-масштаба для настройки запросов.
+
+Создает агентов, карточки ТО и выплаты с реалистичным распределением: у немногих
+агентов большая часть записей, даты записей идут по рабочим часам и слотам станций
+из справочника, статус зависит от того, прошла ли дата записи. Данные загружаются
+через COPY FROM STDIN потоком, без промежуточных файлов и объектов ORM, после чего
+таблицы анализируются, чтобы EXPLAIN показывал планы как на живой базе.
+
+Скрипт пишет в базу из `.env`, поэтому используйте локальную/тестовую БД.
+
+Примеры:
+    python -m scripts.generate_data --agents 5000 --cards 3000000 --payments 200000
+    python -m scripts.generate_data --cards 100000 --status approved=70 --status cancelled=10
+    python -m scripts.generate_data --cleanup
+"""
+import argparse
+import csv
+import io
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from itertools import accumulate, islice
+
+from sqlalchemy import text
+
+from config import settings
+from database.database import SessionLocal, engine
+from database.models import Agent, CardStatus, Payment, Station, TOCard, TOCardArchive, UserRole
+
+# Диапазон telegram_id синтетических агентов (не пересекается с реальными и с load_test)
+SYNTHETIC_ID_BASE = 2_000_000_000
+SYNTHETIC_ID_LIMIT = 2_100_000_000
+# Префикс номеров синтетических карточек
+CARD_NUMBER_PREFIX = "SYN"
+
+# Доли статусов по умолчанию (в процентах): для прошедших записей pending
+# превращается в expired, как это делает задача просрочки
+DEFAULT_STATUS_WEIGHTS = {
+    CardStatus.APPROVED: 70,
+    CardStatus.PENDING: 10,
+    CardStatus.REJECTED: 8,
+    CardStatus.CANCELLED: 10,
+    CardStatus.EXPIRED: 2,
+}
+
+# Строк, формируемых за одно обращение COPY к генератору
+ROWS_PER_CHUNK = 1000
+
+FIRST_NAMES = ("Александр", "Дмитрий", "Максим", "Сергей", "Андрей", "Алексей", "Иван", "Михаил",
+               "Елена", "Ольга", "Наталья", "Анна", "Татьяна", "Мария", "Ирина", "Светлана")
+LAST_NAMES = ("Иванов", "Смирнов", "Кузнецов", "Попов", "Васильев", "Петров", "Соколов", "Михайлов",
+              "Новиков", "Федоров", "Морозов", "Волков", "Алексеев", "Лебедев", "Семенов", "Егоров")
+COMPANIES = ("ООО «Автострах»", "ИП", "ООО «Полис-Сервис»", "АО «Техосмотр Плюс»", "ООО «Драйв»", None)
+PLATE_LETTERS = "АВЕКМНОРСТУХ"
+VIN_CHARS = "ABCDEFGHJKLMNPRSTUVWXYZ0123456789"
+DEFECT_DESCRIPTIONS = {
+    "minor": ("Не горит габарит", "Трещина на лобовом стекле", "Износ щеток стеклоочистителя"),
+    "major": ("Люфт рулевого управления", "Неисправна тормозная система", "Течь масла из двигателя"),
+}
+REJECT_REASONS = ("Неверный VIN", "Дубликат записи", "Станция не работает в этот день", "Неполные данные клиента")
+
+class CsvStream:
+    """Файл для COPY FROM STDIN: CSV формируется по мере чтения из итератора строк"""
+
+    def __init__(self, rows):
+        self._rows = iter(rows)
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator="\n")
+        self._done = False
+        self.rows = 0
+
+    def read(self, size: int = -1):
+        while not self._done and (size < 0 or self._buffer.tell() < size):
+            chunk = list(islice(self._rows, ROWS_PER_CHUNK))
+            if not chunk:
+                self._done = True
+                break
+            # None записывается пустым полем без кавычек, что в COPY CSV означает NULL
+            self._writer.writerows(chunk)
+            self.rows += len(chunk)
+
+        data = self._buffer.getvalue()
+        rest = ""
+        if 0 <= size < len(data):
+            data, rest = data[:size], data[size:]
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        self._buffer.write(rest)
+        return data
+
+def copy_rows(table: str, columns, rows):
+    """Потоковая загрузка строк в таблицу одним COPY в отдельной транзакции"""
+    started = time.monotonic()
+    stream = CsvStream(rows)
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        # Синтетические данные не нужно дожидаться на диске при коммите
+        cursor.execute("SET synchronous_commit = off")
+        cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", stream)
+        connection.commit()
+    finally:
+        connection.close()
+    elapsed = time.monotonic() - started
+    print(f"{table}: {stream.rows} строк за {elapsed:.1f} с ({stream.rows / max(elapsed, 0.001):.0f} строк/с)")
+
+def parse_weights(values):
+    """["approved=70", "pending=10"] -> {CardStatus.APPROVED: 70.0, ...} поверх значений по умолчанию"""
+    weights = dict(DEFAULT_STATUS_WEIGHTS)
+    for value in values or []:
+        status, _, weight = value.partition("=")
+        try:
+            weights[CardStatus(status)] = float(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Ожидается СТАТУС=ДОЛЯ, получено: {value}")
+    if sum(weights.values()) <= 0:
+        raise argparse.ArgumentTypeError("Сумма долей статусов должна быть больше нуля")
+    return weights
+
+def load_stations():
+    """Активные станции из справочника (их цены, часы и слоты задают карточки)"""
+    db = SessionLocal()
+    try:
+        stations = db.query(Station).filter(Station.active.is_(True)).order_by(Station.id).all()
+    finally:
+        db.close()
+    if not stations:
+        sys.exit("В справочнике нет активных станций: сначала выполните python -m scripts.stations import-env")
+    return stations
+
+def station_slots(station):
+    """Время начала слотов станции за день (часы, минуты)"""
+    start = datetime.strptime(station.working_hours["start"], "%H:%M")
+    end = datetime.strptime(station.working_hours["end"], "%H:%M")
+    slots = []
+    while start < end:
+        slots.append((start.hour, start.minute))
+        start += timedelta(minutes=station.time_slot)
+    return slots
+
+def person_name(rng):
+    last_name = rng.choice(LAST_NAMES)
+    first_name = rng.choice(FIRST_NAMES)
+    # Женские фамилии для женских имен
+    if first_name.endswith("а"):
+        last_name += "а"
+    return f"{last_name} {first_name}"
+
+def phone(rng):
+    return f"+79{rng.randrange(10 ** 9):09d}"
+
+def car_number(rng):
+    letters = rng.choices(PLATE_LETTERS, k=3)
+    return f"{letters[0]}{rng.randrange(1, 1000):03d}{letters[1]}{letters[2]}{rng.choice((77, 97, 177, 50, 190, 78))}"
+
+def vin(rng):
+    return "".join(rng.choices(VIN_CHARS, k=17))
+
+def agent_rows(count: int, since: datetime, rng):
+    for i in range(count):
+        yield (
+            SYNTHETIC_ID_BASE + i, person_name(rng), phone(rng), rng.choice(COMPANIES), UserRole.AGENT.name,
+            rng.choice((0.05, 0.1, 0.15, 0.2)), f"https://t.me/agent{SYNTHETIC_ID_BASE + i}",
+            since + timedelta(seconds=rng.randrange(int((datetime.now() - since).total_seconds())))
+        )
+
+def agent_weights(agent_ids, skew: float, rng):
+    """Накопленные веса агентов: при skew > 0 немногие агенты создают большую часть записей (Парето)"""
+    return list(accumulate(rng.paretovariate(skew) if skew > 0 else 1.0 for _ in agent_ids))
+
+def card_rows(count: int, agent_ids, cumulative, stations, args, rng):
+    now = datetime.now()
+    first_day = (now - timedelta(days=args.months * 30)).replace(hour=0, minute=0, second=0, microsecond=0)
+    past_days = max(1, (now - first_day).days)
+    days = past_days + args.future_days
+    slots = {station.id: station_slots(station) for station in stations}
+    statuses = list(args.status)
+    status_weights = [args.status[status] for status in statuses]
+    # Занятость будущих слотов: (станция, время, категория) -> действующих записей
+    booked = defaultdict(int)
+
+    for i in range(count):
+        station = rng.choice(stations)
+        category = rng.choice(station.categories)
+        hour, minute = rng.choice(slots[station.id])
+        appointment_time = (first_day + timedelta(days=rng.randrange(days))).replace(hour=hour, minute=minute)
+        status = rng.choices(statuses, status_weights)[0]
+
+        # В окне бронирования слот вмещает не больше записей, чем у станции линий
+        # (как при подтверждении в боте), иначе все даты выглядели бы занятыми.
+        # Лишняя запись переносится на прошедший день в то же время
+        if appointment_time > now and status != CardStatus.CANCELLED:
+            slot = (station.id, appointment_time, category)
+            if booked[slot] < (station.capacity or {}).get(category, 1):
+                booked[slot] += 1
+            else:
+                appointment_time = (first_day + timedelta(days=rng.randrange(past_days))).replace(hour=hour, minute=minute)
+
+        # Запись создается за 10 минут - 7 дней до визита, но не позже текущего момента
+        created_at = min(appointment_time - timedelta(minutes=rng.randrange(10, 7 * 24 * 60)), now)
+
+        if appointment_time <= now and status == CardStatus.PENDING:
+            status = CardStatus.EXPIRED
+        elif appointment_time > now and status == CardStatus.EXPIRED:
+            status = CardStatus.PENDING
+
+        defect_type = rng.choice(("minor", "major")) if rng.random() < args.defect_rate else None
+        price = float(station.prices.get(category, 0))
+        if defect_type:
+            price += float(station.defect_prices.get(defect_type, 0))
+
+        admin_comment = None
+        if status == CardStatus.REJECTED:
+            admin_comment = rng.choice(REJECT_REASONS)
+        elif status == CardStatus.CANCELLED:
+            admin_comment = "Отменено агентом"
+
+        closed = status != CardStatus.PENDING
+        reminder_due = appointment_time - timedelta(hours=settings.REMINDER_HOURS_BEFORE)
+        reminder_sent_at = reminder_due if status == CardStatus.APPROVED and reminder_due <= now else None
+        updated_at = min(created_at + timedelta(minutes=rng.randrange(5, 48 * 60)), now) if closed else created_at
+
+        yield (
+            f"{CARD_NUMBER_PREFIX}{i + 1:09d}", rng.choices(agent_ids, cum_weights=cumulative)[0], station.id,
+            category, station.name, defect_type is not None, defect_type,
+            rng.choice(DEFECT_DESCRIPTIONS[defect_type]) if defect_type else None,
+            appointment_time, person_name(rng), car_number(rng), vin(rng), phone(rng), price,
+            status.value, admin_comment, created_at, reminder_sent_at, 2 if closed else 1, updated_at
+        )
+
+def payment_rows(count: int, agent_ids, cumulative, args, rng):
+    now = datetime.now()
+    period = int(args.months * 30 * 24 * 3600)
+    for _ in range(count):
+        created_at = now - timedelta(seconds=rng.randrange(period))
+        yield (
+            rng.choices(agent_ids, cum_weights=cumulative)[0], float(rng.randrange(5, 200) * 100),
+            f"Выплата комиссии за {created_at:%m.%Y}", created_at
+        )
+
+def synthetic_agent_ids(db):
+    query = db.query(Agent.id).filter(
+        Agent.telegram_id >= SYNTHETIC_ID_BASE, Agent.telegram_id < SYNTHETIC_ID_LIMIT
+    ).order_by(Agent.id)
+    return [agent_id for agent_id, in query]
+
+def cleanup():
+    """Удаление синтетических агентов вместе с их карточками и выплатами"""
+    db = SessionLocal()
+    try:
+        agent_ids = synthetic_agent_ids(db)
+        for model in (TOCard, TOCardArchive, Payment):
+            deleted = db.query(model).filter(model.agent_id.in_(agent_ids)).delete(synchronize_session=False)
+            print(f"{model.__tablename__}: удалено {deleted}")
+        deleted = db.query(Agent).filter(Agent.id.in_(agent_ids)).delete(synchronize_session=False)
+        print(f"agents: удалено {deleted}")
+        db.commit()
+    finally:
+        db.close()
+
+def analyze():
+    """Обновление статистики планировщика после массовой загрузки"""
+    with engine.connect() as connection:
+        connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+        for table in ("agents", "to_cards", "payments"):
+            connection.execute(text(f"ANALYZE {table}"))
+
+def generate(args):
+    rng = random.Random(args.seed)
+    stations = load_stations()
+
+    db = SessionLocal()
+    try:
+        if synthetic_agent_ids(db):
+            sys.exit("Синтетические данные уже загружены: удалите их с --cleanup и запустите генерацию снова")
+    finally:
+        db.close()
+
+    since = datetime.now() - timedelta(days=args.months * 30)
+    copy_rows("agents", (
+        "telegram_id", "full_name", "phone", "company", "role", "commission_rate", "messenger_link", "created_at"
+    ), agent_rows(args.agents, since, rng))
+
+    # id агентов назначает последовательность: читаем их после загрузки
+    db = SessionLocal()
+    try:
+        agent_ids = synthetic_agent_ids(db)
+    finally:
+        db.close()
+    # Одни и те же активные агенты и записывают клиентов, и получают выплаты
+    cumulative = agent_weights(agent_ids, args.agent_skew, rng)
+
+    copy_rows("to_cards", (
+        "card_number", "agent_id", "station_id", "category", "sto_name", "has_defects", "defect_type",
+        "defect_description", "appointment_time", "client_name", "car_number", "vin_number", "client_phone",
+        "total_price", "status", "admin_comment", "created_at", "reminder_sent_at", "version", "updated_at"
+    ), card_rows(args.cards, agent_ids, cumulative, stations, args, rng))
+
+    copy_rows("payments", ("agent_id", "amount", "comment", "created_at"), payment_rows(args.payments, agent_ids, cumulative, args, rng))
+
+    analyze()
+    print("Готово. Закрытые карточки старше ARCHIVE_AFTER_MONTHS можно перенести в архив: python -m scripts.archive_cards")
+
+def main():
+    parser = argparse.ArgumentParser(description="Генерация синтетических агентов, карточек ТО и выплат")
+    parser.add_argument("--agents", type=int, default=5000, help="количество агентов")
+    parser.add_argument("--cards", type=int, default=3_000_000, help="количество карточек ТО")
+    parser.add_argument("--payments", type=int, default=200_000, help="количество выплат")
+    parser.add_argument("--months", type=int, default=24, help="за сколько месяцев назад распределять даты")
+    parser.add_argument("--future-days", type=int, default=8, help="на сколько дней вперед создавать записи")
+    parser.add_argument("--status", action="append", metavar="СТАТУС=ДОЛЯ",
+                        help="доля статуса карточек, например approved=70 (можно повторять)")
+    parser.add_argument("--defect-rate", type=float, default=0.2, help="доля карточек с дефектами")
+    parser.add_argument("--agent-skew", type=float, default=1.2,
+                        help="параметр Парето для активности агентов (0 - равномерно)")
+    parser.add_argument("--seed", type=int, default=42, help="зерно генератора случайных чисел")
+    parser.add_argument("--cleanup", action="store_true", help="удалить ранее созданные синтетические данные")
+    args = parser.parse_args()
+
+    if args.cleanup:
+        cleanup()
+        return
+    if args.agents < 1 or args.agents > SYNTHETIC_ID_LIMIT - SYNTHETIC_ID_BASE:
+        parser.error("--agents должно быть от 1 до 100000000")
+    try:
+        args.status = parse_weights(args.status)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    generate(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""Нагрузочный тест бота без Telegram.
+
+Собирает настоящее приложение из main.py, подменяет сетевой слой бота заглушкой
+и прогоняет через него сценарии из синтетических Update: полное бронирование,
+просмотр архива и согласование карточек администратором. Работает с базой из
+настроек (.env), поэтому запускать его нужно на локальной/тестовой БД.
+
+Запуск: python -m scripts.load_test --users 20 --bookings 5
+
+С QUERY_DEBUG=true QUERY_BUDGET_STRICT=true каждый обработчик проверяет свой
+бюджет запросов (@query_budget): превышение считается ошибкой шага, а скрипт
+завершается с ненулевым кодом, поэтому его можно запускать в CI.
+"""
+import argparse
+import asyncio
+import json
+import math
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from telegram import Update
+from telegram.ext import Application
+from telegram.request import BaseRequest
+
+from database.database import SessionLocal
+from database.schema import verify_schema
+from database.stations import station_catalog
+from database.models import Agent, Payment, TOCard, TOCardArchive, UserRole, CardStatus
+from config import settings
+from main import build_application
+from utils.logger import logger
+from utils.query_budget import QueryBudgetExceeded
+
+# Диапазон telegram_id для синтетических пользователей (не пересекается с реальными)
+LOAD_TEST_ID_BASE = 2_100_000_000
+ADMIN_TELEGRAM_ID = LOAD_TEST_ID_BASE
+
+class FakeTelegramRequest(BaseRequest):
+    """Заглушка сетевого слоя бота: отвечает на все вызовы Bot API успешно"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = defaultdict(int)
+        self._message_id = 0
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit("/", 1)[-1]
+        self.calls[api_method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        parameters = request_data.parameters if request_data else {}
+        if api_method == "getMe":
+            result = {
+                "id": 1, "is_bot": True, "first_name": "LoadTest", "username": "load_test_bot",
+                "can_join_groups": False, "can_read_all_group_messages": False,
+                "supports_inline_queries": False
+            }
+        elif api_method in ("sendMessage", "editMessageText"):
+            self._message_id += 1
+            chat_id = parameters.get("chat_id", 0)
+            result = {
+                "message_id": parameters.get("message_id", self._message_id),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": parameters.get("text", "")
+            }
+        else:
+            result = True
+
+        return 200, json.dumps({"ok": True, "result": result}).encode("utf-8")
+
+class UpdateFactory:
+    """Генератор синтетических Update от имени пользователя"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._update_id = 0
+
+    def _next_id(self):
+        self._update_id += 1
+        return self._update_id
+
+    def _user(self, telegram_id):
+        return {"id": telegram_id, "is_bot": False, "first_name": f"Load {telegram_id}"}
+
+    def message(self, telegram_id, text):
+        update_id = self._next_id()
+        message = {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": telegram_id, "type": "private"},
+            "from": self._user(telegram_id),
+            "text": text
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return Update.de_json({"update_id": update_id, "message": message}, self.bot)
+
+    def callback(self, telegram_id, data):
+        update_id = self._next_id()
+        return Update.de_json({
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": self._user(telegram_id),
+                "chat_instance": str(telegram_id),
+                "data": data,
+                "message": {
+                    "message_id": update_id,
+                    "date": int(time.time()),
+                    "chat": {"id": telegram_id, "type": "private"},
+                    "text": "..."
+                }
+            }
+        }, self.bot)
+
+class LatencyRecorder:
+    """Сбор задержек обработки по обработчикам"""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.budget_violations = []
+        self._failed_updates = set()
+
+    async def on_error(self, update, context):
+        """Обработчик ошибок приложения: исключения обработчиков не теряются в логе PTB"""
+        if isinstance(update, Update):
+            self._failed_updates.add(update.update_id)
+        if isinstance(context.error, QueryBudgetExceeded):
+            self.budget_violations.append(str(context.error))
+
+    async def run(self, application: Application, label: str, update: Update):
+        started = time.perf_counter()
+        try:
+            await application.process_update(update)
+        except Exception as e:
+            self._failed_updates.add(update.update_id)
+            logger.error(f"Load test step {label} failed: {e}")
+        if update.update_id in self._failed_updates:
+            self.errors[label] += 1
+        self.samples[label].append(time.perf_counter() - started)
+
+    @property
+    def failed(self):
+        return any(self.errors.values())
+
+    def report(self, wall_time: float):
+        total = sum(len(values) for values in self.samples.values())
+        lines = [
+            f"Всего обновлений: {total} за {wall_time:.2f} с ({total / wall_time:.1f} upd/s)",
+            "",
+            f"{'обработчик':<28}{'кол-во':>8}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}{'ошибки':>8}"
+        ]
+        for label in sorted(self.samples):
+            values = sorted(self.samples[label])
+            lines.append(
+                f"{label:<28}{len(values):>8}"
+                f"{percentile(values, 50) * 1000:>10.1f}"
+                f"{percentile(values, 95) * 1000:>10.1f}"
+                f"{percentile(values, 99) * 1000:>10.1f}"
+                f"{self.errors[label]:>8}"
+            )
+        return "\n".join(lines)
+
+def percentile(sorted_values, p):
+    """Перцентиль по методу ближайшего ранга"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def seed_agents(users: int):
+    """Создание синтетических агентов и администратора"""
+    db = SessionLocal()
+    try:
+        existing = {
+            telegram_id for (telegram_id,) in db.query(Agent.telegram_id).filter(
+                Agent.telegram_id >= LOAD_TEST_ID_BASE,
+                Agent.telegram_id <= LOAD_TEST_ID_BASE + users
+            )
+        }
+        for i in range(users + 1):
+            telegram_id = LOAD_TEST_ID_BASE + i
+            if telegram_id in existing:
+                continue
+            db.add(Agent(
+                telegram_id=telegram_id,
+                full_name=f"Нагрузочный агент {i}",
+                phone="+70000000000",
+                company="Load test",
+                role=UserRole.ADMIN if telegram_id == ADMIN_TELEGRAM_ID else UserRole.AGENT
+            ))
+        db.commit()
+    finally:
+        db.close()
+
+def cleanup_agents():
+    """Удаление синтетических агентов и их данных"""
+    db = SessionLocal()
+    try:
+        agent_ids = db.query(Agent.id).filter(Agent.telegram_id >= LOAD_TEST_ID_BASE)
+        db.query(TOCard).filter(TOCard.agent_id.in_(agent_ids)).delete(synchronize_session=False)
+        db.query(TOCardArchive).filter(TOCardArchive.agent_id.in_(agent_ids)).delete(synchronize_session=False)
+        db.query(Payment).filter(Payment.agent_id.in_(agent_ids)).delete(synchronize_session=False)
+        db.query(Agent).filter(Agent.telegram_id >= LOAD_TEST_ID_BASE).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+def pending_card_ids():
+    """ID карточек синтетических агентов, ожидающих согласования"""
+    db = SessionLocal()
+    try:
+        agent_ids = db.query(Agent.id).filter(Agent.telegram_id >= LOAD_TEST_ID_BASE)
+        return [card_id for (card_id,) in db.query(TOCard.id).filter(
+            TOCard.agent_id.in_(agent_ids),
+            TOCard.status == CardStatus.PENDING
+        ).order_by(TOCard.id)]
+    finally:
+        db.close()
+
+async def booking_scenario(application, factory, recorder, telegram_id, bookings, category, station_id, first_slot=0):
+    """Полный диалог бронирования, повторенный несколько раз.
+
+    Каждый агент записывается в свои слоты (начиная с first_slot-го, со следующего дня),
+    чтобы подтверждение не упиралось в число линий станции.
+    """
+    station = station_catalog.get(station_id)
+    start = datetime.strptime(station.working_hours["start"], "%H:%M")
+    end = datetime.strptime(station.working_hours["end"], "%H:%M")
+    slots_per_day = max(1, int((end - start).total_seconds() // 60) // station.time_slot)
+
+    for n in range(bookings):
+        day, index = divmod(first_slot + n, slots_per_day)
+        date = (datetime.now() + timedelta(days=1 + day)).strftime("%d.%m.%Y")
+        slot = (start + timedelta(minutes=station.time_slot * index)).strftime("%H:%M")
+        steps = [
+            ("start_booking", factory.callback(telegram_id, f"to_category_{category}")),
+            ("select_sto", factory.callback(telegram_id, f"sto_{station_id}")),
+            ("confirm_category_price", factory.callback(telegram_id, "confirm_price")),
+            ("check_defects", factory.callback(telegram_id, "defects_none")),
+            ("select_date", factory.callback(telegram_id, f"date_{date}")),
+            ("select_time", factory.callback(telegram_id, f"time_{slot}")),
+            ("client_name_handler", factory.message(telegram_id, "Иван Иванов")),
+            ("car_number_handler", factory.message(telegram_id, "А123ВС77")),
+            ("vin_number_handler", factory.message(telegram_id, "XTA21099012345678")),
+            ("client_phone_handler", factory.message(telegram_id, "+79990000000")),
+            ("confirm_booking", factory.callback(telegram_id, "confirm_booking")),
+        ]
+        for label, update in steps:
+            await recorder.run(application, label, update)
+
+async def archive_scenario(application, factory, recorder, telegram_id, pages):
+    """Просмотр активных записей и архива"""
+    await recorder.run(application, "show_my_bookings", factory.callback(telegram_id, "my_bookings"))
+    await recorder.run(application, "show_archive", factory.callback(telegram_id, "archive"))
+    for page in range(1, pages):
+        await recorder.run(application, "show_archive", factory.callback(telegram_id, f"archive_page_{page}"))
+
+async def approval_scenario(application, factory, recorder, card_ids):
+    """Согласование карточек администратором"""
+    await recorder.run(application, "admin_panel", factory.callback(ADMIN_TELEGRAM_ID, "admin_panel"))
+    for card_id in card_ids:
+        await recorder.run(application, "show_pending_approvals", factory.callback(ADMIN_TELEGRAM_ID, "admin_approve"))
+        await recorder.run(application, "handle_approve_card", factory.callback(ADMIN_TELEGRAM_ID, f"approve_card_{card_id}"))
+
+async def run(args):
+    """Прогон всех сценариев и вывод отчета"""
+    # Схему создают миграции (alembic upgrade head), как и для бота
+    verify_schema()
+    seed_agents(args.users)
+
+    fake_request = FakeTelegramRequest(latency=args.api_latency_ms / 1000)
+    builder = (
+        Application.builder()
+        .token("123456:LOAD-TEST")
+        .request(fake_request)
+        .get_updates_request(FakeTelegramRequest())
+    )
+    application = build_application(builder)
+    recorder = LatencyRecorder()
+    application.add_error_handler(recorder.on_error)
+    await application.initialize()
+
+    factory = UpdateFactory(application.bot)
+    station_id = args.station or station_catalog.available()[0].code
+    category = station_catalog.get(station_id).categories[0]
+    agents = [LOAD_TEST_ID_BASE + i for i in range(1, args.users + 1)]
+
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*[
+            booking_scenario(
+                application, factory, recorder, telegram_id, args.bookings, category, station_id, i * args.bookings
+            )
+            for i, telegram_id in enumerate(agents)
+        ])
+        booking_time = time.perf_counter() - started
+
+        await asyncio.gather(*[
+            archive_scenario(application, factory, recorder, telegram_id, args.archive_pages)
+            for telegram_id in agents
+        ])
+
+        card_ids = pending_card_ids()[:args.approvals]
+        await approval_scenario(application, factory, recorder, card_ids)
+        wall_time = time.perf_counter() - started
+    finally:
+        await application.shutdown()
+        if args.cleanup:
+            cleanup_agents()
+
+    bookings_total = len(agents) * args.bookings
+    print(f"Бронирований: {bookings_total} за {booking_time:.2f} с ({bookings_total / booking_time:.2f} бронирований/с)")
+    print(recorder.report(wall_time))
+    print("\nВызовы Bot API: " + ", ".join(f"{name}={count}" for name, count in sorted(fake_request.calls.items())))
+
+    if recorder.budget_violations:
+        print("\nПревышены бюджеты запросов:")
+        for violation in sorted(set(recorder.budget_violations)):
+            print(f"  {violation}")
+    elif not (settings.QUERY_DEBUG and settings.QUERY_BUDGET_STRICT):
+        print("\nБюджеты запросов не проверялись: запустите с QUERY_DEBUG=true QUERY_BUDGET_STRICT=true")
+    return 1 if recorder.failed else 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота на синтетических обновлениях")
+    parser.add_argument("--users", type=int, default=10, help="количество параллельных агентов")
+    parser.add_argument("--bookings", type=int, default=3, help="бронирований на агента")
+    parser.add_argument("--archive-pages", type=int, default=2, help="страниц архива на агента")
+    parser.add_argument("--approvals", type=int, default=20, help="карточек для согласования")
+    parser.add_argument("--station", help="код станции из справочника (по умолчанию первая активная)")
+    parser.add_argument("--api-latency-ms", type=float, default=0.0, help="имитация задержки Bot API")
+    parser.add_argument("--cleanup", action="store_true", help="удалить синтетические данные после прогона")
+    sys.exit(asyncio.run(run(parser.parse_args())))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Восстановление резервной копии в отдельную базу и проверка ее пригодности.
+
+Запуск: python -m scripts.restore_db backups/backup_20261019_220000.manifest.json
+"""
+import argparse
+import gzip
+import json
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+from sqlalchemy import create_engine
+from config import settings
+from database.database import database_url
+from scripts.backup_db import CHUNK_SIZE, collect_stats, pg_connection_args, pg_env
+from utils.logger import logger
+
+def server_args():
+    """Параметры подключения к серверу без имени базы (для createdb/dropdb)"""
+    return ["-h", settings.DB_HOST, "-p", str(settings.DB_PORT), "-U", settings.DB_USER]
+
+def recreate_database(db_name: str):
+    """Пересоздание пустой базы для проверочного восстановления"""
+    if db_name == settings.DB_NAME:
+        raise ValueError("Проверочное восстановление в рабочую базу запрещено")
+    subprocess.run(["dropdb", *server_args(), "--if-exists", db_name], env=pg_env(), check=True)
+    subprocess.run(["createdb", *server_args(), db_name], env=pg_env(), check=True)
+
+def drop_database(db_name: str):
+    """Удаление проверочной базы"""
+    subprocess.run(["dropdb", *server_args(), "--if-exists", db_name], env=pg_env(), check=True)
+
+def restore_directory(backup_path: Path, db_name: str, jobs: int):
+    """Параллельное восстановление дампа в формате directory"""
+    cmd = ["pg_restore", *pg_connection_args(db_name), "--no-owner", "-j", str(jobs), str(backup_path)]
+    subprocess.run(cmd, env=pg_env(), check=True)
+
+def restore_custom_stream(backup_path: Path, db_name: str):
+    """Восстановление сжатого дампа custom с распаковкой на лету (pg_restore из stdin работает в один поток)"""
+    cmd = ["pg_restore", *pg_connection_args(db_name), "--no-owner"]
+    with subprocess.Popen(cmd, stdin=subprocess.PIPE, env=pg_env()) as process:
+        with gzip.open(backup_path, "rb") as source:
+            shutil.copyfileobj(source, process.stdin, CHUNK_SIZE)
+        process.stdin.close()
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd)
+
+def compare_stats(expected: dict, actual: dict):
+    """Расхождения между показателями из манифеста и восстановленной базы"""
+    mismatches = []
+    for key, expected_value in expected.items():
+        actual_value = actual.get(key)
+        if isinstance(expected_value, float):
+            matches = actual_value is not None and abs(actual_value - expected_value) < 0.01
+        else:
+            matches = actual_value == expected_value
+        if not matches:
+            mismatches.append(f"{key}: ожидалось {expected_value}, получено {actual_value}")
+    return mismatches
+
+def restore_backup(manifest_path: Path, db_name: str = None, jobs: int = None, keep: bool = False):
+    """Восстановление копии в проверочную базу, сверка с манифестом и замер времени"""
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    backup_path = manifest_path.parent / manifest["file"]
+    db_name = db_name or f"{settings.DB_NAME}_restore_check"
+    jobs = jobs or settings.BACKUP_JOBS
+
+    recreate_database(db_name)
+    try:
+        started = time.monotonic()
+        if manifest["format"] == "directory":
+            restore_directory(backup_path, db_name, jobs)
+        else:
+            restore_custom_stream(backup_path, db_name)
+        restore_seconds = time.monotonic() - started
+
+        check_engine = create_engine(database_url(db_name))
+        try:
+            with check_engine.connect() as connection:
+                actual = collect_stats(connection)
+        finally:
+            check_engine.dispose()
+    finally:
+        if not keep:
+            drop_database(db_name)
+
+    mismatches = compare_stats(manifest.get("stats", {}), actual)
+    result = {
+        "file": manifest["file"],
+        "restore_seconds": round(restore_seconds, 3),
+        "backup_seconds": manifest.get("duration_seconds"),
+        "stats": actual,
+        "mismatches": mismatches
+    }
+
+    if mismatches:
+        logger.error(f"Backup {manifest['file']} verification failed: {'; '.join(mismatches)}")
+    else:
+        logger.info(f"Backup {manifest['file']} restored and verified in {result['restore_seconds']} s")
+
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Проверочное восстановление резервной копии")
+    parser.add_argument("manifest", type=Path, help="путь к backup_<время>.manifest.json")
+    parser.add_argument("--target-db", help="имя проверочной базы (по умолчанию <DB_NAME>_restore_check)")
+    parser.add_argument("--jobs", type=int, help="число параллельных процессов pg_restore (формат directory)")
+    parser.add_argument("--keep", action="store_true", help="не удалять проверочную базу после проверки")
+    args = parser.parse_args()
+
+    result = restore_backup(args.manifest, args.target_db, args.jobs, args.keep)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    sys.exit(1 if result["mismatches"] else 0)
+
+if __name__ == "__main__":
+    main()
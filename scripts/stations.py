@@ -0,0 +1,125 @@
+"""Управление справочником станций СТО без перезапуска бота.
+
+Примеры:
+    python -m scripts.stations list
+    python -m scripts.stations set station3 --name "СТО 3" --address "ул. Новая, 3" \
+        --categories B,C --price B=2100 --price C=3100 --hours 09:00-18:00 --slot 30 \
+        --defect-price minor=1000 --defect-price major=2000 --capacity B=3
+    python -m scripts.stations set station1 --price B=2200
+    python -m scripts.stations disable station2
+    python -m scripts.stations import-env
+"""
+import argparse
+import sys
+from config import settings
+from database.database import SessionLocal
+from database.models import Station
+from database.stations import save_station
+
+def parse_pairs(values):
+    """["B=2000", "C=3000"] -> {"B": 2000.0, "C": 3000.0}"""
+    result = {}
+    for value in values or []:
+        key, _, amount = value.partition("=")
+        if not key or not amount:
+            raise argparse.ArgumentTypeError(f"Ожидается КЛЮЧ=ЗНАЧЕНИЕ, получено: {value}")
+        result[key] = float(amount)
+    return result
+
+def parse_hours(value: str):
+    """09:00-17:00 -> {"start": "09:00", "end": "17:00"}"""
+    start, _, end = value.partition("-")
+    return {"start": start, "end": end}
+
+def list_stations(db):
+    for station in db.query(Station).order_by(Station.id):
+        state = "" if station.active else " [отключена]"
+        print(
+            f"{station.id}\t{station.code}\t{station.name} ({station.address}){state}\n"
+            f"\tкатегории: {', '.join(station.categories)}; цены: {station.prices}; "
+            f"часы: {station.working_hours['start']}-{station.working_hours['end']}; "
+            f"слот: {station.time_slot} мин; линий: {station.capacity or 'по 1'}; дефекты: {station.defect_prices}"
+        )
+
+def set_station(db, args):
+    existing = db.query(Station).filter(Station.code == args.code).first()
+    fields = {}
+    if args.name:
+        fields["name"] = args.name
+    if args.address:
+        fields["address"] = args.address
+    if args.categories:
+        fields["categories"] = args.categories.split(",")
+    if args.price:
+        # Цены дополняют существующие, чтобы можно было поменять одну категорию
+        fields["prices"] = {**(existing.prices if existing else {}), **parse_pairs(args.price)}
+    if args.hours:
+        fields["working_hours"] = parse_hours(args.hours)
+    if args.slot:
+        fields["time_slot"] = args.slot
+    if args.defect_price:
+        fields["defect_prices"] = {**(existing.defect_prices if existing else {}), **parse_pairs(args.defect_price)}
+    if args.capacity:
+        capacity = {category: int(lanes) for category, lanes in parse_pairs(args.capacity).items()}
+        fields["capacity"] = {**(existing.capacity if existing else {}), **capacity}
+
+    if existing is None:
+        required = ("name", "address", "categories", "prices", "working_hours", "time_slot")
+        missing = [name for name in required if name not in fields]
+        if missing:
+            sys.exit(f"Для новой станции нужно указать: {', '.join(missing)}")
+        fields.setdefault("defect_prices", {})
+        fields.setdefault("capacity", {})
+        fields["active"] = True
+
+    save_station(db, args.code, **fields)
+    print(f"Станция {args.code} сохранена")
+
+def import_env(db):
+    """Создание или обновление станций из STO_STATIONS"""
+    for code, station in settings.STO_STATIONS.items():
+        save_station(db, code, **station.model_dump(), active=True)
+        print(f"Станция {code} импортирована")
+
+def main():
+    parser = argparse.ArgumentParser(description="Справочник станций СТО")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    commands.add_parser("list", help="список станций")
+
+    set_parser = commands.add_parser("set", help="создать или изменить станцию")
+    set_parser.add_argument("code")
+    set_parser.add_argument("--name")
+    set_parser.add_argument("--address")
+    set_parser.add_argument("--categories", help="через запятую, например B,C,E")
+    set_parser.add_argument("--price", action="append", help="КАТЕГОРИЯ=ЦЕНА, можно несколько раз")
+    set_parser.add_argument("--hours", help="часы работы, например 09:00-17:00")
+    set_parser.add_argument("--slot", type=int, help="длительность слота в минутах")
+    set_parser.add_argument("--defect-price", action="append", help="ТИП=ЦЕНА (minor, major)")
+    set_parser.add_argument("--capacity", action="append", help="КАТЕГОРИЯ=ЛИНИЙ - машин в один слот (по умолчанию 1)")
+
+    for command in ("enable", "disable"):
+        state_parser = commands.add_parser(command, help=f"{'включить' if command == 'enable' else 'отключить'} станцию")
+        state_parser.add_argument("code")
+
+    commands.add_parser("import-env", help="загрузить станции из STO_STATIONS")
+
+    args = parser.parse_args()
+    db = SessionLocal()
+    try:
+        if args.command == "list":
+            list_stations(db)
+        elif args.command == "set":
+            set_station(db, args)
+        elif args.command in ("enable", "disable"):
+            if not db.query(Station).filter(Station.code == args.code).first():
+                sys.exit(f"Станция {args.code} не найдена")
+            save_station(db, args.code, active=args.command == "enable")
+            print(f"Станция {args.code} {'включена' if args.command == 'enable' else 'отключена'}")
+        else:
+            import_env(db)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
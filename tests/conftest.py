@@ -0,0 +1,18 @@
+"""Общая настройка тестов: обязательные настройки бота для импорта config без .env"""
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+for name, value in {
+    "BOT_TOKEN": "123456:TEST",
+    "ADMIN_IDS": "[1]",
+    "DB_HOST": "localhost",
+    "DB_PORT": "5432",
+    "DB_NAME": "sto_bot_test",
+    "DB_USER": "postgres",
+    "DB_PASSWORD": "postgres",
+    "REGISTRATION_CODE": "test",
+}.items():
+    os.environ.setdefault(name, value)
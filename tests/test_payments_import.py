@@ -0,0 +1,115 @@
+"""Импорт платежей из CSV (handlers/payments_import.py) со строгой проверкой бюджета запросов"""
+import asyncio
+import importlib
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("telegram")
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+
+from config import settings
+from database.models import Agent, Base, Payment, PaymentImport, TOCard, TOCardArchive, UserRole
+from utils import query_budget
+
+ADMIN_TELEGRAM_ID = 1001
+CSV = "telegram_id;amount;comment\n2001;1500;Выплата\n2002;-200,50;Корректировка\n".encode("utf-8")
+
+class FakeMessage:
+    """Сообщение с CSV-файлом: ответы бота собираются в replies"""
+
+    def __init__(self, content: bytes, caption: str = "/import_payments"):
+        self.caption = caption
+        self.replies = []
+
+        async def download_as_bytearray():
+            return bytearray(content)
+
+        async def get_file():
+            return SimpleNamespace(download_as_bytearray=download_as_bytearray)
+
+        self.document = SimpleNamespace(file_size=len(content), get_file=get_file)
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+@pytest.fixture
+def session_factory():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine, tables=[
+        Agent.__table__, Payment.__table__, PaymentImport.__table__, TOCard.__table__, TOCardArchive.__table__
+    ])
+    factory = sessionmaker(bind=engine)
+    db = factory()
+    db.add_all([
+        Agent(telegram_id=ADMIN_TELEGRAM_ID, full_name="Администратор", role=UserRole.ADMIN),
+        Agent(telegram_id=2001, full_name="Агент 1", role=UserRole.AGENT, commission_rate=10),
+        Agent(telegram_id=2002, full_name="Агент 2", role=UserRole.AGENT, commission_rate=10),
+    ])
+    db.commit()
+    db.close()
+    # Запросы тестовой БД считаются детектором так же, как запросы основной
+    query_budget.install(engine)
+    yield factory
+    engine.dispose()
+
+@pytest.fixture
+def payments_import(session_factory, monkeypatch):
+    """Модуль обработчика, импортированный со строгими бюджетами и тестовой БД"""
+    monkeypatch.setattr(settings, "QUERY_DEBUG", True)
+    monkeypatch.setattr(settings, "QUERY_BUDGET_STRICT", True)
+    import handlers.payments_import as module
+    # Бюджет оборачивается при импорте модуля, поэтому перечитываем его с включенной проверкой
+    module = importlib.reload(module)
+
+    def get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def run_cpu(func, *args, **kwargs):
+        return func(*args, **kwargs)
+
+    monkeypatch.setattr(module, "get_db", get_db)
+    monkeypatch.setattr("utils.roles.get_db", get_db)
+    monkeypatch.setattr(module, "run_cpu", run_cpu)
+    yield module
+    monkeypatch.undo()
+    importlib.reload(module)
+
+def send(module, content: bytes, caption: str = "/import_payments"):
+    message = FakeMessage(content, caption)
+    update = SimpleNamespace(message=message, effective_user=SimpleNamespace(id=ADMIN_TELEGRAM_ID))
+    asyncio.run(module.import_payments(update, SimpleNamespace(user_data={})))
+    return message.replies
+
+def count(session_factory, model):
+    db = session_factory()
+    try:
+        return db.query(func.count(model.id)).scalar()
+    finally:
+        db.close()
+
+def test_import_fits_query_budget(payments_import, session_factory):
+    replies = send(payments_import, CSV)
+
+    assert replies[0].startswith("✅ Добавлено карточек расчета: 2")
+    assert count(session_factory, Payment) == 2
+    assert count(session_factory, PaymentImport) == 1
+
+def test_same_file_is_not_imported_twice(payments_import, session_factory):
+    send(payments_import, CSV)
+    replies = send(payments_import, CSV)
+
+    assert replies[0].startswith("⚠️ Этот файл уже импортирован")
+    assert count(session_factory, Payment) == 2
+
+def test_invalid_file_adds_nothing(payments_import, session_factory):
+    replies = send(payments_import, "telegram_id;amount\n9999;100\n".encode("utf-8"))
+
+    assert replies[0].startswith("❌ Платежи не добавлены")
+    assert count(session_factory, Payment) == 0
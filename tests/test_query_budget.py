@@ -0,0 +1,88 @@
+"""Детектор N+1 и бюджеты запросов (utils/query_budget.py) на SQLite в памяти"""
+import asyncio
+
+import pytest
+
+sqlalchemy = pytest.importorskip("sqlalchemy")
+from sqlalchemy import create_engine, text
+
+from utils import query_budget
+from utils.query_budget import QueryBudgetExceeded, QueryTracker, assert_max_queries, track_queries
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE cards (id INTEGER PRIMARY KEY, agent_id INTEGER)"))
+        connection.execute(text("INSERT INTO cards (agent_id) VALUES (1), (1), (2)"))
+    yield engine
+    engine.dispose()
+
+def select_cards(engine, times: int):
+    with engine.connect() as connection:
+        for _ in range(times):
+            connection.execute(text("SELECT id FROM cards WHERE agent_id = :agent_id"), {"agent_id": 1}).all()
+
+def test_counts_queries_in_block(engine):
+    with track_queries("block", engines=(engine,)) as tracker:
+        select_cards(engine, 3)
+    assert tracker.count == 3
+
+def test_within_budget_passes(engine):
+    with assert_max_queries(2, engines=(engine,)) as tracker:
+        select_cards(engine, 2)
+    assert tracker.count == 2
+
+def test_exceeded_budget_fails(engine):
+    with pytest.raises(QueryBudgetExceeded, match="executed 3 queries, budget is 2"):
+        with assert_max_queries(2, "select_cards", engines=(engine,)):
+            select_cards(engine, 3)
+
+def test_exceeded_budget_only_warns_when_not_strict(engine):
+    with track_queries("select_cards", budget=1, strict=False, engines=(engine,)) as tracker:
+        select_cards(engine, 2)
+    assert tracker.count == 2
+
+def test_nested_blocks_count_in_outer_block(engine):
+    with track_queries("outer", engines=(engine,)) as outer:
+        select_cards(engine, 1)
+        with track_queries("inner", engines=(engine,)) as inner:
+            select_cards(engine, 2)
+    assert inner.count == 2
+    assert outer.count == 3
+
+def test_queries_outside_block_are_not_counted(engine):
+    with track_queries("block", engines=(engine,)) as tracker:
+        pass
+    select_cards(engine, 2)
+    assert tracker.count == 0
+
+def test_repeated_statements_are_reported_as_n_plus_one():
+    tracker = QueryTracker("handler")
+    tracker.statements["SELECT * FROM agents WHERE id = ?"] = 5
+    tracker.statements["SELECT * FROM cards"] = 1
+    assert tracker.repeated(threshold=3) == [("SELECT * FROM agents WHERE id = ?", 5)]
+
+def test_decorator_enforces_budget_in_debug_mode(engine, monkeypatch):
+    monkeypatch.setattr(query_budget.settings, "QUERY_DEBUG", True)
+    monkeypatch.setattr(query_budget.settings, "QUERY_BUDGET_STRICT", True)
+    # Считаем запросы тестового движка вместо движков бота
+    query_budget.install(engine)
+    monkeypatch.setattr(query_budget, "install", lambda *engines: None)
+
+    @query_budget.query_budget(1)
+    async def handler():
+        select_cards(engine, 2)
+
+    assert handler.query_budget == 1
+    with pytest.raises(QueryBudgetExceeded):
+        asyncio.run(handler())
+
+def test_decorator_only_declares_budget_without_debug(monkeypatch):
+    monkeypatch.setattr(query_budget.settings, "QUERY_DEBUG", False)
+
+    async def handler():
+        pass
+
+    assert query_budget.query_budget(3)(handler) is handler
+    assert handler.query_budget == 3
@@ -0,0 +1,115 @@
+"""Защита от повторных нажатий inline-кнопок.
+
+На медленной сети агент нажимает кнопку дважды, и Telegram присылает два
+callback query с одинаковыми данными: без защиты confirm_booking создает две
+карточки, а handle_approve_card дважды согласует одну. Обертка отбрасывает
+повтор до вызова обработчика (и до любых запросов к БД), если:
+- callback query с таким id уже обрабатывался (повторная доставка обновления);
+- такое же действие пользователя (user_id + callback_data) еще выполняется;
+- изменяющее действие (MUTATING_CALLBACKS) с той же кнопки того же сообщения
+  завершилось меньше CALLBACK_DEDUP_SECONDS секунд назад.
+
+Экраны просмотра и навигация (страницы списков, «Следующая карточка») повторять
+можно сразу: для них действуют только первые два правила.
+
+Состояние хранится в памяти процесса: в режиме нескольких воркеров обновления
+одного пользователя всегда попадают в один воркер.
+"""
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from telegram.error import TelegramError
+
+from config import settings
+from utils.logger import logger
+
+# Сколько id callback query помнить для отсева повторной доставки
+SEEN_CALLBACKS_LIMIT = 10000
+
+# Префиксы callback_data действий, которые меняют данные: повтор сразу после
+# завершения создал бы вторую карточку или повторил согласование/отмену
+MUTATING_CALLBACKS = ("confirm_booking", "approve_card_", "confirm_cancel")
+
+def is_mutating(data) -> bool:
+    return bool(data) and data.startswith(MUTATING_CALLBACKS)
+
+def _action_key(query):
+    """Действие пользователя: кто нажал и какую кнопку"""
+    return (query.from_user.id, query.data)
+
+def _button_key(query):
+    """Конкретная кнопка конкретного сообщения (для паузы после изменяющих действий)"""
+    message_id = query.message.message_id if query.message is not None else None
+    return (query.from_user.id, message_id, query.data)
+
+class CallbackGuard:
+    """Учет обрабатываемых и недавно выполненных нажатий"""
+
+    def __init__(self, cooldown: float, seen_limit: int = SEEN_CALLBACKS_LIMIT):
+        self.cooldown = cooldown
+        self.seen_limit = seen_limit
+        self._seen = OrderedDict()  # id callback query -> None
+        self._in_flight = set()  # (user_id, callback_data)
+        self._finished = OrderedDict()  # (user_id, message_id, callback_data) -> время завершения
+
+    def _forget_finished(self, now: float):
+        while self._finished:
+            key, finished_at = next(iter(self._finished.items()))
+            if now - finished_at < self.cooldown:
+                break
+            self._finished.popitem(last=False)
+
+    def acquire(self, query):
+        """Регистрация нажатия: None, если его нужно обработать, иначе причина отказа"""
+        if query.id in self._seen:
+            return "redelivered"
+        self._seen[query.id] = None
+        if len(self._seen) > self.seen_limit:
+            self._seen.popitem(last=False)
+
+        key = _action_key(query)
+        if key in self._in_flight:
+            return "in_flight"
+
+        self._forget_finished(time.monotonic())
+        if _button_key(query) in self._finished:
+            return "cooldown"
+
+        self._in_flight.add(key)
+        return None
+
+    def release(self, query):
+        self._in_flight.discard(_action_key(query))
+        if self.cooldown > 0 and is_mutating(query.data):
+            key = _button_key(query)
+            self._finished.pop(key, None)
+            self._finished[key] = time.monotonic()
+
+guard = CallbackGuard(settings.CALLBACK_DEDUP_SECONDS)
+
+def dedup_callback(callback):
+    """Обертка обработчика callback query: повторные нажатия не доходят до обработчика"""
+
+    @wraps(callback)
+    async def wrapper(update, context, *args, **kwargs):
+        query = update.callback_query
+        if query is None or query.from_user is None:
+            return await callback(update, context, *args, **kwargs)
+
+        reason = guard.acquire(query)
+        if reason is not None:
+            logger.debug(f"Dropped duplicate callback {query.data!r} ({reason})")
+            try:
+                # Убираем индикатор загрузки на кнопке, состояние разговора не меняется
+                await query.answer()
+            except TelegramError:
+                pass
+            return None
+
+        try:
+            return await callback(update, context, *args, **kwargs)
+        finally:
+            guard.release(query)
+
+    return wrapper
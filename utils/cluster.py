@@ -0,0 +1,169 @@
+"""Режим нескольких воркеров: диспетчер получает обновления и раздает их процессам.
+
+Обновления одного пользователя всегда попадают в один и тот же воркер
+(согласованное хеширование по user_id), поэтому порядок его сообщений и
+состояние разговора сохраняются, а разные пользователи обрабатываются
+параллельно на разных ядрах.
+"""
+import asyncio
+import bisect
+import hashlib
+import multiprocessing
+import os
+import signal
+from telegram import Bot, Update
+from telegram.error import NetworkError, TimedOut
+from config import settings
+from utils.logger import logger
+
+WORKER_INDEX_ENV = "BOT_WORKER_INDEX"
+
+# Виртуальных узлов на воркер: равномерное распределение пользователей
+RING_REPLICAS = 100
+# Пауза перед повтором getUpdates после сетевой ошибки
+POLL_RETRY_DELAY = 3.0
+POLL_TIMEOUT = 30
+
+def worker_index() -> int:
+    """Номер текущего воркера (0 - в обычном режиме в одном процессе)"""
+    return int(os.environ.get(WORKER_INDEX_ENV, 0))
+
+def is_primary_worker() -> bool:
+    """Периодические задачи запускаются только в воркере 0"""
+    return worker_index() == 0
+
+class HashRing:
+    """Кольцо согласованного хеширования: при изменении числа воркеров переезжает ~1/N пользователей"""
+
+    def __init__(self, nodes, replicas: int = RING_REPLICAS):
+        self._ring = sorted(
+            (self._hash(f"{node}:{replica}"), node)
+            for node in nodes
+            for replica in range(replicas)
+        )
+        self._keys = [key for key, _ in self._ring]
+
+    @staticmethod
+    def _hash(value) -> int:
+        return int.from_bytes(hashlib.md5(str(value).encode()).digest()[:8], "big")
+
+    def node_for(self, key):
+        index = bisect.bisect(self._keys, self._hash(key)) % len(self._keys)
+        return self._ring[index][1]
+
+def routing_key(update: Update):
+    """Ключ маршрутизации: пользователь, иначе чат, иначе само обновление"""
+    if update.effective_user:
+        return update.effective_user.id
+    if update.effective_chat:
+        return update.effective_chat.id
+    return update.update_id
+
+def run_worker(index: int, updates):
+    """Точка входа процесса-воркера: приложение без Updater, обновления из очереди"""
+    os.environ[WORKER_INDEX_ENV] = str(index)
+    # Останавливается по сигналу диспетчера (None в очереди), а не по Ctrl+C
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    from telegram.ext import Application
+    from database.persistence import PostgresPersistence
+    from main import build_application, configure_application
+    from utils.executors import shutdown_executors
+
+    application = build_application(
+        Application.builder()
+        .token(settings.BOT_TOKEN)
+        .updater(None)
+        .persistence(PostgresPersistence())
+    )
+    configure_application(application)
+    asyncio.run(_serve(application, updates))
+    shutdown_executors()
+    logger.complete()
+
+async def _serve(application, updates):
+    loop = asyncio.get_running_loop()
+    async with application:
+        await application.start()
+        logger.info(f"Worker {worker_index()} started")
+        while True:
+            data = await loop.run_in_executor(None, updates.get)
+            if data is None:
+                break
+            await application.update_queue.put(Update.de_json(data, application.bot))
+        await application.stop()
+    logger.info(f"Worker {worker_index()} stopped")
+
+class Cluster:
+    """Процессы-воркеры и их очереди обновлений"""
+
+    def __init__(self, size: int):
+        self._context = multiprocessing.get_context("spawn")
+        self.queues = [self._context.Queue(settings.WORKER_QUEUE_SIZE) for _ in range(size)]
+        self.processes = [None] * size
+        self.ring = HashRing(range(size))
+
+    def _spawn(self, index: int):
+        process = self._context.Process(
+            target=run_worker, args=(index, self.queues[index]), name=f"bot-worker-{index}"
+        )
+        process.start()
+        self.processes[index] = process
+
+    def start(self):
+        for index in range(len(self.processes)):
+            self._spawn(index)
+
+    def restart_dead(self):
+        """Перезапуск упавших воркеров (их очередь сохраняется)"""
+        for index, process in enumerate(self.processes):
+            if not process.is_alive():
+                logger.error(f"Worker {index} exited with code {process.exitcode}, restarting")
+                self._spawn(index)
+
+    def route(self, update: Update):
+        self.queues[self.ring.node_for(routing_key(update))].put(update.to_dict())
+
+    def stop(self):
+        for queue in self.queues:
+            queue.put(None)
+        for process in self.processes:
+            process.join()
+
+async def _dispatch(cluster: Cluster):
+    """Long polling Telegram и раздача обновлений воркерам"""
+    bot = Bot(settings.BOT_TOKEN)
+    async with bot:
+        offset = None
+        while True:
+            try:
+                updates = await bot.get_updates(
+                    offset=offset, timeout=POLL_TIMEOUT, allowed_updates=Update.ALL_TYPES
+                )
+            except (NetworkError, TimedOut) as e:
+                logger.warning(f"getUpdates failed: {e}")
+                await asyncio.sleep(POLL_RETRY_DELAY)
+                continue
+
+            for update in updates:
+                cluster.route(update)
+                offset = update.update_id + 1
+            cluster.restart_dead()
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+def run_cluster(size: int):
+    """Запуск диспетчера и size процессов-воркеров"""
+    # SIGTERM останавливает воркеры так же, как Ctrl+C: состояние разговоров успевает записаться
+    signal.signal(signal.SIGTERM, _interrupt)
+    cluster = Cluster(size)
+    cluster.start()
+    logger.info(f"Dispatcher started with {size} workers")
+    try:
+        asyncio.run(_dispatch(cluster))
+    except KeyboardInterrupt:
+        logger.info("Stopping workers...")
+    finally:
+        cluster.stop()
+        logger.complete()
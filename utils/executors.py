@@ -0,0 +1,105 @@
+"""Общие пулы для блокирующей работы вне цикла событий.
+
+- run_io: ограниченный пул потоков для блокирующего ввода-вывода (синхронные
+  запросы к БД, файлы, подпроцессы). Контекст (бюджеты запросов, метрики
+  обновления) передается в поток, как в asyncio.to_thread.
+- run_cpu: пул процессов для работы, нагружающей процессор (разбор больших
+  файлов, отчеты). Функция и аргументы должны сериализоваться pickle.
+
+Размеры пулов задаются в настройках; очередь задач, ожидающих свободного
+исполнителя, и время ожидания видны в метриках.
+"""
+import asyncio
+import contextvars
+import functools
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from config import settings
+from utils.metrics import registry
+
+executor_queue_depth = registry.gauge(
+    "sto_executor_queue_depth", "Задачи, ожидающие свободного исполнителя", ("pool",)
+)
+executor_wait = registry.histogram(
+    "sto_executor_wait_seconds", "Время ожидания задачи в очереди пула", ("pool",)
+)
+executor_tasks = registry.counter(
+    "sto_executor_tasks_total", "Задачи, выполненные в пуле", ("pool",)
+)
+
+def _timed_call(submitted: float, func, args, kwargs):
+    """Выполнение задачи с отметкой времени начала (time.time сравнимо между процессами)"""
+    started = time.time()
+    return started - submitted, func(*args, **kwargs)
+
+class _Pool:
+    """Пул исполнителей с учетом задач в очереди"""
+
+    def __init__(self, name: str, factory, workers: int):
+        self.name = name
+        self.workers = workers
+        self._factory = factory
+        self._executor = None
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # Пулы создаются при первой задаче: процессы не стартуют, если они не нужны
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._factory(self.workers)
+            return self._executor
+
+    def _track(self, delta: int):
+        with self._lock:
+            self._in_flight += delta
+            queued = max(0, self._in_flight - self.workers)
+        executor_queue_depth.set(queued, (self.name,))
+
+    async def run(self, func, args, kwargs, context=None):
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        task = functools.partial(_timed_call, time.time(), func, args, kwargs)
+        if context is not None:
+            task = functools.partial(context.run, task)
+        self._track(1)
+        try:
+            wait, result = await loop.run_in_executor(executor, task)
+        finally:
+            self._track(-1)
+        executor_wait.observe(max(0.0, wait), (self.name,))
+        executor_tasks.inc((self.name,))
+        return result
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+_io_pool = _Pool(
+    "io",
+    lambda workers: ThreadPoolExecutor(max_workers=workers, thread_name_prefix="io"),
+    settings.IO_EXECUTOR_WORKERS
+)
+_cpu_pool = _Pool(
+    "cpu",
+    lambda workers: ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")),
+    settings.CPU_EXECUTOR_WORKERS
+)
+
+async def run_io(func, *args, **kwargs):
+    """Блокирующий вызов в пуле потоков"""
+    return await _io_pool.run(func, args, kwargs, contextvars.copy_context())
+
+async def run_cpu(func, *args, **kwargs):
+    """Вычисления в пуле процессов"""
+    return await _cpu_pool.run(func, args, kwargs)
+
+def shutdown_executors():
+    """Остановка пулов (при завершении процесса бота)"""
+    _io_pool.shutdown()
+    _cpu_pool.shutdown()
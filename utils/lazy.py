@@ -0,0 +1,19 @@
+import importlib
+
+def lazy_callback(path: str):
+    """Обработчик, который импортирует свой модуль только при первом вызове.
+
+    path - полный путь к функции, например "handlers.admin.agent_info".
+    """
+    module_name, name = path.rsplit(".", 1)
+    target = None
+
+    async def callback(*args, **kwargs):
+        nonlocal target
+        if target is None:
+            target = getattr(importlib.import_module(module_name), name)
+        return await target(*args, **kwargs)
+
+    callback.__name__ = name
+    callback.__qualname__ = name
+    return callback
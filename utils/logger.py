@@ -1,4 +1,7 @@
+import json
+import random
 import sys
+from functools import wraps
 from loguru import logger
 from pathlib import Path
 from config import settings
@@ -7,22 +10,68 @@ from config import settings
 log_path = Path(settings.LOG_FILE)
 log_path.parent.mkdir(parents=True, exist_ok=True)
 
+# Поля контекста обновления, которые попадают в каждую запись
+CONTEXT_FIELDS = ("update_id", "user_id", "handler")
+
+def _json_format(record):
+    """Формат JSON-записи: одна строка на запись с контекстом обновления"""
+    payload = {
+        "time": record["time"].isoformat(),
+        "level": record["level"].name,
+        "message": record["message"],
+        "module": record["name"],
+        "function": record["function"],
+        "line": record["line"],
+    }
+    payload.update({key: value for key, value in record["extra"].items() if not key.startswith("_")})
+    if record["exception"] is not None:
+        payload["exception"] = repr(record["exception"].value)
+    record["extra"]["_json"] = json.dumps(payload, ensure_ascii=False, default=str)
+    return "{extra[_json]}\n"
+
 # Настраиваем логирование
 logger.remove()  # Удаляем стандартный обработчик
+logger.configure(extra={field: None for field in CONTEXT_FIELDS})
 
-# Добавляем обработчик для консоли
+# Добавляем обработчик для консоли (запись идет из фонового потока, enqueue=True)
 logger.add(
     sys.stderr,
-    format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
-    level=settings.LOG_LEVEL
+    format=_json_format if settings.LOG_JSON else "<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
+    level=settings.LOG_LEVEL,
+    enqueue=True
 )
 
-# Добавляем обработчик для файла
+# Добавляем обработчик для файла (JSON, по одной записи в строке)
 logger.add(
     settings.LOG_FILE,
     rotation="300 MB",
     retention="10 days",
     compression="zip",
-    format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}",
-    level="INFO"
-) 
\ No newline at end of file
+    format=_json_format,
+    level="INFO",
+    enqueue=True
+)
+
+# Дешевая проверка перед формированием отладочных сообщений
+DEBUG_ENABLED = logger.level(settings.LOG_LEVEL.upper()).no <= logger.level("DEBUG").no
+
+def sampled(rate: float = None) -> bool:
+    """Нужно ли писать сэмплируемую отладочную запись"""
+    rate = settings.LOG_DEBUG_SAMPLE_RATE if rate is None else rate
+    return rate >= 1 or random.random() < rate
+
+def log_context(callback):
+    """Обертка обработчика: update_id, user_id и имя обработчика в каждой записи лога"""
+    name = getattr(callback, "__name__", type(callback).__name__)
+
+    @wraps(callback)
+    async def wrapper(update, context, *args, **kwargs):
+        user = getattr(update, "effective_user", None)
+        with logger.contextualize(
+            update_id=getattr(update, "update_id", None),
+            user_id=user.id if user else None,
+            handler=name
+        ):
+            return await callback(update, context, *args, **kwargs)
+
+    return wrapper
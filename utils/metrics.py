@@ -0,0 +1,258 @@
+"""Метрики обработчиков и запросов к БД в формате Prometheus"""
+import threading
+import time
+from contextvars import ContextVar
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from sqlalchemy import event
+from telegram.ext import ConversationHandler
+
+from utils.logger import logger
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    """Счетчик с метками"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+class Gauge(Counter):
+    """Показатель, который может уменьшаться"""
+
+    def set(self, value, labels=()):
+        with self._lock:
+            self._values[labels] = value
+
+    def dec(self, labels=(), amount=1):
+        self.inc(labels, -amount)
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+class Histogram:
+    """Гистограмма с фиксированными границами корзин"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, labels=()):
+        with self._lock:
+            counts, total = self._values.get(labels, (None, 0.0))
+            if counts is None:
+                counts = [0] * (len(self.buckets) + 1)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self._values[labels] = (counts, total + value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(float(bound))
+                    bucket_labels = _format_labels(self.labelnames, labels, 'le="' + le + '"')
+                    lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    """Набор метрик процесса"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+HANDLER_LABELS = ("handler", "callback")
+
+handler_latency = registry.histogram(
+    "sto_handler_latency_seconds", "Время обработки обновления", HANDLER_LABELS
+)
+handler_errors = registry.counter(
+    "sto_handler_errors_total", "Количество ошибок в обработчиках", HANDLER_LABELS
+)
+update_db_queries = registry.histogram(
+    "sto_update_db_queries", "Количество запросов к БД на одно обновление", HANDLER_LABELS, QUERY_COUNT_BUCKETS
+)
+update_db_time = registry.histogram(
+    "sto_update_db_seconds", "Время запросов к БД на одно обновление", HANDLER_LABELS
+)
+db_queries_total = registry.counter(
+    "sto_db_queries_total", "Всего запросов к БД"
+)
+
+class UpdateStats:
+    """Статистика запросов к БД в рамках одного обновления"""
+    __slots__ = ("queries", "db_time")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+
+# Статистика текущего обновления (устанавливается оберткой обработчика)
+current_update_stats: ContextVar = ContextVar("current_update_stats", default=None)
+
+def callback_prefix(update):
+    """Префикс callback_data без числовых параметров (agent_archive_5_page_2 -> agent_archive)"""
+    query = getattr(update, "callback_query", None)
+    if not query or not query.data:
+        return ""
+    parts = []
+    for part in query.data.split("_"):
+        if part[:1].isdigit():
+            break
+        parts.append(part)
+    return "_".join(parts)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    db_queries_total.inc()
+    stats = current_update_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += elapsed
+
+def _handle_error(exception_context):
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_started"):
+        connection.info["query_started"].pop()
+
+def instrument_engine(engine):
+    """Подписка на события SQLAlchemy для подсчета запросов и времени БД"""
+    if engine is None or event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+def instrument_callback(callback):
+    """Обертка обработчика: задержка, ошибки и запросы к БД на обновление"""
+    name = getattr(callback, "__name__", type(callback).__name__)
+
+    @wraps(callback)
+    async def wrapper(update, context, *args, **kwargs):
+        labels = (name, callback_prefix(update))
+        stats = UpdateStats()
+        token = current_update_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            return await callback(update, context, *args, **kwargs)
+        except Exception:
+            handler_errors.inc(labels)
+            raise
+        finally:
+            handler_latency.observe(time.perf_counter() - started, labels)
+            update_db_queries.observe(stats.queries, labels)
+            update_db_time.observe(stats.db_time, labels)
+            current_update_stats.reset(token)
+
+    return wrapper
+
+def iter_handlers(handlers):
+    """Обход обработчиков, включая вложенные в ConversationHandler"""
+    for handler in handlers:
+        if isinstance(handler, ConversationHandler):
+            yield from iter_handlers(handler.entry_points)
+            for state_handlers in handler.states.values():
+                yield from iter_handlers(state_handlers)
+            yield from iter_handlers(handler.fallbacks)
+        else:
+            yield handler
+
+def wrap_callbacks(application, decorator, handler_types=None):
+    """Применение декоратора к callback всех обработчиков приложения"""
+    seen = set()
+    for group_handlers in application.handlers.values():
+        for handler in iter_handlers(group_handlers):
+            if id(handler) in seen or getattr(handler, "callback", None) is None:
+                continue
+            if handler_types and not isinstance(handler, handler_types):
+                continue
+            seen.add(id(handler))
+            handler.callback = decorator(handler.callback)
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(host: str, port: int):
+    """Запуск HTTP-эндпоинта /metrics в фоновом потоке"""
+    server = ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True)
+    thread.start()
+    logger.info(f"Metrics endpoint started on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,111 @@
+"""Рассылка событий между процессами бота через PostgreSQL LISTEN/NOTIFY"""
+import select
+import threading
+from collections import defaultdict
+from sqlalchemy import text
+from database.database import engine
+from utils.logger import logger
+
+# Пауза перед переподключением слушателя после ошибки
+RECONNECT_DELAY = 5.0
+# Как часто слушатель проверяет новые подписки и флаг остановки
+POLL_SECONDS = 1.0
+
+_subscribers = defaultdict(list)
+_subscribers_lock = threading.Lock()
+_listener = None
+
+def subscribe(channel: str, callback):
+    """Подписка на канал: callback(payload) вызывается в потоке слушателя.
+
+    После переподключения к БД callback вызывается с payload=None:
+    уведомления за время разрыва потеряны, кэш нужно перечитать целиком.
+    """
+    with _subscribers_lock:
+        _subscribers[channel].append(callback)
+
+def notify(channel: str, payload: str = "", connection=None):
+    """Отправка уведомления всем процессам.
+
+    Если передано соединение, уведомление уйдет вместе с коммитом его транзакции.
+    """
+    statement = text("SELECT pg_notify(:channel, :payload)")
+    params = {"channel": channel, "payload": payload}
+    if connection is not None:
+        connection.execute(statement, params)
+        return
+    with engine.begin() as own_connection:
+        own_connection.execute(statement, params)
+
+class _Listener(threading.Thread):
+    """Фоновый поток с отдельным соединением, выполняющим LISTEN"""
+
+    def __init__(self):
+        super().__init__(name="pg-listener", daemon=True)
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        reconnect = False
+        while not self._stopped.is_set():
+            try:
+                self._listen(reconnect)
+            except Exception as e:
+                logger.error(f"Notification listener error: {e}")
+                self._stopped.wait(RECONNECT_DELAY)
+            reconnect = True
+
+    def _connect(self):
+        cargs, cparams = engine.dialect.create_connect_args(engine.url)
+        connection = engine.dialect.dbapi.connect(*cargs, **cparams)
+        connection.autocommit = True
+        return connection
+
+    def _listen(self, reconnect: bool):
+        connection = self._connect()
+        listening = set()
+        try:
+            cursor = connection.cursor()
+            while not self._stopped.is_set():
+                with _subscribers_lock:
+                    channels = set(_subscribers) - listening
+                for channel in channels:
+                    cursor.execute(f'LISTEN "{channel}"')
+                    listening.add(channel)
+                    if reconnect:
+                        self._dispatch(channel, None)
+
+                if select.select([connection], [], [], POLL_SECONDS) == ([], [], []):
+                    continue
+                connection.poll()
+                while connection.notifies:
+                    notification = connection.notifies.pop(0)
+                    self._dispatch(notification.channel, notification.payload)
+        finally:
+            connection.close()
+
+    def _dispatch(self, channel: str, payload):
+        with _subscribers_lock:
+            callbacks = list(_subscribers.get(channel, ()))
+        for callback in callbacks:
+            try:
+                callback(payload)
+            except Exception as e:
+                logger.error(f"Error handling notification on {channel}: {e}")
+
+def start_listener():
+    """Запуск слушателя уведомлений (один на процесс)"""
+    global _listener
+    if _listener is None:
+        _listener = _Listener()
+        _listener.start()
+        logger.info("Notification listener started")
+    return _listener
+
+def stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,112 @@
+"""Отладочный детектор N+1 и бюджетов запросов к БД.
+
+Включается настройкой QUERY_DEBUG. Считает SQL-запросы в рамках обновления,
+отмечает повторяющиеся одинаковые запросы (признак N+1) и проверяет бюджеты,
+объявленные декоратором @query_budget. При QUERY_BUDGET_STRICT превышение бюджета
+выбрасывает QueryBudgetExceeded, поэтому тесты падают до деплоя.
+"""
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from sqlalchemy import event
+
+from config import settings
+from utils.logger import logger
+
+class QueryBudgetExceeded(AssertionError):
+    """Обработчик выполнил больше запросов, чем объявлено в его бюджете"""
+
+class QueryTracker:
+    """Счетчик запросов для одного обновления или блока кода"""
+
+    def __init__(self, label: str, budget: int = None):
+        self.label = label
+        self.budget = budget
+        self.statements = Counter()
+
+    @property
+    def count(self):
+        return sum(self.statements.values())
+
+    def repeated(self, threshold: int = None):
+        """Одинаковые запросы, выполненные не меньше threshold раз"""
+        threshold = threshold or settings.QUERY_REPEAT_THRESHOLD
+        return [(statement, n) for statement, n in self.statements.most_common() if n >= threshold]
+
+    def check(self, strict: bool = None):
+        """Проверка бюджета и поиск повторяющихся запросов"""
+        strict = settings.QUERY_BUDGET_STRICT if strict is None else strict
+
+        for statement, n in self.repeated():
+            logger.warning(f"Possible N+1 in {self.label}: statement executed {n} times: {' '.join(statement.split())[:200]}")
+
+        if self.budget is not None and self.count > self.budget:
+            message = f"{self.label} executed {self.count} queries, budget is {self.budget}"
+            if strict:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        else:
+            logger.debug(f"{self.label} executed {self.count} queries")
+
+# Активные счетчики (вложенные обработчики считаются и во внешнем счетчике)
+_active_trackers: ContextVar = ContextVar("active_query_trackers", default=())
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    for tracker in _active_trackers.get():
+        tracker.statements[statement] += 1
+
+def install(*engines):
+    """Подписка детектора на события движков SQLAlchemy"""
+    if not engines:
+        from database.database import engine, replica_engine
+        engines = (engine, replica_engine)
+    for bound in engines:
+        if bound is not None and not event.contains(bound, "before_cursor_execute", _before_cursor_execute):
+            event.listen(bound, "before_cursor_execute", _before_cursor_execute)
+
+@contextmanager
+def track_queries(label: str, budget: int = None, strict: bool = None, engines=()):
+    """Подсчет запросов внутри блока с проверкой бюджета на выходе.
+
+    engines - движки для подсчета (по умолчанию основной и реплика бота).
+    """
+    install(*engines)
+    tracker = QueryTracker(label, budget)
+    token = _active_trackers.set(_active_trackers.get() + (tracker,))
+    try:
+        yield tracker
+    finally:
+        _active_trackers.reset(token)
+    tracker.check(strict)
+
+def assert_max_queries(max_queries: int, label: str = "block", engines=()):
+    """Для тестов: блок должен уложиться в max_queries запросов"""
+    return track_queries(label, max_queries, strict=True, engines=engines)
+
+def query_budget(max_queries: int):
+    """Объявление бюджета запросов обработчика (проверяется только при QUERY_DEBUG)"""
+    def decorator(func):
+        func.query_budget = max_queries
+        if not settings.QUERY_DEBUG:
+            return func
+
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            with track_queries(func.__name__, max_queries):
+                return await func(*args, **kwargs)
+
+        return wrapper
+    return decorator
+
+def track_update(callback):
+    """Обертка обработчика: подсчет запросов на каждое обновление без бюджета"""
+    name = getattr(callback, "__name__", type(callback).__name__)
+
+    @wraps(callback)
+    async def wrapper(update, context, *args, **kwargs):
+        with track_queries(f"update {update.update_id} ({name})"):
+            return await callback(update, context, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,54 @@
+"""Ответы на нажатия кнопок с меньшим числом последовательных обращений к Bot API"""
+import asyncio
+from telegram.error import BadRequest, TelegramError
+from utils.executors import run_io
+from utils.logger import logger
+
+async def _answer(query):
+    try:
+        await query.answer()
+    except TelegramError as e:
+        # Индикатор загрузки на кнопке погаснет сам, экран все равно будет показан
+        logger.debug(f"Failed to answer callback query: {e}")
+
+async def answer_while(query, work, *args, **kwargs):
+    """Выполнение синхронной работы с БД в пуле потоков параллельно с query.answer().
+
+    Возвращает результат work(*args, **kwargs). Без callback query (команда
+    или сообщение) просто выполняет работу в потоке.
+    """
+    result = run_io(work, *args, **kwargs)
+    if query is None:
+        return await result
+    _, value = await asyncio.gather(_answer(query), result)
+    return value
+
+async def edit_if_changed(query, text: str, reply_markup=None, **kwargs):
+    """edit_message_text, только если текст или клавиатура изменились.
+
+    Повторное нажатие той же кнопки не тратит запрос к Telegram, который
+    закончился бы ошибкой "message is not modified". Возвращает True, если
+    сообщение было изменено.
+    """
+    message = query.message
+    # Telegram хранит текст без разметки и без пробелов по краям
+    if (
+        message is not None and "parse_mode" not in kwargs
+        and message.text == text.strip() and message.reply_markup == reply_markup
+    ):
+        return False
+
+    try:
+        await query.edit_message_text(text, reply_markup=reply_markup, **kwargs)
+    except BadRequest as e:
+        if "message is not modified" not in str(e).lower():
+            raise
+        return False
+    return True
+
+async def show_screen(update, text: str, reply_markup=None, **kwargs):
+    """Показ экрана: правка сообщения с кнопкой или новое сообщение в ответ на команду"""
+    if update.callback_query:
+        return await edit_if_changed(update.callback_query, text, reply_markup, **kwargs)
+    await update.message.reply_text(text, reply_markup=reply_markup, **kwargs)
+    return True
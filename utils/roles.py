@@ -1,3 +1,4 @@
+from contextvars import ContextVar
 from functools import wraps
 from telegram import Update
 from telegram.ext import ContextTypes
@@ -6,10 +7,18 @@ from sqlalchemy.orm import Session
 from database.database import get_db
 from utils.logger import logger
 
+# Роль, уже проверенная декоратором в рамках текущего обновления: (telegram_id, role)
+_verified_role: ContextVar = ContextVar("verified_role", default=None)
+
 async def get_user_role(telegram_id: int, db: Session = None):
     """Получение роли пользователя по telegram_id"""
     from handlers.user_handler import get_agent_by_telegram_id
     
+    # Не повторяем запрос, если роль уже получена декоратором выше по стеку
+    verified = _verified_role.get()
+    if verified and verified[0] == telegram_id:
+        return verified[1]
+    
     close_db = False
     if db is None:
         db = next(get_db())
@@ -29,19 +38,19 @@ def admin_required(func):
     @wraps(func)
     async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
         user_id = update.effective_user.id
-        db = next(get_db())
         
-        try:
-            role = await get_user_role(user_id, db)
-            
-            if role == UserRole.ADMIN:
+        role = await get_user_role(user_id)
+        
+        if role == UserRole.ADMIN:
+            token = _verified_role.set((user_id, role))
+            try:
                 return await func(update, context, *args, **kwargs)
-            else:
-                logger.warning(f"Access denied: user {user_id} tried to access admin function")
-                await update.message.reply_text("У вас нет доступа к этой функции.")
-                return None
-        finally:
-            db.close()
+            finally:
+                _verified_role.reset(token)
+        else:
+            logger.warning(f"Access denied: user {user_id} tried to access admin function")
+            await update.message.reply_text("У вас нет доступа к этой функции.")
+            return None
     
     return wrapper
 
@@ -50,20 +59,20 @@ def registered_required(func):
     @wraps(func)
     async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
         user_id = update.effective_user.id
-        db = next(get_db())
         
-        try:
-            role = await get_user_role(user_id, db)
-            
-            if role:
+        role = await get_user_role(user_id)
+        
+        if role:
+            token = _verified_role.set((user_id, role))
+            try:
                 return await func(update, context, *args, **kwargs)
-            else:
-                logger.warning(f"Access denied: user {user_id} is not registered")
-                await update.message.reply_text(
-                    "Вы не зарегистрированы. Используйте команду /register для регистрации."
-                )
-                return None
-        finally:
-            db.close()
+            finally:
+                _verified_role.reset(token)
+        else:
+            logger.warning(f"Access denied: user {user_id} is not registered")
+            await update.message.reply_text(
+                "Вы не зарегистрированы. Используйте команду /register для регистрации."
+            )
+            return None
     
-    return wrapper 
\ No newline at end of file
+    return wrapper